@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+arithmetic_task.py: Datetime arithmetic tasks, e.g add.day.37, subtract.hour.5, add.month.3, add.business_day.10
+
+A task name is parsed once into an ArithmeticTask, which is then applied to each datetime (apply) or to a NumPy array
+of datetime64 in bulk (apply_many), without dispatching on the task name for each row.
+
+UNITS
+- second, minute, hour, day, week: fixed durations
+- month, year: calendar months and years; the day is clamped to the end of the month, e.g 2023-01-31 + 1 month = 2023-02-28
+- business_day: Monday to Friday (NumPy busday_offset); a datetime on a weekend first rolls to the previous business day
+    when adding (Saturday + 1 = Monday) and to the next business day when subtracting (Saturday - 1 = Friday)
+
+NOTES
+- the time of the day (and the timezone) is kept for the calendar units
+- apply() raises OverflowError if the result is outside [datetime.min; datetime.max], as datetime arithmetic does;
+    apply_many() does not check
+
+USAGE
+    task = ArithmeticTask.parse("add.day.37")
+
+    output_dt = task.apply(input_dt)
+    output_values = task.apply_many(input_values)     # datetime64
+
+"""
+
+# system
+from calendar import monthrange
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, NamedTuple, Optional
+
+# 3rd party
+import numpy as np
+
+
+OPERATIONS = ("add", "subtract")
+
+# fixed durations: unit -> (timedelta keyword, NumPy timedelta64 unit)
+FIXED_UNITS = {
+    "second" : ("seconds", "s")
+    , "minute" : ("minutes", "m")
+    , "hour" : ("hours", "h")
+    , "day" : ("days", "D")
+    , "week" : ("weeks", "W")
+}
+
+# calendar units: unit -> number of months
+CALENDAR_UNITS = {
+    "month" : 1
+    , "year" : 12
+}
+
+BUSINESS_DAY_UNIT = "business_day"
+
+UNITS = tuple(FIXED_UNITS) + tuple(CALENDAR_UNITS) + (BUSINESS_DAY_UNIT,)
+
+# units whose result only depends on the date (the time of the day is kept)
+DATE_UNITS = ("day", "week") + tuple(CALENDAR_UNITS) + (BUSINESS_DAY_UNIT,)
+
+
+def add_months(dt : datetime, months : int) -> datetime:
+    """
+    add_months: add calendar months to a datetime; the day is clamped to the end of the month
+    """
+    year, month = divmod(dt.year * 12 + dt.month - 1 + months, 12)
+
+    if not 1 <= year <= 9999:
+        raise OverflowError("date value out of range")
+
+    return dt.replace(year=year, month=month + 1, day=min(dt.day, monthrange(year, month + 1)[1]))
+
+
+def add_months_many(values : np.ndarray, months : int) -> np.ndarray:
+    """
+    add_months_many: add calendar months to an array of datetime64[us]; the day is clamped to the end of the month
+    """
+    days = values.astype("datetime64[D]")
+    first_days = values.astype("datetime64[M]")
+
+    shifted_months = first_days + np.timedelta64(months, "M")
+    days_in_month = (shifted_months + np.timedelta64(1, "M")).astype("datetime64[D]") - shifted_months.astype("datetime64[D]")
+
+    day_of_month = np.minimum(days - first_days.astype("datetime64[D]"), days_in_month - np.timedelta64(1, "D"))
+
+    return shifted_months.astype("datetime64[D]") + day_of_month + (values - days)
+
+
+def business_day_roll(business_days : int) -> str:
+    """
+    business_day_roll: how NumPy busday_offset rolls a date on a weekend; see the module notes
+    """
+    return "backward" if business_days > 0 else "forward"
+
+
+class ArithmeticTask(NamedTuple):
+
+    """
+    ArithmeticTask: a parsed task, e.g add.day.37 => ArithmeticTask("add", "day", 37)
+    """
+
+    operation : str
+    unit : str
+    amount : int
+
+    @classmethod
+    def parse(cls, task : str) -> "ArithmeticTask":
+        """
+        parse: parse a task name, e.g add.day.37, subtract.business_day.2
+
+        :return: an ArithmeticTask; raises ValueError if the task is not an arithmetic task
+        """
+        parts = task.split(".")
+
+        if len(parts) != 3 or parts[0] not in OPERATIONS or parts[1] not in UNITS or not parts[2].isdigit():
+            raise ValueError(f"Unknown arithmetic task '{task}'; expected <{'|'.join(OPERATIONS)}>.<{'|'.join(UNITS)}>.<amount>, e.g add.day.1")
+
+        return cls(parts[0], parts[1], int(parts[2]))
+
+    def __str__(self) -> str:
+        return f"{self.operation}.{self.unit}.{self.amount}"
+
+    @property
+    def signed_amount(self) -> int:
+        """
+        signed_amount: the amount, negative to subtract
+        """
+        return self.amount if self.operation == "add" else -self.amount
+
+    @property
+    def is_date_shift(self) -> bool:
+        """
+        is_date_shift: True if the date of the result only depends on the date of the input, e.g add.day.1, but not add.hour.1
+        """
+        return self.unit in DATE_UNITS
+
+    def apply(self, dt : datetime) -> datetime:
+        """
+        apply: apply the task to a datetime
+
+        :return: a datetime, with the same timezone as dt
+        """
+        amount = self.signed_amount
+
+        if self.unit in FIXED_UNITS:
+            return dt + timedelta(**{ FIXED_UNITS[self.unit][0] : amount })
+
+        if self.unit in CALENDAR_UNITS:
+            return add_months(dt, amount * CALENDAR_UNITS[self.unit])
+
+        # business days
+        day = np.busday_offset(np.datetime64(dt.date(), "D"), amount, roll=business_day_roll(amount)).item()
+        if not isinstance(day, date):
+            raise OverflowError("date value out of range")
+
+        return dt.replace(year=day.year, month=day.month, day=day.day)
+
+    def apply_many(self, values : np.ndarray) -> np.ndarray:
+        """
+        apply_many: apply the task to an array of datetimes in bulk
+
+        :param values: NumPy array of datetime64, e.g from random_utc_datetimes()
+
+        :return: NumPy array of datetime64[us]
+        """
+        values = np.asarray(values).astype("datetime64[us]")
+        amount = self.signed_amount
+
+        if self.unit in FIXED_UNITS:
+            return values + np.timedelta64(amount, FIXED_UNITS[self.unit][1])
+
+        if self.unit in CALENDAR_UNITS:
+            return add_months_many(values, amount * CALENDAR_UNITS[self.unit])
+
+        # business days
+        days = values.astype("datetime64[D]")
+
+        return np.busday_offset(days, amount, roll=business_day_roll(amount)).astype("datetime64[us]") + (values - days)
+
+    def date_shift(self) -> Callable[[np.ndarray], np.ndarray]:
+        """
+        date_shift: the task as a function on dates (array of datetime64[D] -> array of datetime64[D]); see is_date_shift
+        """
+        if not self.is_date_shift:
+            raise ValueError(f"{self} is not a date shift: the resulting date also depends on the time of the day")
+
+        return lambda dates : self.apply_many(dates).astype("datetime64[D]")
+
+
+# parsed tasks, by name
+_tasks : Dict[str, ArithmeticTask] = {}
+
+def parse_task(task : str) -> Optional[ArithmeticTask]:
+    """
+    parse_task: parse a task name once; tasks that are not arithmetic tasks (e.g model) return None
+    """
+    if task not in _tasks:
+        try:
+            _tasks[task] = ArithmeticTask.parse(task)
+        except ValueError:
+            _tasks[task] = None
+
+    return _tasks[task]
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark_formatter.py: Differential speed benchmark of the rendering and normalisation paths
+
+Each benchmark runs an optimised path and its reference path on the same inputs, reports rows/sec and memory,
+and compares the outputs byte for byte; a performance change is accepted only if the outputs are unchanged.
+
+BENCHMARKS
+- apply: CustomFormatter.apply() vs CustomFormatter(fast_paths=False).apply()
+- normalise_string: NormaliseString.normalise_string() vs normalise_string_reference()
+- verify_null_components: generate16.23 Generate.verify_null_components() with both formatters
+- generate.<output>.<locale_schema>: end-to-end generate16.23 Generate.generate() vs the same with CustomFormatter(fast_paths=False)
+    - with --reference_rendering, the reference also renders each format spec again (single_pass_rendering=False)
+    NOTE: the reference rendering raises UnhandledFormat for formats that Babel cannot render (e.g {v} in some locales of
+    babel.all), instead of skipping them; use it with locale schemas such as mini.10
+
+NOTES
+- the inputs (format specs, datetimes, locales) are drawn from generate16.23 with a fixed seed
+- each path first runs once on the inputs without being measured, so that both are timed warm: Babel locale data,
+    parsed patterns, locale tables and caches are loaded on first use, and would be charged to whichever path runs first
+- speed and memory are measured in separate runs: tracemalloc slows down the code it traces
+    - seconds, rows/sec: best of --repeat runs, without tracemalloc
+    - peak_kib: peak of the memory allocated during the first --memory_rows rows (tracemalloc)
+- a mismatch raises RuntimeError after the report, so that the script can gate a change
+
+USAGE
+    python3 benchmark_formatter.py --num_rows 2000 --outputs iso8601 format_spec timezone --locale_schemas mini.10 babel.all
+
+    # json report
+    python3 benchmark_formatter.py --output_file benchmark_formatter.json
+
+"""
+
+# system
+import json
+import tracemalloc
+from time import perf_counter
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+# locals
+from custom_formatter import CustomFormatter
+from normalise_string import NormaliseString
+from dates.datetime.generate16_23 import Generate
+
+
+class Measurement(NamedTuple):
+
+    """
+    Measurement: speed and memory of one path of a benchmark
+    """
+
+    benchmark : str             # e.g apply
+    variant : str               # optimised or reference
+    rows : int
+    seconds : float
+    rows_per_second : float
+    peak_kib : float            # peak memory allocated during the first memory_rows rows
+
+
+class Comparison(NamedTuple):
+
+    """
+    Comparison: byte for byte comparison of the outputs of the optimised and reference paths
+    """
+
+    benchmark : str
+    rows : int
+    mismatches : int
+    first_mismatch : Optional[str]  # e.g "row 12: '07-apr-2007' != '07-avr.-2007'"
+
+
+def measure(benchmark : str, variant : str, function : Callable[[Any], Any], inputs : Sequence[Any], memory_rows : int = 1000, repeat : int = 3) -> (Measurement, List[Any]):
+    """
+    measure: run a function on each input, once to warm up, then timed (best of repeat runs);
+    then measure the memory allocated on the first memory_rows inputs
+
+    :return: 2-tuple
+        1. Measurement
+        2. list of outputs, in the same order as inputs
+    """
+    for value in inputs:
+        function(value)
+
+    seconds = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        outputs = [function(value) for value in inputs]
+        seconds = min(seconds, perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        for value in inputs[:memory_rows]:
+            function(value)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Measurement(benchmark, variant, len(inputs), seconds, len(inputs) / seconds if seconds > 0 else float("inf"), peak / 1024), outputs
+
+
+def compare(benchmark : str, outputs : Sequence[Any], reference_outputs : Sequence[Any]) -> Comparison:
+    """
+    compare: compare the outputs of the optimised and reference paths, as strings (repr)
+    """
+    mismatches = 0
+    first_mismatch = None
+
+    for idx, (output, reference_output) in enumerate(zip(outputs, reference_outputs)):
+        if repr(output) != repr(reference_output):
+            mismatches += 1
+            if first_mismatch is None:
+                first_mismatch = f"row {idx}: {output!r} != {reference_output!r}"
+
+    if len(outputs) != len(reference_outputs):
+        mismatches += abs(len(outputs) - len(reference_outputs))
+        first_mismatch = first_mismatch or f"{len(outputs)} rows != {len(reference_outputs)} rows"
+
+    return Comparison(benchmark, max(len(outputs), len(reference_outputs)), mismatches, first_mismatch)
+
+
+def call_or_error(function : Callable[[], Any]) -> Any:
+    """
+    call_or_error: the result of function(), or the type and message of the exception it raises
+        NOTE: the reference and optimised paths must also raise the same errors
+    """
+    try:
+        return function()
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+
+
+class FormatterBenchmark:
+
+    """
+    FormatterBenchmark: the benchmarks of the module notes, on inputs drawn from generate16.23
+    """
+
+    def __init__(self, num_rows : int = 2000, seed : int = 42, memory_rows : int = 1000, normalise_cache_size : int = 10000, reference_rendering : bool = False, repeat : int = 3):
+        """
+        :param num_rows: number of rows of each benchmark
+
+        :param seed: seed of the inputs and of the generators
+
+        :param memory_rows: number of rows traced with tracemalloc
+
+        :param normalise_cache_size: normalisation cache of the optimised path; see CustomFormatter
+
+        :param reference_rendering: if True, the reference path of the end-to-end benchmarks uses single_pass_rendering=False
+
+        :param repeat: number of timed runs; the best one is reported
+        """
+        self.num_rows = num_rows
+        self.seed = seed
+        self.memory_rows = memory_rows
+        self.normalise_cache_size = normalise_cache_size
+        self.reference_rendering = reference_rendering
+        self.repeat = repeat
+
+        self.measurements : List[Measurement] = []
+        self.comparisons : List[Comparison] = []
+
+    def optimised_generator(self) -> Generate:
+        generator = Generate()
+        generator.custom_formatter = CustomFormatter(normalise_cache_size=self.normalise_cache_size)
+        return generator
+
+    def reference_generator(self) -> Generate:
+        generator = Generate()
+        generator.custom_formatter = CustomFormatter(fast_paths=False)
+        return generator
+
+    def run_pair(self, benchmark : str, function : Callable[[Any], Any], reference_function : Callable[[Any], Any], inputs : Sequence[Any]):
+        """
+        run_pair: measure the optimised and reference paths of a benchmark, and compare their outputs
+        """
+        measurement, outputs = measure(benchmark, "optimised", function, inputs, memory_rows=self.memory_rows, repeat=self.repeat)
+        reference_measurement, reference_outputs = measure(benchmark, "reference", reference_function, inputs, memory_rows=self.memory_rows, repeat=self.repeat)
+
+        self.measurements += [measurement, reference_measurement]
+        self.comparisons.append(compare(benchmark, outputs, reference_outputs))
+
+    def sample_inputs(self, locale_schema : str) -> List[tuple]:
+        """
+        sample_inputs: (format spec, datetime, locale) of num_rows observations of generate16.23
+        """
+        return [ (training_pair.output, dt, training_pair.locale)
+                for training_pair, dt in self.reference_generator().generate("format_spec", self.num_rows, locale_schema=locale_schema, seed=self.seed) ]
+
+    def run_components(self, locale_schema : str = "babel.all"):
+        """
+        run_components: the apply, normalise_string and verify_null_components benchmarks
+        """
+        inputs = self.sample_inputs(locale_schema)
+
+        # apply
+        formatter = CustomFormatter(normalise_cache_size=self.normalise_cache_size)
+        reference_formatter = CustomFormatter(fast_paths=False)
+
+        self.run_pair("apply"
+                    , lambda row : call_or_error(lambda : formatter.apply(row[0], row[1], locale=row[2]))
+                    , lambda row : call_or_error(lambda : reference_formatter.apply(row[0], row[1], locale=row[2]))
+                    , inputs
+                    )
+
+        # normalise_string, on the strings rendered by Babel before normalisation
+        # NOTE: without cache: the inputs are whole strings, normalised once each (see CustomFormatter.normalise_cache_size)
+        strings = [ call_or_error(lambda : reference_formatter.apply(format_spec, dt, locale=locale, normalise=False)) for format_spec, dt, locale in inputs ]
+        normalise_string = NormaliseString()
+
+        self.run_pair("normalise_string"
+                    , normalise_string.normalise_string
+                    , normalise_string.normalise_string_reference
+                    , strings
+                    )
+
+        # verify_null_components
+        generator = self.optimised_generator()
+        reference_generator = self.reference_generator()
+
+        self.run_pair("verify_null_components"
+                    , lambda row : call_or_error(lambda : generator.verify_null_components(row[0], row[1], row[2]))
+                    , lambda row : call_or_error(lambda : reference_generator.verify_null_components(row[0], row[1], row[2]))
+                    , inputs
+                    )
+
+    def run_generate(self, output : str, locale_schema : str):
+        """
+        run_generate: end-to-end generate16.23, optimised vs reference; the whole run is one row per observation
+        """
+        benchmark = f"generate.{output}.{locale_schema}"
+
+        runs = { "optimised" : (self.optimised_generator(), True), "reference" : (self.reference_generator(), not self.reference_rendering) }
+        outputs = {}
+
+        for variant, (generator, single_pass_rendering) in runs.items():
+            generate = lambda num_rows : [ (training_pair, dt.isoformat())
+                                        for training_pair, dt in generator.generate(output, num_rows, locale_schema=locale_schema, seed=self.seed, single_pass_rendering=single_pass_rendering) ]
+
+            generate(self.num_rows)
+
+            seconds = float("inf")
+            for _ in range(self.repeat):
+                start = perf_counter()
+                outputs[variant] = generate(self.num_rows)
+                seconds = min(seconds, perf_counter() - start)
+
+            tracemalloc.start()
+            try:
+                generate(min(self.num_rows, self.memory_rows))
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+
+            self.measurements.append(Measurement(benchmark, variant, self.num_rows, seconds, self.num_rows / seconds if seconds > 0 else float("inf"), peak / 1024))
+
+        self.comparisons.append(compare(benchmark, outputs["optimised"], outputs["reference"]))
+
+    def report(self) -> str:
+        """
+        report: table of the measurements and comparisons
+        """
+        lines = [f"{'benchmark':<36} {'variant':<10} {'rows':>7} {'seconds':>9} {'rows/sec':>10} {'peak KiB':>10}"]
+
+        for m in self.measurements:
+            lines.append(f"{m.benchmark:<36} {m.variant:<10} {m.rows:>7} {m.seconds:>9.3f} {m.rows_per_second:>10.0f} {m.peak_kib:>10.1f}")
+
+        lines.append("")
+        lines.append(f"{'benchmark':<36} {'rows':>7} {'speedup':>8} {'mismatches':>11}")
+
+        seconds = { (m.benchmark, m.variant) : m.seconds for m in self.measurements }
+        for c in self.comparisons:
+            speedup = seconds[(c.benchmark, "reference")] / max(seconds[(c.benchmark, "optimised")], 1e-9)
+            lines.append(f"{c.benchmark:<36} {c.rows:>7} {speedup:>7.2f}x {c.mismatches:>11}" + (f"  {c.first_mismatch}" if c.first_mismatch else ""))
+
+        return "\n".join(lines)
+
+    def to_json(self) -> Dict[str, List[Dict[str, Any]]]:
+        return { "measurements" : [m._asdict() for m in self.measurements]
+                , "comparisons" : [c._asdict() for c in self.comparisons]
+                }
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='differential speed benchmark of CustomFormatter, NormaliseString and generate16.23')
+        cmd_line_parser.add_argument('--num_rows', type=int, default=2000, help='number of rows of each benchmark')
+        cmd_line_parser.add_argument('--seed', type=int, default=42, help='seed of the inputs and generators')
+        cmd_line_parser.add_argument('--memory_rows', type=int, default=1000, help='number of rows traced with tracemalloc')
+        cmd_line_parser.add_argument('--normalise_cache_size', type=int, default=10000, help='normalisation cache of the optimised path')
+        cmd_line_parser.add_argument('--outputs', type=str, nargs='*', default=['iso8601', 'format_spec', 'timezone'], help='generate16.23 outputs of the end-to-end benchmarks')
+        cmd_line_parser.add_argument('--locale_schemas', type=str, nargs='*', default=['mini.10', 'babel.all'], help='locale schemas of the end-to-end benchmarks')
+        cmd_line_parser.add_argument('--repeat', type=int, default=3, help='number of timed runs; the best one is reported')
+        cmd_line_parser.add_argument('--reference_rendering', default=False, action='store_true', help='the reference path renders each format spec again (slower; raises on formats Babel cannot render)')
+        cmd_line_parser.add_argument('--output_file', type=str, default=None, help='optional; json report')
+        args = cmd_line_parser.parse_args()
+
+        benchmark = FormatterBenchmark(num_rows=args.num_rows, seed=args.seed, memory_rows=args.memory_rows, normalise_cache_size=args.normalise_cache_size, reference_rendering=args.reference_rendering, repeat=args.repeat)
+
+        benchmark.run_components(locale_schema=args.locale_schemas[-1] if args.locale_schemas else "babel.all")
+
+        for output in args.outputs:
+            for locale_schema in args.locale_schemas:
+                benchmark.run_generate(output, locale_schema)
+
+        print(benchmark.report())
+
+        if args.output_file is not None:
+            with open(args.output_file, "w", encoding="utf-8") as f:
+                json.dump(benchmark.to_json(), f, indent=2)
+
+        mismatches = sum(c.mismatches for c in benchmark.comparisons)
+        if mismatches > 0:
+            raise RuntimeError(f"{mismatches} outputs differ between the optimised and reference paths")
+
+
+    # main entry point
+    main()
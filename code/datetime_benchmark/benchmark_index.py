@@ -0,0 +1,403 @@
+# -*- coding: utf-8 -*-
+"""
+benchmark_index.py: Random access to the rows of benchmark.jsonl files, through a memory map and a cached index
+
+The index of a benchmark file has the offset of each line and the targets as a fixed-width byte column (e.g S19 for
+ISO-8601 targets); it is built once, without parsing the JSON of each line, and saved next to the file
+(e.g a.2/benchmark.jsonl.idx.npz). A task can then be sliced, sampled or sharded by row range: only the rows asked for
+are parsed.
+
+NOTES
+- the targets are found from the end of each line ("target": "..."}); a line in another layout (e.g other key order,
+    escaped characters in the target) is parsed with json instead
+- the index is rebuilt if the file has changed (size or modification time), or if it was built by another version
+- the md5 of the file is kept in the index, and checked against the checksums of a Croissant file (FileObjects with a
+    contentUrl and an md5 or sha256); the published Croissant file (DATETIME Croissant - v0.4.4.json) has no checksums,
+    in which case the md5 is only reported
+- only uncompressed files can be memory mapped, e.g not benchmark.json.gz
+
+USAGE
+    index = BenchmarkIndex("../../a.2/benchmark.jsonl")
+
+    len(index)                                      # 1000
+    index.row(42)                                   # {"input" : ..., "target" : ...}
+    index.targets[:10]                              # NumPy array of bytes, e.g b"5951-02-11T01:12:31"
+    index.rows(index.sample(100, seed=0))
+    index.rows(range(*index.shard(worker, num_workers)))
+
+    # all the tasks of the README, validated against the Croissant file
+    python3 benchmark_index.py --benchmark_dir ../.. --croissant_file "../../DATETIME Croissant - v0.4.4.json"
+
+"""
+
+# system
+import hashlib
+import json
+import mmap
+import os
+import re
+from os.path import exists, isdir, join, relpath
+from typing import Dict, Iterable, List, Tuple
+
+# 3rd party
+import numpy as np
+
+# locals
+from scorer import BENCHMARK_FILES
+
+
+# version of the index files; an index of another version is rebuilt
+INDEX_VERSION = 1
+
+INDEX_EXTENSION = ".idx.npz"
+
+# "target": "...", at the end of a line
+TARGET_PREFIX = b'"target": "'
+TARGET_SUFFIX = b'"}'
+
+# number of bytes hashed at a time
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def file_md5(filename : str) -> str:
+    """
+    file_md5: md5 (hex) of a file
+    """
+    md5 = hashlib.md5()
+
+    with open(filename, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            md5.update(block)
+
+    return md5.hexdigest()
+
+
+def line_offsets(data : np.ndarray) -> np.ndarray:
+    """
+    line_offsets: offsets of the non-empty lines of a buffer
+
+    :param data: NumPy array of uint8, e.g a memory mapped file
+
+    :return: NumPy array (n, 2) of int64: start and end of each line; line i is data[start:end], without its newline
+    """
+    newlines = np.flatnonzero(data == ord("\n"))
+
+    # NOTE: a last line without a newline ends at the end of the buffer, as if it had one
+    ends = newlines if len(data) == 0 or data[-1] == ord("\n") else np.append(newlines, len(data))
+    starts = np.concatenate(([0], ends[:-1] + 1)) if len(ends) > 0 else np.zeros(0, dtype=np.int64)
+
+    # NOTE: empty lines are dropped, i.e a row is a line with content
+    keep = ends > starts
+
+    return np.stack((starts[keep], ends[keep]), axis=1).astype(np.int64)
+
+
+def extract_targets(data : np.ndarray, offsets : np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    extract_targets: targets at the end of each line ("target": "..."}), without json
+
+    :param data: NumPy array of uint8
+
+    :param offsets: (n, 2) line starts and ends, see line_offsets()
+
+    :return: 2-tuple
+        1. NumPy array (n,) of bytes: the targets (empty where not found)
+        2. NumPy array (n,) of bool: True where the target was found
+    """
+    n = len(offsets)
+
+    # NOTE: a \r before the newline is not part of the target
+    ends = offsets[:, 1] - (data[np.maximum(offsets[:, 1] - 1, 0)] == ord("\r"))
+
+    # the target starts after the last quote before the suffix
+    quotes = np.flatnonzero(data == ord('"'))
+    target_ends = ends - len(TARGET_SUFFIX)
+    last_quote = np.searchsorted(quotes, target_ends) - 1
+    target_starts = quotes[np.maximum(last_quote, 0)] + 1 if len(quotes) > 0 else target_ends
+
+    found = (last_quote >= 0) & (target_starts - len(TARGET_PREFIX) >= offsets[:, 0])
+
+    for idx, char in enumerate(TARGET_SUFFIX):
+        found &= data[np.clip(target_ends + idx, 0, max(len(data) - 1, 0))] == char
+
+    for idx, char in enumerate(reversed(TARGET_PREFIX)):
+        found &= data[np.maximum(target_starts - 1 - idx, 0)] == char
+
+    # NOTE: a backslash (escaped character) in the target means the line needs json
+    backslashes = np.flatnonzero(data == ord("\\"))
+    found &= np.searchsorted(backslashes, target_ends) == np.searchsorted(backslashes, target_starts)
+
+    widths = np.where(found, target_ends - target_starts, 0)
+
+    max_width = int(widths[found].max()) if found.any() else 0
+    targets = np.zeros(n, dtype=f"S{max(max_width, 1)}")
+
+    for width in np.unique(widths[found]):
+        rows = np.flatnonzero(found & (widths == width))
+        if width > 0:
+            targets[rows] = data[target_starts[rows, None] + np.arange(width)].view(f"S{width}").ravel()
+
+    return targets, found
+
+
+class BenchmarkIndex:
+
+    """
+    BenchmarkIndex: memory mapped benchmark.jsonl file, with the offsets of its rows and its targets
+    """
+
+    def __init__(self, filename : str, cache : bool = True):
+        """
+        :param filename: benchmark file, e.g ../../a.2/benchmark.jsonl; uncompressed
+
+        :param cache: True to load the index from, and save it to, filename + INDEX_EXTENSION
+        """
+        if filename.endswith(".gz"):
+            raise ValueError(f"{filename}: compressed files cannot be memory mapped")
+
+        self.filename = filename
+        self.index_filename = filename + INDEX_EXTENSION
+
+        with open(filename, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.size, self.mtime_ns = stat.st_size, stat.st_mtime_ns
+
+            # NOTE: an empty file cannot be memory mapped
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else None
+
+        self.data = np.frombuffer(self.mmap, dtype=np.uint8) if self.mmap is not None else np.zeros(0, dtype=np.uint8)
+
+        loaded = self.load_index() if cache else False
+        if not loaded:
+            self.build_index()
+
+            if cache:
+                self.save_index()
+
+    def build_index(self):
+        """
+        build_index: offsets and targets of the rows, and md5 of the file
+        """
+        self.offsets = line_offsets(self.data)
+        self.targets, found = extract_targets(self.data, self.offsets)
+
+        # rows in another layout: parsed with json
+        missing = np.flatnonzero(~found)
+        if len(missing) > 0:
+            parsed = [str(self.row(idx)["target"]).encode("utf-8") for idx in missing]
+            width = max(self.targets.dtype.itemsize, max(len(target) for target in parsed))
+
+            self.targets = self.targets.astype(f"S{width}")
+            self.targets[missing] = parsed
+
+        self.md5 = file_md5(self.filename)
+
+    def save_index(self):
+        """
+        save_index: save the index next to the file; skipped if the directory is not writable
+        """
+        temp_filename = self.index_filename + ".tmp.npz"
+
+        try:
+            np.savez(temp_filename
+                    , version=np.array(INDEX_VERSION)
+                    , stat=np.array([self.size, self.mtime_ns], dtype=np.int64)
+                    , md5=np.array(self.md5)
+                    , offsets=self.offsets
+                    , targets=self.targets
+                    )
+            os.replace(temp_filename, self.index_filename)
+        except OSError:
+            pass
+
+    def load_index(self) -> bool:
+        """
+        load_index: load the saved index, if it is up to date
+
+        :return: True if the index was loaded
+        """
+        if not exists(self.index_filename):
+            return False
+
+        try:
+            with np.load(self.index_filename) as index:
+                if int(index["version"]) != INDEX_VERSION or index["stat"].tolist() != [self.size, self.mtime_ns]:
+                    return False
+
+                self.md5 = str(index["md5"])
+                self.offsets = index["offsets"]
+                self.targets = index["targets"]
+        except (OSError, ValueError, KeyError):
+            return False
+
+        return True
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def line(self, idx : int) -> bytes:
+        """
+        line: raw line of a row, without its newline
+        """
+        start, end = self.offsets[idx]
+        return self.mmap[start:end]
+
+    def row(self, idx : int) -> dict:
+        """
+        row: a row, e.g {"input" : ..., "target" : ...}
+        """
+        return json.loads(self.line(idx))
+
+    def rows(self, indices : Iterable[int]) -> List[dict]:
+        """
+        rows: rows by index, e.g range(100, 200) or sample()
+        """
+        return [self.row(idx) for idx in indices]
+
+    def inputs(self, indices : Iterable[int]) -> List[str]:
+        return [row["input"] for row in self.rows(indices)]
+
+    def target_strings(self, indices : Iterable[int] = None) -> List[str]:
+        """
+        target_strings: targets as str, without parsing the rows; all the targets if indices is None
+        """
+        targets = self.targets if indices is None else self.targets[np.asarray(list(indices), dtype=np.int64)]
+        return [target.decode("utf-8") for target in targets.tolist()]
+
+    def sample(self, num_rows : int, seed : int = None) -> np.ndarray:
+        """
+        sample: indices of num_rows distinct random rows, sorted
+        """
+        return np.sort(np.random.default_rng(seed).choice(len(self), size=min(num_rows, len(self)), replace=False))
+
+    def shard(self, shard : int, num_shards : int) -> Tuple[int, int]:
+        """
+        shard: row range (start, stop) of a shard, e.g of an evaluation worker; the shards cover all the rows, in order
+
+        :param shard: 0 ... num_shards - 1
+        """
+        if not 0 <= shard < num_shards:
+            raise ValueError(f"Invalid shard {shard} of {num_shards}")
+
+        return len(self) * shard // num_shards, len(self) * (shard + 1) // num_shards
+
+    def close(self):
+        # NOTE: the arrays viewing the memory map are released first
+        self.data = None
+        if self.mmap is not None:
+            self.mmap.close()
+
+
+def readme_tasks(readme_file : str) -> List[str]:
+    """
+    readme_tasks: the task names listed in the README of the benchmark, e.g "* a.2: Translation from ..."
+    """
+    with open(readme_file, "r", encoding="utf-8") as f:
+        return [match.group(1) for match in re.finditer(r"^\* ([\w.]+)\s*:", f.read(), flags=re.MULTILINE)]
+
+
+def croissant_checksums(croissant_file : str) -> Dict[str, Tuple[str, str]]:
+    """
+    croissant_checksums: checksums of the files of a Croissant file
+
+    :return: contentUrl (path relative to the benchmark directory) => (algorithm, hex digest), algorithm md5 or sha256;
+        only FileObjects with a hex digest, e.g not the git repository ("sha256" : "main")
+    """
+    with open(croissant_file, "r", encoding="utf-8") as f:
+        croissant = json.load(f)
+
+    checksums = {}
+
+    for distribution in croissant.get("distribution", []):
+        if distribution.get("@type") != "cr:FileObject" or "contentUrl" not in distribution:
+            continue
+
+        for algorithm, length in (("md5", 32), ("sha256", 64)):
+            digest = distribution.get(algorithm)
+            if isinstance(digest, str) and re.fullmatch(f"[0-9a-f]{{{length}}}", digest.lower()):
+                checksums[distribution["contentUrl"]] = (algorithm, digest.lower())
+                break
+
+    return checksums
+
+
+def validate(index : BenchmarkIndex, checksums : Dict[str, Tuple[str, str]], benchmark_dir : str) -> str:
+    """
+    validate: check a benchmark file against the checksums of a Croissant file
+
+    :return: "ok", or "no checksum" if the Croissant file has no checksum for the file
+
+    :raises ValueError: if the checksum does not match
+    """
+    path = relpath(index.filename, benchmark_dir).replace(os.sep, "/")
+
+    checksum = checksums.get(path)
+    if checksum is None:
+        return "no checksum"
+
+    algorithm, expected = checksum
+    actual = index.md5 if algorithm == "md5" else hashlib.sha256(index.mmap or b"").hexdigest()
+
+    if actual != expected:
+        raise ValueError(f"{path}: {algorithm} {actual} does not match {expected} in the Croissant file")
+
+    return "ok"
+
+
+def load_tasks(benchmark_dir : str, tasks : List[str] = None, cache : bool = True) -> Dict[str, BenchmarkIndex]:
+    """
+    load_tasks: BenchmarkIndex of each task
+
+    :param benchmark_dir: directory of the task directories and of the README, e.g ../..
+
+    :param tasks: optional; task names; default is the tasks listed in the README
+    """
+    if tasks is None:
+        tasks = readme_tasks(join(benchmark_dir, "README.md"))
+
+    indexes = {}
+
+    for task in tasks:
+        task_dir = join(benchmark_dir, task)
+        filename = join(task_dir, BENCHMARK_FILES[0])
+
+        if not isdir(task_dir) or not exists(filename):
+            raise ValueError(f"Task {task}: no {BENCHMARK_FILES[0]} in {task_dir}")
+
+        indexes[task] = BenchmarkIndex(filename, cache=cache)
+
+    return indexes
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+    from time import time
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='build the indexes of the benchmark files, and validate them against a Croissant file')
+        cmd_line_parser.add_argument('--benchmark_dir', type=str, required=True, help='directory of the task directories and of the README, e.g ../..')
+        cmd_line_parser.add_argument('--tasks', type=str, nargs='+', default=None, help='optional; task names; default is the tasks listed in the README')
+        cmd_line_parser.add_argument('--croissant_file', type=str, default=None, help='optional; Croissant file with the checksums of the files')
+        cmd_line_parser.add_argument('--no_cache', action='store_true', help='build the indexes without loading or saving them')
+        args = cmd_line_parser.parse_args()
+
+        start = time()
+        indexes = load_tasks(args.benchmark_dir, tasks=args.tasks, cache=not args.no_cache)
+        elapsed = time() - start
+
+        checksums = croissant_checksums(args.croissant_file) if args.croissant_file is not None else {}
+
+        for task, index in indexes.items():
+            status = validate(index, checksums, args.benchmark_dir) if args.croissant_file is not None else ""
+            print(f"{task:<28} {len(index):>8} rows  {index.targets.dtype}  md5 {index.md5}  {status}")
+
+        print(f"{len(indexes)} tasks, {sum(len(index) for index in indexes.values())} rows indexed in {elapsed:.2f}s")
+
+
+    # main entry point
+    main()
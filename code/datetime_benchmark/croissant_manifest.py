@@ -0,0 +1,453 @@
+# -*- coding: utf-8 -*-
+"""
+croissant_manifest.py: Checksums, row counts and field statistics of the benchmark files, in a Croissant file and the task READMEs
+
+After a generation run, each benchmark file (benchmark.jsonl, benchmark.jsonl.gz, benchmark.json.gz) is read once, in
+chunks, by a pool of worker processes: md5 and sha256 of the bytes, and for JSONL files the number of rows, statistics
+of the input and target fields and the first rows as samples.
+
+- update: add or update a FileObject per benchmark file (contentUrl, contentSize, md5, sha256) in a Croissant file, and a
+    FileSet and a RecordSet for the tasks that have none; the other metadata of the Croissant file is kept as is
+- readme: write the number of observations and a sample table in the README of each task (e.g a.2/README.md); a task
+    without a README gets one
+- verify: check all the benchmark files against the checksums of a Croissant file, in one parallel pass
+
+NOTES
+- the files are never loaded in memory: they are hashed and parsed CHUNK_SIZE bytes at a time (gzipped files are
+    decompressed chunk by chunk)
+- benchmark.json.gz files (one JSON document, {"meta" : ..., "data" : [...]}) are hashed, without statistics
+- the Croissant file is written to --output_file, e.g the input file itself to update it in place
+
+USAGE
+    python3 croissant_manifest.py --benchmark_dir ../.. --croissant_file "../../DATETIME Croissant - v0.4.4.json" --output_file croissant.json --readme
+    python3 croissant_manifest.py --benchmark_dir ../.. --croissant_file croissant.json --verify --workers 8
+
+"""
+
+# system
+import hashlib
+import json
+import re
+import zlib
+from multiprocessing import Pool, cpu_count
+from os import listdir
+from os.path import exists, join
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional
+
+# locals
+from benchmark_index import croissant_checksums, readme_tasks
+from scorer import BENCHMARK_FILES
+
+
+# number of bytes read at a time
+CHUNK_SIZE = 1 << 20
+
+ISO8601_PATTERN = re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}")
+INTEGER_PATTERN = re.compile(r"\d+")
+
+ENCODING_FORMATS = {
+    ".jsonl" : "application/jsonlines"
+    , ".jsonl.gz" : "application/gzip"
+    , ".json.gz" : "application/gzip"
+}
+
+# fields of the rows, as in the record sets of the Croissant file
+FIELDS = ("input", "target")
+
+
+class FieldStats:
+
+    """
+    FieldStats: statistics of the values of a field: lengths, and kinds of values (ISO-8601, integer, text)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.min_length = None
+        self.max_length = None
+        self.total_length = 0
+        self.kinds = { "iso8601" : 0, "integer" : 0, "text" : 0 }
+
+    def update(self, value : Any):
+        self.count += 1
+
+        if value is None:
+            self.nulls += 1
+            return
+
+        value = str(value)
+        length = len(value)
+
+        self.min_length = length if self.min_length is None else min(self.min_length, length)
+        self.max_length = length if self.max_length is None else max(self.max_length, length)
+        self.total_length += length
+
+        if ISO8601_PATTERN.fullmatch(value):
+            self.kinds["iso8601"] += 1
+        elif INTEGER_PATTERN.fullmatch(value):
+            self.kinds["integer"] += 1
+        else:
+            self.kinds["text"] += 1
+
+    def as_dict(self) -> Dict[str, Any]:
+        values = self.count - self.nulls
+
+        return {
+            "count" : self.count
+            , "nulls" : self.nulls
+            , "min_length" : self.min_length
+            , "max_length" : self.max_length
+            , "mean_length" : self.total_length / values if values > 0 else None
+            , "kinds" : { kind : count for kind, count in self.kinds.items() if count > 0 }
+        }
+
+
+class FileInfo(NamedTuple):
+
+    """
+    FileInfo: checksums and statistics of a benchmark file
+    """
+
+    path : str                                      # relative to the benchmark directory, e.g a.2/benchmark.jsonl
+    size : int                                      # bytes
+    md5 : str
+    sha256 : str
+    rows : Optional[int]                            # None if the file is not JSONL
+    fields : Dict[str, Dict[str, Any]]              # field => FieldStats.as_dict()
+    samples : List[Dict[str, Any]]                  # first rows
+
+
+def scan_file(benchmark_dir : str, path : str, stats : bool = True, num_samples : int = 3) -> FileInfo:
+    """
+    scan_file: read a benchmark file once, in chunks: checksums, and for JSONL files the rows, field statistics and samples
+
+    :param benchmark_dir: e.g ../..
+
+    :param path: relative to benchmark_dir, e.g a.2/benchmark.jsonl
+
+    :param stats: False for the checksums only, e.g to verify the files
+
+    :param num_samples: number of rows kept as samples
+    """
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    size = 0
+
+    is_jsonl = stats and (path.endswith(".jsonl") or path.endswith(".jsonl.gz"))
+    decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS) if is_jsonl and path.endswith(".gz") else None
+
+    rows = 0
+    fields = { field : FieldStats() for field in FIELDS }
+    samples = []
+    remainder = b""
+
+    def parse(lines : Iterable[bytes]):
+        nonlocal rows
+        for line in lines:
+            if not line.strip():
+                continue
+
+            row = json.loads(line)
+            rows += 1
+
+            for field in FIELDS:
+                fields[field].update(row.get(field))
+
+            if len(samples) < num_samples:
+                samples.append(row)
+
+    with open(join(benchmark_dir, path), "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            md5.update(chunk)
+            sha256.update(chunk)
+            size += len(chunk)
+
+            if is_jsonl:
+                # NOTE: the last (partial) line of a chunk is parsed with the next chunk
+                lines = (remainder + (decompressor.decompress(chunk) if decompressor is not None else chunk)).split(b"\n")
+                remainder = lines.pop()
+                parse(lines)
+
+    if is_jsonl:
+        parse([remainder + (decompressor.flush() if decompressor is not None else b"")])
+
+    return FileInfo(path
+                    , size
+                    , md5.hexdigest()
+                    , sha256.hexdigest()
+                    , rows if is_jsonl else None
+                    , { field : field_stats.as_dict() for field, field_stats in fields.items() } if is_jsonl else {}
+                    , samples
+                    )
+
+
+def _scan_file(args : tuple) -> FileInfo:
+    return scan_file(*args)
+
+
+def scan_files(benchmark_dir : str, paths : List[str], stats : bool = True, workers : int = None) -> Dict[str, FileInfo]:
+    """
+    scan_files: scan_file() of each file, in parallel
+
+    :param workers: optional; number of worker processes; default is one per CPU, up to the number of files
+
+    :return: path => FileInfo
+    """
+    if workers is None:
+        workers = min(cpu_count(), len(paths))
+
+    tasks = [(benchmark_dir, path, stats) for path in paths]
+
+    if workers > 1:
+        with Pool(processes=workers) as pool:
+            infos = list(pool.imap_unordered(_scan_file, tasks))
+    else:
+        infos = [_scan_file(task) for task in tasks]
+
+    return { info.path : info for info in infos }
+
+
+def task_files(benchmark_dir : str, tasks : List[str]) -> List[str]:
+    """
+    task_files: the benchmark files of the tasks, relative to benchmark_dir, e.g a.2/benchmark.jsonl
+    """
+    return [f"{task}/{name}" for task in tasks for name in BENCHMARK_FILES if exists(join(benchmark_dir, task, name))]
+
+
+def encoding_format(path : str) -> str:
+    for extension, encoding in ENCODING_FORMATS.items():
+        if path.endswith(extension):
+            return encoding
+
+    raise ValueError(f"Unknown benchmark file format: {path}")
+
+
+def update_croissant(croissant : Dict[str, Any], infos : Dict[str, FileInfo]) -> Dict[str, Any]:
+    """
+    update_croissant: add or update the FileObject of each file, and add a FileSet and a RecordSet for new tasks
+
+    :param croissant: Croissant metadata, e.g json.load() of "DATETIME Croissant - v0.4.4.json"; updated in place
+
+    :param infos: see scan_files()
+
+    :return: croissant
+    """
+    distribution = croissant.setdefault("distribution", [])
+    record_sets = croissant.setdefault("recordSet", [])
+
+    by_id = { entry.get("@id") : entry for entry in distribution }
+    record_set_ids = { record_set.get("@id") for record_set in record_sets }
+
+    # NOTE: the repository, as the other FileSets; files are added to it
+    repository_id = next((entry["@id"] for entry in distribution if entry.get("@type") == "cr:FileObject" and entry.get("encodingFormat") == "git+https"), None)
+
+    for path, info in sorted(infos.items()):
+        file_id = f"file/datetime/{path}"
+
+        file_object = by_id.get(file_id)
+        if file_object is None:
+            file_object = by_id[file_id] = { "@type" : "cr:FileObject", "@id" : file_id }
+            distribution.append(file_object)
+
+        file_object.update({
+            "name" : path
+            , "contentUrl" : path
+            , "encodingFormat" : encoding_format(path)
+            , "contentSize" : f"{info.size} B"
+            , "md5" : info.md5
+            , "sha256" : info.sha256
+        })
+
+        if repository_id is not None:
+            file_object["containedIn"] = { "@id" : repository_id }
+
+        if info.rows is not None:
+            file_object["description"] = f"{info.rows} rows"
+
+        # a new task (JSONL): FileSet and RecordSet, as the published tasks
+        task = path.split("/")[0]
+        fileset_id = f"fileset/datetime/{task}"
+
+        if info.rows is not None and fileset_id not in by_id:
+            fileset = by_id[fileset_id] = {
+                "@type" : "cr:FileSet"
+                , "@id" : fileset_id
+                , "name" : f"DATETIME/{task}"
+                , "description" : f"DATETIME task {task}"
+                , "encodingFormat" : encoding_format(path)
+                , "includes" : path
+            }
+            if repository_id is not None:
+                fileset["containedIn"] = { "@id" : repository_id }
+
+            distribution.append(fileset)
+
+        record_set_id = f"datetime/{task}"
+
+        if info.rows is not None and record_set_id not in record_set_ids:
+            record_set_ids.add(record_set_id)
+            record_sets.append({
+                "@type" : "cr:RecordSet"
+                , "@id" : record_set_id
+                , "name" : f"DATETIME/{task}"
+                , "field" : [{
+                    "@type" : "cr:Field"
+                    , "@id" : f"{record_set_id}/{field}"
+                    , "name" : field
+                    , "description" : f"The {field}, e.g {info.samples[0][field]}" if len(info.samples) > 0 else f"The {field}"
+                    , "dataType" : "sc:Text"
+                    , "source" : { "fileSet" : { "@id" : fileset_id }, "extract" : { "column" : field } }
+                } for field in FIELDS]
+            })
+
+    return croissant
+
+
+def sample_table(samples : List[Dict[str, Any]]) -> str:
+    """
+    sample_table: markdown table of sample rows, in the layout of the task READMEs
+    """
+    def cell(value : Any) -> str:
+        return str(value).replace("|", "\\|").replace("\n", " ")
+
+    lines = ["| input  | target   |", "|---|---|"]
+    lines += [f"| {cell(row.get('input'))}  | {cell(row.get('target'))} |" for row in samples]
+
+    return "\n".join(lines)
+
+
+def update_readme(readme : Optional[str], task : str, info : FileInfo) -> str:
+    """
+    update_readme: README of a task with the number of observations and the sample table of info
+
+    :param readme: current README, or None for a new README, in the layout of a.2/README.md
+
+    :return: the README
+    """
+    table = sample_table(info.samples)
+
+    if readme is None:
+        return f"# DATETIME / {task}\n\n### Details\n* __Number of observations__ : {info.rows}\n\n\n#### Sample\n{table}\n"
+
+    readme = re.sub(r"(\* __Number of observations__ : )\d+", lambda match : f"{match.group(1)}{info.rows}", readme)
+
+    # NOTE: the table after the Sample heading is replaced; appended if there is none
+    pattern = re.compile(r"(#### Sample\n)(?:\|.*(?:\n|$))*")
+    if pattern.search(readme):
+        return pattern.sub(lambda match : f"{match.group(1)}{table}\n", readme, count=1)
+
+    return readme.rstrip("\n") + f"\n\n#### Sample\n{table}\n"
+
+
+def verify(benchmark_dir : str, checksums : Dict[str, tuple], paths : List[str], workers : int = None) -> Dict[str, str]:
+    """
+    verify: check files against the checksums of a Croissant file, in one parallel pass
+
+    :param checksums: see benchmark_index.croissant_checksums()
+
+    :param paths: files to check, e.g task_files(); the files of checksums are checked too
+
+    :return: path => "ok", "mismatch", "missing" (in the Croissant file, not on disk) or "no checksum"
+    """
+    paths = sorted(set(paths) | set(checksums))
+    present = [path for path in paths if exists(join(benchmark_dir, path))]
+
+    infos = scan_files(benchmark_dir, present, stats=False, workers=workers)
+
+    status = {}
+    for path in paths:
+        if path not in infos:
+            status[path] = "missing"
+        elif path not in checksums:
+            status[path] = "no checksum"
+        else:
+            algorithm, expected = checksums[path]
+            status[path] = "ok" if getattr(infos[path], algorithm) == expected else "mismatch"
+
+    return status
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+    from os.path import isdir
+    from time import time
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='checksums and statistics of the benchmark files, in a Croissant file and the task READMEs')
+        cmd_line_parser.add_argument('--benchmark_dir', type=str, required=True, help='directory of the task directories, e.g ../..')
+        cmd_line_parser.add_argument('--tasks', type=str, nargs='+', default=None, help='optional; task names; default is the tasks listed in the README of benchmark_dir')
+        cmd_line_parser.add_argument('--croissant_file', type=str, default=None, help='Croissant file to update or to verify against')
+        cmd_line_parser.add_argument('--output_file', type=str, default=None, help='optional; updated Croissant file, e.g the same as --croissant_file')
+        cmd_line_parser.add_argument('--readme', action='store_true', help='write the number of observations and a sample table in the README of each task')
+        cmd_line_parser.add_argument('--verify', action='store_true', help='check the benchmark files against the checksums of --croissant_file')
+        cmd_line_parser.add_argument('--workers', type=int, default=None, help='optional; number of worker processes; default is one per CPU')
+        args = cmd_line_parser.parse_args()
+
+        tasks = args.tasks
+        if tasks is None:
+            readme_file = join(args.benchmark_dir, "README.md")
+            tasks = readme_tasks(readme_file) if exists(readme_file) else []
+            tasks = tasks or sorted(task for task in listdir(args.benchmark_dir) if isdir(join(args.benchmark_dir, task)))
+
+        paths = task_files(args.benchmark_dir, tasks)
+        start = time()
+
+        if args.verify:
+            if args.croissant_file is None:
+                cmd_line_parser.error("--verify requires --croissant_file")
+
+            status = verify(args.benchmark_dir, croissant_checksums(args.croissant_file), paths, workers=args.workers)
+
+            for path, path_status in status.items():
+                print(f"{path:<44} {path_status}")
+
+            print(f"{len(status)} files verified in {time() - start:.2f}s")
+
+            failures = [path for path, path_status in status.items() if path_status in ("mismatch", "missing")]
+            if len(failures) > 0:
+                raise RuntimeError(f"{len(failures)} files do not match {args.croissant_file}: {failures}")
+
+            return
+
+        infos = scan_files(args.benchmark_dir, paths, workers=args.workers)
+
+        for path, info in sorted(infos.items()):
+            target = info.fields.get("target", {})
+            print(f"{path:<44} {info.size:>10} B  rows {info.rows if info.rows is not None else '':>8}  md5 {info.md5}  target {target.get('kinds', '')}")
+
+        print(f"{len(infos)} files scanned in {time() - start:.2f}s")
+
+        if args.output_file is not None:
+            croissant = {}
+            if args.croissant_file is not None:
+                with open(args.croissant_file, "r", encoding="utf-8") as f:
+                    croissant = json.load(f)
+
+            update_croissant(croissant, infos)
+
+            with open(args.output_file, "w", encoding="utf-8") as f:
+                json.dump(croissant, f, indent=2, ensure_ascii=False)
+
+        if args.readme:
+            for task in tasks:
+                info = infos.get(f"{task}/{BENCHMARK_FILES[0]}")
+                if info is None:
+                    continue
+
+                readme_file = join(args.benchmark_dir, task, "README.md")
+                readme = None
+                if exists(readme_file):
+                    with open(readme_file, "r", encoding="utf-8") as f:
+                        readme = f.read()
+
+                with open(readme_file, "w", encoding="utf-8") as f:
+                    f.write(update_readme(readme, task, info))
+
+
+    # main entry point
+    main()
@@ -17,6 +17,34 @@ EXAMPLES
 
     {ON(day)} : ordinal number of day, e.g 1st
 
+- Babel patterns are parsed once and kept in a bounded LRU cache of DateTimePattern objects (see pattern_cache_size)
+    - a parsed pattern does not depend on the locale; Locale objects are cached separately
+    - Babel's own pattern cache is unbounded (https://github.com/python-babel/babel/issues/962), so entries are removed from it
+    as soon as they are parsed
+
+- render_components() + assemble(): single-pass rendering of a FormatSpec
+    - each component is rendered once; the pieces are used both to check for empty components and to assemble the string
+    - the result is the same as apply() on the whole string; if Babel would read the pieces differently once joined
+    (e.g {d}{dd} => "ddd"), assemble() falls back to apply()
+    - the spans of the components in the rendered string are returned when they can be computed
+
+- num2words and Roman numerals are looked up in tables, built once per locale (days 1-31, months 1-12, years 1-4998)
+    - the numbers num2words cannot convert for a locale are recorded in the tables, and raise the same error on lookup
+    - the num2words tables can be saved to disk with save_number_word_tables(), e.g for worker processes to start warm
+
+- name fields (month, weekday, period, quarter and era names, e.g {MMM}, {EEEE}, {a}) are looked up in tables built once per
+    locale, instead of being formatted by Babel for each datetime; see locale_tables.py
+    - the tables can be saved to disk with save_locale_tables(), e.g for worker processes to start warm
+
+- patterns made only of numeric fields (e.g {dd}/{MM}/{yyyy} {HH}:{mm}) render the same in every locale, and are rendered
+    without Babel; see numeric_formatter.py
+
+- optional memoisation of the normalisation (see normalise_cache_size)
+    - the rendered components (month names, weekday names, timezone names, AM/PM markers, ...) are a small set per locale:
+    their normalised strings are cached
+    - whole rendered strings rarely repeat (the digits vary): they are normalised without the cache, so that they do not
+    evict the components
+
 
 edward | 2023-01-17
 
@@ -24,23 +52,112 @@ edward | 2023-01-17
 """
 
 # system
+import builtins
+import json
 from datetime import date, datetime, time, timedelta
-from typing import List, Set, Dict, Tuple, Optional, Union, Iterable
+from string import ascii_letters
+from typing import List, Set, Dict, Tuple, Optional, Union, Iterable, NamedTuple
 
 # 3rd party
 import babel.dates
-from num2words import num2words, CONVERTER_CLASSES as num2words_locales
+from babel import Locale
+from num2words import CONVERTER_CLASSES as num2words_locales
 from roman import toRoman
 
 # locals
 from normalise_tokens import NormaliseTokens as NormaliseLDMLTokens
 from normalise_string import NormaliseString
+from lru_cache import LRUCache
+from locale_tables import LocaleTables
+from numeric_formatter import NumericFormatter
+from format_template import FormatSpec, is_token
 
 class UnhandledFormat(Exception):
     """The specified format was unknown"""    
     pass
 
 
+class CustomFormatFallback(Exception):
+    """A custom format cannot be rendered; the whole string is replaced with a fallback value, e.g the day as a number"""
+
+    def __init__(self, value : str):
+        super().__init__(value)
+        self.value = value
+
+
+# custom formats, in the order in which they are rendered
+# NOTE: the order matters; the first fallback found (see CustomFormatFallback) is returned
+CUSTOM_TOKENS = (r"{T}", r"{TT}", r"{C(day)}", r"{O(day)}", r"{ON(day)}", r"{X(month)}", r"{X(year)}")
+
+
+# domain of the num2words and Roman numeral tables
+MAX_DAY = 31
+MAX_MONTH = 12
+MAX_ROMAN_YEAR = 4998 # NOTE: toRoman only supports numbers in range (must be 0..4999)
+
+# num2words conversions, e.g "cardinal" : 1 => one
+NUM2WORDS_CONVERSIONS = ("cardinal", "ordinal", "ordinal_num")
+
+
+class NumberWordsError(NamedTuple):
+
+    """
+    NumberWordsError: num2words cannot convert a number for a locale; recorded in the lookup tables
+    """
+
+    error_type : str    # name of the exception, e.g NotImplementedError
+    message : str
+
+    def exception(self) -> Exception:
+        """
+        exception: a new exception of the same type as the one raised by num2words
+        """
+        error_type = getattr(builtins, self.error_type, None)
+
+        if not (isinstance(error_type, type) and issubclass(error_type, Exception)):
+            error_type = RuntimeError
+
+        return error_type(self.message)
+
+
+# Roman numerals, e.g ROMAN_MONTHS[4] == "IV"; the years are built on first use
+ROMAN_MONTHS = (None,) + tuple(toRoman(month) for month in range(1, MAX_MONTH + 1))
+ROMAN_YEARS = None
+
+def roman_year(year : int) -> str:
+    """
+    roman_year: year in Roman numerals, e.g 2007 => MMVII; year must be in 1..MAX_ROMAN_YEAR
+    """
+    global ROMAN_YEARS
+
+    if ROMAN_YEARS is None:
+        ROMAN_YEARS = (None,) + tuple(toRoman(year) for year in range(1, MAX_ROMAN_YEAR + 1))
+
+    return ROMAN_YEARS[year]
+
+
+class RenderedComponents(NamedTuple):
+
+    """
+    RenderedComponents: the components of a format spec, rendered once for a datetime and a locale
+    """
+
+    dt : Union[date, datetime]
+    locale : str
+    texts : Dict[str, str]          # rendered text of each component, not normalised, e.g {"{dd}" : "07", "{C(day)}" : "seven"}
+    fallbacks : Dict[str, str]      # custom components replaced with a fallback value, e.g {"{O(day)}" : "7"}
+
+
+class RenderedFormat(NamedTuple):
+
+    """
+    RenderedFormat: a format spec rendered for a datetime and a locale
+    """
+
+    string : str                                    # e.g "07-apr-2007"
+    spans : Optional[Tuple[Tuple[str, int, int]]]   # (component, start, end) in string, e.g (("{dd}", 0, 2), ...); None if unknown
+
+
 
 class CustomFormatter:
 
@@ -48,7 +165,7 @@ class CustomFormatter:
     CustomFormatter: Apply custom formats for datetimes that are not handled by Babel.
     """
 
-    def __init__(self, apply_babel : bool = True, normalise : bool = True):
+    def __init__(self, apply_babel : bool = True, normalise : bool = True, pattern_cache_size : int = 10000, number_word_tables_file : str = None, normalise_cache_size : int = None, locale_tables_file : str = None, fast_paths : bool = True):
         """
         :param apply_babel: apply Babel format_datetime after custom formats
 
@@ -57,21 +174,102 @@ class CustomFormatter:
             # 2. tokens (e.g convert .. to .)
             # 3. whitespace (e.g "\u202f" to " ")
             # 4. convert to lower case
+
+        :param pattern_cache_size: maximum number of parsed Babel patterns kept in memory
+            the generators use a few thousand distinct patterns, so the parse cost is paid once per pattern
+
+        :param number_word_tables_file: optional; num2words tables saved with save_number_word_tables()
+            if None, the tables are built on first use
+
+        :param normalise_cache_size: optional; maximum number of normalised components kept in memory; None for no cache
+
+        :param locale_tables_file: optional; locale tables saved with save_locale_tables()
+            if None, the tables are built on first use
+
+        :param fast_paths: if True, names are looked up in the locale tables and numeric fields are rendered without Babel
+            if False, every field is rendered by Babel (reference path, same strings; see benchmark_formatter.py)
         
         """
 
         self.apply_babel = apply_babel
         self.normalise = normalise
+        self.fast_paths = fast_paths
 
-        self.flatten_string = NormaliseString()
+        self.flatten_string = NormaliseString(cache_size=normalise_cache_size)
         self.normalise_ldml_tokens = NormaliseLDMLTokens()
 
-        # count number of calls to babel so that we can release Babel's cache; else we create a memory leak
-        # => https://github.com/python-babel/babel/issues/962
-        self.babel_call_counter = 0
+        # parsed Babel patterns, e.g "dd-MMM-yyyy" => DateTimePattern
+        # NOTE: bounded, unlike Babel's own cache; memory stays flat over long runs
+        self.pattern_cache = LRUCache(maxsize=pattern_cache_size)
+
+        # Locale objects, e.g "en_US" => Locale("en", territory="US")
+        # NOTE: the number of locales is small and fixed, so this table is not bounded
+        self.locale_cache = {}
+
+        # num2words locale of each locale, e.g "fr_FR" => "fr"
+        self.num2words_locale_cache = {}
+
+        # num2words tables, e.g ("fr", "ordinal") => (..., "premier", "deuxième", ...), indexed by the number (0 to MAX_DAY)
+        # NOTE: numbers that cannot be converted are recorded as NumberWordsError
+        self.number_word_tables = {}
+
+        if number_word_tables_file is not None:
+            self.load_number_word_tables(number_word_tables_file)
+
+        # names rendered by Babel for each locale, e.g ("fr_FR", "MMM") => ("janv.", "févr.", ...)
+        self.locale_tables = LocaleTables(locale_tables_file)
+
+        # numeric fields, e.g {dd}, {HH}, {Z}, rendered without Babel
+        self.numeric_formatter = NumericFormatter(pattern_cache_size=pattern_cache_size)
+
+    def parse_babel_pattern(self, babel_format_spec : str) -> babel.dates.DateTimePattern:
+        """
+        parse_babel_pattern: parse a Babel pattern, e.g "dd-MMM-yyyy"; parsed patterns are cached
+
+        :return: DateTimePattern
+        """
+        pattern = self.pattern_cache.get(babel_format_spec)
+
+        if pattern is None:
+            pattern = babel.dates.parse_pattern(babel_format_spec)
+            self.pattern_cache.put(babel_format_spec, pattern)
+
+            # Babel keeps every parsed pattern in its own cache: remove it, ours is bounded
+            babel.dates._pattern_cache.pop(babel_format_spec, None)
+
+        return pattern
+
+    def get_locale(self, locale : Union[str, Locale]) -> Locale:
+        """
+        get_locale: parse a locale name, e.g "en_US"; Locale objects are cached
+        """
+        if isinstance(locale, Locale):
+            return locale
+
+        babel_locale = self.locale_cache.get(locale)
+
+        if babel_locale is None:
+            babel_locale = Locale.parse(locale)
+            self.locale_cache[locale] = babel_locale
 
-    def release_babel_cache(self):
-        babel.dates._pattern_cache.clear()
+        return babel_locale
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        cache_stats: sizes and hit/miss/eviction counters of the caches
+
+        :return: e.g {"pattern" : {"size" : 812, "maxsize" : 10000, "hits" : 99188, "misses" : 812, "evictions" : 0}, "locale" : {"size" : 10}, "locale_tables" : {"size" : 120}}
+            plus "normalise" (same counters as "pattern") if normalise_cache_size is set
+        """
+        stats = { "pattern" : self.pattern_cache.stats()
+                , "locale" : { "size" : len(self.locale_cache) }
+                , "locale_tables" : { "size" : len(self.locale_tables.tables) }
+                }
+
+        if self.flatten_string.cache is not None:
+            stats["normalise"] = self.flatten_string.cache_stats()
+
+        return stats
 
 
     def add_babel_escape(self, s : str):
@@ -112,6 +310,118 @@ class CustomFormatter:
         # fallback        
         return fallback
 
+    def number_words(self, number : int, to : str, locale : str) -> str:
+
+        """
+        number_words: same as num2words(number, to=to, lang=find_num2words_locale(locale)), looked up in a table
+
+        :param number: 0 to MAX_DAY
+
+        :param to: one of NUM2WORDS_CONVERSIONS, e.g "ordinal"
+
+        :return: e.g "first"
+
+        :raises: the same error as num2words if the number cannot be converted for this locale, e.g NotImplementedError
+        """
+
+        num2words_locale = self.num2words_locale_cache.get(locale)
+        if num2words_locale is None:
+            num2words_locale = self.find_num2words_locale(locale)
+            self.num2words_locale_cache[locale] = num2words_locale
+
+        table = self.number_word_tables.get((num2words_locale, to))
+        if table is None:
+            table = self.build_number_word_table(num2words_locale, to)
+            self.number_word_tables[(num2words_locale, to)] = table
+
+        words = table[number]
+
+        if isinstance(words, NumberWordsError):
+            raise words.exception()
+
+        return words
+
+    def build_number_word_table(self, num2words_locale : str, to : str) -> Tuple[Union[str, NumberWordsError], ...]:
+
+        """
+        build_number_word_table: convert the numbers 0 to MAX_DAY with num2words
+
+        :param num2words_locale: e.g "fr"
+
+        :param to: one of NUM2WORDS_CONVERSIONS, e.g "ordinal"
+
+        :return: tuple indexed by the number; NumberWordsError if the number cannot be converted
+        """
+
+        # NOTE: some num2words converters keep state between calls, e.g Num2Word_AR.to_ordinal() switches later cardinals to feminine
+        #   each number is converted with a new converter, so that the tables do not depend on previous conversions
+        converter_class = type(num2words_locales[num2words_locale])
+
+        table = []
+        for number in range(MAX_DAY + 1):
+            try:
+                table.append(str(getattr(converter_class(), f"to_{to}")(number)))
+            except Exception as e:
+                # NOTE: not all numbers and locales work, e.g AttributeError: 'Num2Word_TR' object has no attribute 'to_ordinal_num'
+                table.append(NumberWordsError(type(e).__name__, str(e)))
+
+        return tuple(table)
+
+    def save_number_word_tables(self, filename : str, locales : Iterable[str] = None):
+
+        """
+        save_number_word_tables: save the num2words tables to a json file
+
+        :param filename: e.g number_word_tables.json
+
+        :param locales: optional; build the tables of these locales first, e.g all locales of a locale schema
+        """
+
+        if locales is not None:
+            for locale in locales:
+                for to in NUM2WORDS_CONVERSIONS:
+                    try:
+                        self.number_words(1, to, locale)
+                    except Exception:
+                        pass
+
+        tables = { f"{num2words_locale}|{to}" : [words if isinstance(words, str) else { "error_type" : words.error_type, "message" : words.message } for words in table]
+                    for (num2words_locale, to), table in self.number_word_tables.items() }
+
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump(tables, file, ensure_ascii=False)
+
+    def load_number_word_tables(self, filename : str):
+
+        """
+        load_number_word_tables: load num2words tables saved with save_number_word_tables()
+        """
+
+        with open(filename, "r", encoding="utf-8") as file:
+            tables = json.load(file)
+
+        for key, table in tables.items():
+            num2words_locale, to = key.split("|")
+
+            if len(table) != MAX_DAY + 1:
+                raise ValueError(f"Invalid num2words table '{key}' in {filename}: expected {MAX_DAY + 1} numbers, found {len(table)}")
+
+            self.number_word_tables[(num2words_locale, to)] = tuple(words if isinstance(words, str) else NumberWordsError(words["error_type"], words["message"]) for words in table)
+
+    def save_locale_tables(self, filename : str, locales : Iterable[str] = None):
+
+        """
+        save_locale_tables: save the locale tables (month names, weekday names, ...) to a json file; see LocaleTables.save()
+        """
+        self.locale_tables.save(filename, locales=locales)
+
+    def load_locale_tables(self, filename : str):
+
+        """
+        load_locale_tables: load locale tables saved with save_locale_tables()
+        """
+        self.locale_tables.load(filename)
+
 
 
     def apply(self, string_to_format : str, dt : Union[date, datetime], locale : str = "en", normalise : bool = None) -> str:
@@ -137,44 +447,95 @@ class CustomFormatter:
         """
 
    
+        # NOTE: a single component is likely to be rendered again, e.g {MMM}; a whole string is not (see normalise_cache_size)
+        is_single_component = is_token(string_to_format) and string_to_format.count("{") == 1
+
+        # custom formats, e.g {T}, {C(day)}, {X(month)}
+        for custom_token in CUSTOM_TOKENS:
+            if custom_token in string_to_format:
+                try:
+                    s = self.render_custom_token(custom_token, dt, locale)
+                except CustomFormatFallback as e:
+                    return e.value
+
+                string_to_format = string_to_format.replace(custom_token, self.add_babel_escape(s))
+
+
+        # apply babel formatting
+        if self.apply_babel:
+            babel_format_spec = string_to_format.replace("{", "").replace("}", "")
+
+            # NOTE: numeric fields only, e.g "dd/MM/yyyy": same string as Babel in every locale
+            # the locale is still parsed, so that an unknown locale raises the same error as Babel
+            babel_locale = self.get_locale(locale)
+            numeric_string = self.numeric_formatter.format(babel_format_spec, dt) if self.fast_paths else None
+
+            if numeric_string is not None:
+                string_to_format = numeric_string
+
+            else:
+                try:
+                    # NOTE: format_datetime() accepts a parsed DateTimePattern and a Locale object, and skips parsing them again
+                    string_to_format = babel.dates.format_datetime(dt, locale=babel_locale, format=self.parse_babel_pattern(babel_format_spec))
+                
+                except KeyError as e:
+                    raise UnhandledFormat(f"Babel format '{babel_format_spec}' not found for locale '{locale}' : KeyError '{e}'")
+                
+                except Exception as e:
+                    raise e
+
+
+        # normalise
+        if normalise is True or (normalise is None and self.normalise):
+            #string_to_format = self.normalise_whitespace.normalise(self.normalise_tokens.normalise(self.normalise_unicode.normalise(string_to_format))).lower().strip()
+            string_to_format = self.normalise_string(string_to_format, cache=is_single_component)
+
+        return string_to_format
+
+    def render_custom_token(self, custom_token : str, dt : Union[date, datetime], locale : str = "en") -> str:
+
+        """
+        render_custom_token: render a custom format, e.g {C(day)} => "seven"
+
+        :param custom_token: one of CUSTOM_TOKENS
+
+        :return: rendered string, not escaped
+
+        :raises CustomFormatFallback: if the format cannot be rendered, and the whole string should be replaced with a fallback value
+        """
+
         # -- timezone --
-        if r"{T}" in string_to_format:
+        if custom_token == r"{T}":
             # if timezone is "America/Anguilla" => "America/Anguilla"
             # returns (most of the time) the original timezone name as specified in c
-            string_to_format = string_to_format.replace(r"{T}", self.add_babel_escape(dt.timetz().tzname()))
+            return dt.timetz().tzname()
 
-        if r"{TT}" in string_to_format:
+        if custom_token == r"{TT}":
             # if timezone is "America/Anguilla" => "AST"
-            string_to_format = string_to_format.replace(r"{TT}", self.add_babel_escape(dt.tzname()))
+            return dt.tzname()
 
         # -- num2words --
         # C: Cardinal, e.g one
-        
-        if r"{C(day)}" in string_to_format:
-            # NOTE: not all locales are available in num2words
-            num2words_locale = self.find_num2words_locale(locale)
-            string_to_format = string_to_format.replace(r"{C(day)}", self.add_babel_escape(num2words(dt.day, to="cardinal", lang=num2words_locale)))
+        # NOTE: not all locales are available in num2words; see number_words()
+        if custom_token == r"{C(day)}":
+            return self.number_words(dt.day, "cardinal", locale)
 
         # O: Ordinal, e.g first
-        if r"{O(day)}" in string_to_format:
-            # NOTE: not all locales are available in num2words
-            num2words_locale = self.find_num2words_locale(locale)
+        if custom_token == r"{O(day)}":
             try:
-                string_to_format = string_to_format.replace(r"{O(day)}", self.add_babel_escape(num2words(dt.day, to="ordinal", lang=num2words_locale)))
+                return self.number_words(dt.day, "ordinal", locale)
             except NotImplementedError as e:
                 # NOTE: not all numbers and locales work
-                return str(dt.day)
+                raise CustomFormatFallback(str(dt.day))
 
         # ON: Ordinal Number, e.g 1st
-        if r"{ON(day)}" in string_to_format:
-            # NOTE: not all locales are available in num2words
-            num2words_locale = self.find_num2words_locale(locale)
+        if custom_token == r"{ON(day)}":
             try:
-                string_to_format = string_to_format.replace(r"{ON(day)}", self.add_babel_escape(num2words(dt.day, to="ordinal_num", lang=num2words_locale)))
+                return self.number_words(dt.day, "ordinal_num", locale)
             except Exception as e:
                 # NOTE: AttributeError: 'Num2Word_TR' object has no attribute 'to_ordinal_num'
                 # NOTE: NotImplementedError
-                return str(dt.day)
+                raise CustomFormatFallback(str(dt.day))
 
         # BACKLOG: add more supported word syntaxes
         # hour: "douze heures"
@@ -182,48 +543,267 @@ class CustomFormatter:
         # -- roman --
         
         # Roman Numerals on Month
-        if r"{X(month)}" in string_to_format:
-            string_to_format = string_to_format.replace(r"{X(month)}", self.add_babel_escape(toRoman(dt.month)))
+        if custom_token == r"{X(month)}":
+            return ROMAN_MONTHS[dt.month]
 
         # Roman Numerals on Year
-        if r"{X(year)}" in string_to_format:
+        if custom_token == r"{X(year)}":
             # NOTE: toRoman only supports numbers in range (must be 0..4999)
             if dt.year < 4999:
-                string_to_format = string_to_format.replace(r"{X(year)}", self.add_babel_escape(toRoman(dt.year)))
+                return roman_year(dt.year)
             else:
-                return str(dt.year)
+                raise CustomFormatFallback(str(dt.year))
 
+        raise UnhandledFormat(f"Unknown custom format '{custom_token}'")
 
-        # apply babel formatting
-        if self.apply_babel:
-            babel_format_spec = string_to_format.replace("{", "").replace("}", "")
-            try:
-                string_to_format = babel.dates.format_datetime(dt, locale=locale, format=babel_format_spec)
-            
-            except KeyError as e:
-                raise UnhandledFormat(f"Babel format '{babel_format_spec}' not found for locale '{locale}' : KeyError '{e}'")
-            
-            except Exception as e:
-                raise e
 
+    def render_components(self, components : Iterable[str], dt : Union[date, datetime], locale : str = "en") -> RenderedComponents:
+
+        """
+        render_components: render each component of a format spec once, e.g "{dd}" => "07", "{C(day)}" => "seven"
 
+        :param components: the components of a format spec, e.g FormatSpec.components
 
+        :param dt: datetime
 
-            self.babel_call_counter += 1
+        :param locale: locale name as a string
 
-            # release Babel's cache; else we create a memory leak => https://github.com/python-babel/babel/issues/962
-            if (self.babel_call_counter % 1000) == 0:
-                self.release_babel_cache()
+        :return: RenderedComponents, to be checked with find_null_component() and assembled with assemble()
 
+        :raises UnhandledFormat: if Babel cannot render a component for this locale
+        """
 
-        # normalise
-        if normalise is True or (normalise is None and self.normalise):
-            #string_to_format = self.normalise_whitespace.normalise(self.normalise_tokens.normalise(self.normalise_unicode.normalise(string_to_format))).lower().strip()
-            string_to_format = self.normalise_string(string_to_format)
+        texts = {}
+        fallbacks = {}
 
-        return string_to_format
+        components = set(components)
+
+        # custom formats first, in the same order as apply()
+        for custom_token in CUSTOM_TOKENS:
+            if custom_token in components:
+                try:
+                    texts[custom_token] = str(self.render_custom_token(custom_token, dt, locale))
+                except CustomFormatFallback as e:
+                    texts[custom_token] = e.value
+                    fallbacks[custom_token] = e.value
+
+        # Babel formats
+        # NOTE: same as format_datetime(), but the datetime and the locale are only prepared once
+        # the locale is parsed even if no component is rendered by Babel, so that an unknown locale raises the same error
+        self.get_locale(locale)
+        babel_datetime_format = None
 
-    def normalise_string(self, s : str, strip : bool = True, to_lower : bool = False) -> str:
+        for component in components:
+            if component in texts:
+                continue
+
+            # names, e.g {MMM}, are looked up in the locale tables; numbers, e.g {dd}, are rendered without Babel
+            if self.fast_paths:
+                text = self.locale_tables.render(component[1:-1], dt, locale)
+                if text is None:
+                    text = self.numeric_formatter.format(component[1:-1], dt)
+
+                if text is not None:
+                    texts[component] = text
+                    continue
+
+            if babel_datetime_format is None:
+                babel_datetime_format = self.babel_datetime_format(dt, locale)
+
+            texts[component] = self.render_babel_pattern(component.replace("{", "").replace("}", ""), babel_datetime_format)
+
+        return RenderedComponents(dt, locale, texts, fallbacks)
+
+
+    def babel_datetime_format(self, dt : Union[date, datetime], locale : str) -> babel.dates.DateTimeFormat:
+        """
+        babel_datetime_format: prepare a datetime for rendering with Babel patterns, as format_datetime() does
+        """
+        if isinstance(dt, date) and not isinstance(dt, datetime):
+            dt = datetime.combine(dt, time())
+
+        return babel.dates.DateTimeFormat(dt, self.get_locale(locale))
+
+
+    def render_babel_pattern(self, babel_format_spec : str, babel_datetime_format : babel.dates.DateTimeFormat) -> str:
+        """
+        render_babel_pattern: render a Babel pattern, e.g "dd" => "07"
+        """
+        try:
+            return self.parse_babel_pattern(babel_format_spec) % babel_datetime_format
+        except KeyError as e:
+            raise UnhandledFormat(f"Babel format '{babel_format_spec}' not found for locale '{babel_datetime_format.locale}' : KeyError '{e}'")
+
+
+    def find_null_component(self, rendered : RenderedComponents, components : Iterable[str], normalise : bool = None) -> Optional[str]:
+
+        """
+        find_null_component: find the first component rendered as an empty string; some locales have empty names
+
+        NOTE: same check as rendering each component on its own with apply()
+
+        :param rendered: see render_components()
+
+        :param components: the components to check, in order
+
+        :param normalise: see apply()
+
+        :return: the first empty component, e.g "{a}"; None if no component is empty
+        """
+
+        normalise = normalise is True or (normalise is None and self.normalise)
+
+        for component in components:
+            s = rendered.texts[component]
+
+            if component in rendered.fallbacks:
+                pass
+
+            elif component in CUSTOM_TOKENS and (len(s) == 0 or "'" in s):
+                # NOTE: Babel reads quotes in the escaped string; render the component on its own
+                s = self.apply(component, rendered.dt, locale=rendered.locale, normalise=normalise)
+
+            elif normalise:
+                s = self.normalise_string(s)
+
+            if s is None or len(s) == 0 or s == ' ':
+                return component
+
+        return None
+
+
+    def assemble(self, format_spec : FormatSpec, rendered : RenderedComponents, normalise : bool = None, spans : bool = False) -> RenderedFormat:
+
+        """
+        assemble: assemble a format spec from its rendered components
+
+        the result is the same as apply(format_spec.string, dt, locale), without rendering the components again
+
+        :param format_spec: FormatSpec; its components must have been rendered by render_components()
+            NOTE: it can be a subset of the rendered format spec, e.g with a component removed
+
+        :param rendered: see render_components()
+
+        :param normalise: see apply()
+
+        :param spans: if True, compute the spans of the components in the rendered string
+
+        :return: RenderedFormat
+        """
+
+        # a custom format could not be rendered: the whole string is replaced, as in apply()
+        if rendered.fallbacks:
+            for custom_token in CUSTOM_TOKENS:
+                if custom_token in rendered.fallbacks and custom_token in format_spec.components:
+                    return RenderedFormat(rendered.fallbacks[custom_token], None)
+
+        if not self.apply_babel or not self.is_separable(format_spec, rendered):
+            return RenderedFormat(self.apply(format_spec.string, rendered.dt, locale=rendered.locale, normalise=normalise), None)
+
+        # render the literals, e.g "-"
+        babel_datetime_format = None
+        pieces = []
+        for piece in format_spec.pieces:
+
+            if is_token(piece) and piece in rendered.texts:
+                pieces.append(rendered.texts[piece])
+                continue
+
+            literal = piece.replace("{", "").replace("}", "")
+
+            if "'" in literal or any(c in ascii_letters for c in literal):
+                # NOTE: Babel interprets letters, e.g "de" => day of year + era
+                if babel_datetime_format is None:
+                    babel_datetime_format = self.babel_datetime_format(rendered.dt, rendered.locale)
+                literal = self.render_babel_pattern(literal, babel_datetime_format)
+
+            pieces.append(literal)
+
+        string = "".join(pieces)
+
+        normalise = normalise is True or (normalise is None and self.normalise)
+
+        if normalise:
+            string = self.normalise_string(string, cache=False)
+
+        return RenderedFormat(string, self.find_spans(format_spec, pieces, string, normalise=normalise) if spans else None)
+
+
+    def is_separable(self, format_spec : FormatSpec, rendered : RenderedComponents) -> bool:
+
+        """
+        is_separable: True if Babel reads the pieces of the format spec the same way, whether they are joined or not
+
+        e.g "{d}{dd}" is not separable: once joined, Babel reads "ddd"
+        e.g "{C(day)}{X(month)}" is not separable: once joined and escaped, "'seven''IV'" contains a quote character
+        """
+
+        previous = ""
+        for piece in format_spec.pieces:
+
+            if piece in CUSTOM_TOKENS:
+                text = rendered.texts[piece]
+                if len(text) == 0 or "'" in text:
+                    return False
+
+                babel_piece = self.add_babel_escape(text)
+            else:
+                babel_piece = piece.replace("{", "").replace("}", "")
+
+            if len(babel_piece) == 0:
+                continue
+
+            # quotes must be balanced within each piece
+            if babel_piece.replace("''", "").count("'") % 2 != 0:
+                return False
+
+            # fields (e.g d and dd) and quotes must not run across pieces
+            if len(previous) > 0 and previous[-1] == babel_piece[0] and (babel_piece[0] == "'" or babel_piece[0] in ascii_letters):
+                return False
+
+            previous = babel_piece
+
+        return True
+
+
+    def find_spans(self, format_spec : FormatSpec, pieces : List[str], string : str, normalise : bool = True) -> Optional[Tuple[Tuple[str, int, int]]]:
+
+        """
+        find_spans: spans of the components in a string assembled from pieces
+
+        NOTE: normalisation can change the length of the string (e.g whitespace, "..") so the offsets of the pieces cannot simply be added up;
+            each component is searched for in the string, in order, after the previous component
+
+        :param pieces: rendered pieces, in the same order as format_spec.pieces, not normalised
+
+        :param string: the assembled string
+
+        :param normalise: True if string was normalised
+
+        :return: tuple of (component, start, end); None if a component cannot be found in the string
+        """
+
+        spans = []
+        position = 0
+        for piece, text in zip(format_spec.pieces, pieces):
+
+            if not is_token(piece):
+                continue
+
+            if normalise:
+                text = self.normalise_string(text)
+
+            start = string.find(text, position)
+            if start < 0:
+                return None
+
+            position = start + len(text)
+            spans.append((piece, start, position))
+
+        return tuple(spans)
+
+
+    def normalise_string(self, s : str, strip : bool = True, to_lower : bool = False, cache : bool = True) -> str:
         """
         normalise_string: apply full normalisation to a string
 
@@ -235,11 +815,13 @@ class CustomFormatter:
 
         :param to_lower: set to True to cast string to lower case
 
+        :param cache: set to False to bypass the normalisation cache (if any); see normalise_cache_size
+
         :return: normalised string
         
         """
         
-        s1 = self.flatten_string.normalise_string(s, to_lower=False)
+        s1 = self.flatten_string.normalise_string(s, to_lower=False, cache=cache)
 
         if strip:
             return s1.strip()
@@ -318,6 +900,9 @@ if __name__ == '__main__':
             assert '{' not in output_string
             assert '}' not in output_string
 
+        print("--")
+        print("cache_stats", custom_formatter.cache_stats())
+
 
     # main entry point
     main()
\ No newline at end of file
@@ -17,7 +17,7 @@ python3 generate18_1.py format 10 --month_schema "unambiguous"
 
 from collections import namedtuple
 from datetime import date, datetime, time, timedelta
-from random import choice
+from random import Random
 from typing import Any, List, Set, Dict, Tuple, Optional, Union, Iterable, Iterator
 
 # 3rd party
@@ -26,6 +26,7 @@ from babel.dates import format_date
 
 # locals
 from random_datetime import random_date
+from random_state import Seed, make_rng
 from config import Config
 from training_pair import TrainingPair
 from custom_formatter import CustomFormatter
@@ -53,6 +54,9 @@ class Generate:
 
         self.config = Config() # self.default_encoding_character = "?"
 
+        # default random stream; see generate(seed=...) for reproducible runs
+        self.rng = make_rng()
+
         # generate17: CustomFormatter
         self.custom_formatter = CustomFormatter()
 
@@ -283,7 +287,7 @@ class Generate:
 
 
 
-    def resolve_dmy_tokens(self, raw_format_spec : str) -> str:
+    def resolve_dmy_tokens(self, raw_format_spec : str, rng : Optional[Random] = None) -> str:
 
         """
         resolve_dmy_tokens: replace a string with generic tokens "{day} {month} {year}" to a string with implementable tokens
@@ -292,6 +296,8 @@ class Generate:
         
         :param faw_format_spec: a string with generic tokens, e.g "{day} {month} {year}" 
 
+        :param rng: optional; random stream; if None, the generator's stream is used
+
         :return: a string with implementable tokens, e.g "{dd} {MMM} {YYYY}"
         
         """
@@ -300,20 +306,36 @@ class Generate:
         assert r"{day}" in raw_format_spec
         assert r"{month}" in raw_format_spec
         
+        # generate18: {year} no long present in the formats, but we can generalise the code
+        dmy_tokens = self.choose_dmy_tokens(year=r"{year}" in raw_format_spec, rng=rng)
 
-        day_token = choice(self.day_tokens)
-        month_token = choice(self.month_tokens)
-        
+        for placeholder, token in dmy_tokens.items():
+            raw_format_spec = raw_format_spec.replace("{" + placeholder + "}", token)
+
+        return raw_format_spec
 
-        raw_format_spec = raw_format_spec.replace(r"{day}", day_token)
-        raw_format_spec = raw_format_spec.replace(r"{month}", month_token)
 
-        # generate18: {year} no long present in the formats, but we can generalise the code
-        if r"{year}" in raw_format_spec:
-            year_token = choice(self.year_tokens)
-            raw_format_spec = raw_format_spec.replace(r"{year}", year_token)
+    def choose_dmy_tokens(self, year : bool = False, rng : Optional[Random] = None) -> Dict[str, str]:
 
-        return raw_format_spec
+        """
+        choose_dmy_tokens: choose random implementable tokens for the generic tokens {day}, {month} and optionally {year}
+
+        :param year: True if a token should be chosen for {year}
+
+        :param rng: optional; random stream; if None, the generator's stream is used
+
+        :return: a dict, e.g {"day" : "{dd}", "month" : "{MMM}"}
+        """
+
+        if rng is None:
+            rng = self.rng
+
+        dmy_tokens = { "day" : rng.choice(self.day_tokens), "month" : rng.choice(self.month_tokens) }
+
+        if year:
+            dmy_tokens["year"] = rng.choice(self.year_tokens)
+
+        return dmy_tokens
 
 
     def generate(self
@@ -322,6 +344,7 @@ class Generate:
                 , start_date : datetime = None
                 , schemas : List[str] = None
                 , locale_schema : str = None
+                , seed : Seed = None
                 ) -> Iterator[ Tuple[ TrainingPair, datetime] ]:
 
         """
@@ -336,6 +359,8 @@ class Generate:
             a schema is a group of formats, grouped according to some logic, e.g day first, month first, etc
             if None, all available schemas are used
 
+        :param seed: optional; seed (or random.Random) for a reproducible run; if None, the generator's stream is used
+
         :return: function is a generator -> an iterator of 2-tuples
             1. TrainingPairs (namedtuple)
             2. the input date
@@ -344,6 +369,8 @@ class Generate:
 
         assert isinstance(output, str)
 
+        rng = make_rng(seed) if seed is not None else self.rng
+
         #print(__file__, ">>", output, num_observations)
         
         # set start date
@@ -396,22 +423,22 @@ class Generate:
         for idx in range(0, num_observations):
             
             # generate16: generate a random date in the range [start_date; ...] with UTC timezone
-            d = random_date(start_date)
+            d = random_date(start_date, rng=rng)
          
             # generate11: iterate on requested schemas
 
             # generate16: randomised output
-            schema = choice(schemas)
-            locale = choice(locales)
+            schema = rng.choice(schemas)
+            locale = rng.choice(locales)
                 
             # iterate on date formats in this schema
-            raw_format_spec1 = choice(self.format_spec[schema])
+            raw_format_spec1 = rng.choice(self.format_spec[schema])
 
             # generate17: resolve {day}, {month} and {year} tokens
-            raw_format_spec = self.resolve_dmy_tokens(raw_format_spec1)
+            raw_format_spec = self.resolve_dmy_tokens(raw_format_spec1, rng=rng)
 
             # iterate on separators
-            separator_character = choice(self.separators)
+            separator_character = rng.choice(self.separators)
 
             # replace {whitespace} token with some token
             format_spec = raw_format_spec.replace(r"{whitespace}", self.whitespace_character)
@@ -476,6 +503,7 @@ if __name__ == "__main__":
         cmd_line_parser.add_argument('--month_schema', type=str, help='month tokens to use (all, arabic, roman, unambiguous)', default="all")
         
         cmd_line_parser.add_argument('--inputs', default=False, dest='inputs', action='store_true', help='only print input sequences')
+        cmd_line_parser.add_argument('--seed', type=int, help='seed for a reproducible run', default=None)
 
         cmd_line_parser.add_argument('--debug', default=False, dest='debug', action='store_true', help='debugging')
         args = cmd_line_parser.parse_args()
@@ -497,6 +525,7 @@ if __name__ == "__main__":
                                 , start_date=start_date
                                 , schemas=schemas
                                 , locale_schema=args.locale_schema
+                                , seed=args.seed
                                 )
 
         # show output
@@ -12,9 +12,13 @@ python3 generate16.23.py iso8601 1000 --month_schema "unambiguous" --locale_sche
 # -------
 
 from datetime import date, datetime, time, timedelta
-from random import choice, uniform, randint
+from math import lcm
+from multiprocessing import Pool, cpu_count
+from os.path import join
+from tempfile import TemporaryDirectory
+from random import Random
 from re import compile
-from typing import Any, List, Set, Dict, Tuple, Optional, Union, Iterable, Iterator
+from typing import Any, Callable, List, Set, Dict, Tuple, Optional, Union, Iterable, Iterator
 
 # 3rd party
 from babel.localedata import locale_identifiers
@@ -23,9 +27,13 @@ from pytz import timezone, all_timezones
 
 # locals
 from config import Config
-from random_datetime import random_utc_datetime
+from random_datetime import iter_random_utc_datetimes
+from random_state import Seed, make_rng, numpy_rng, random_seed, shard_seed, shard_seeds
+from timezone_pool import default_timezone_pool
 from training_pair import TrainingPair
-from custom_formatter import CustomFormatter
+from training_pair_sink import CsvSink, open_sink, is_columnar
+from custom_formatter import CustomFormatter, UnhandledFormat
+from format_template import FormatSpec, FormatTemplate
 
 # generators
 from dates.date.generate18_1 import Generate as GenerateDate
@@ -60,6 +68,12 @@ class Generate:
 
         # generate16.12: CustomFormatter
         self.custom_formatter = CustomFormatter()
+
+        # default random stream; see generate(seed=...) for reproducible runs
+        self.rng = make_rng()
+
+        # preloaded timezones, with the range of datetimes each timezone can represent
+        self.timezone_pool = default_timezone_pool()
         
         #self.locales = list(locale_identifiers())
         self.locales = { 
@@ -133,10 +147,27 @@ class Generate:
             , "time_modifier" : self.time_model.time_modifier_formats
         }
 
+        # the component of each token, e.g "{MMM}" => "month"
+        self.component_of_token = { token : component for component, tokens in self.possible_components.items() for token in tokens }
+
+        # precompiled format specs: the placeholders are filled for each observation
+        # NOTE: same structure (and order) as the raw format specs, so that the random choices are unchanged
+        self.date_placeholders = ["whitespace", "separator", "day", "month", "year"]
+        self.time_placeholders = ["whitespace", "separator", "microsecond", "timezone"]
+        self.datetime_placeholders = ["date", "time", "datetime_delimiter"]
+
+        self.date_templates = { schema : [FormatTemplate(raw_format_spec, self.date_placeholders) for raw_format_spec in raw_format_specs]
+                                for schema, raw_format_specs in self.date_model.format_spec.items() }
+
+        self.time_templates = [ [FormatTemplate(raw_format_spec, self.time_placeholders) for raw_format_spec in raw_format_specs]
+                                for raw_format_specs in self.time_model.format_specs ]
+
+        self.datetime_templates = [FormatTemplate(raw_format_spec, self.datetime_placeholders) for raw_format_spec in self.format_spec]
+
         
 
     
-    def verify_null_components(self, format_spec : str, dt : datetime, locale : str) -> Tuple[bool, str]:
+    def verify_null_components(self, format_spec : Union[str, FormatSpec], dt : datetime, locale : str) -> Tuple[bool, str]:
 
         """
         verify_null_components: verify that each component in the string generated a value;
@@ -149,6 +180,7 @@ class Generate:
             => 11:57:37 +0700 #  #4860
 
         :param format_spec: a format string, e.g {h} {a} {m}:{ss} {zzzz} {d} {M} {yy}
+            or a FormatSpec, which already knows its components
 
         :return: 2-tuple
             1.  True if none of the components generated a not null, zero length or a single space
@@ -160,34 +192,50 @@ class Generate:
 
         # identify all components
         # NOTE: the regex returns the components still containing the curly braces
-        components = self.regex_find_component.findall(format_spec) 
+        components = self.find_components(format_spec)
         assert len(components) > 0
 
         # resolve each component one at a time; fail if null, zero length or a single space
         for component in components:
             s = self.custom_formatter.apply(component, dt=dt, locale=locale)
             if s is None or len(s) == 0 or s == ' ':
-                return False, f"Failed verify_null_components | {dt.isoformat()} | format_spec : {format_spec} | locale : {locale} | component : {component}"
+                return False, f"Failed verify_null_components | {dt.isoformat()} | format_spec : {format_spec.string if isinstance(format_spec, FormatSpec) else format_spec} | locale : {locale} | component : {component}"
 
 
 
         return True, None
 
 
-    def remove_random_component(self, format_spec : str) -> Tuple[str, str]:
+    def find_components(self, format_spec : Union[str, FormatSpec]) -> Tuple[str, ...]:
+        """
+        find_components: the components of a format spec, in order, still containing the curly braces, e.g ("{h}", "{a}", "{m}")
+
+        :param format_spec: a format string, e.g {h} {a} {m}:{ss}; the components are found with a regex
+            or a FormatSpec, which already knows its components
+        """
+        if isinstance(format_spec, FormatSpec):
+            return format_spec.components
+
+        return tuple(self.regex_find_component.findall(format_spec))
+
+
+    def remove_random_component(self, format_spec : Union[str, FormatSpec], rng : Optional[Random] = None) -> Tuple[Union[str, FormatSpec], str]:
         """
         remove a random component, e.g {ss}; the component is simply replaced with a blank string
 
         :param format_spec: a format string, e.g {h} {a} {m}:{ss} {zzzz} {d} {M} {yy}
+            or a FormatSpec, which already knows its components
+
+        :param rng: optional; random stream; if None, the generator's stream is used
          
         :return: 2-tuple
-            1. a new format string with a component randomly removed, e.g {h} {a} {m}: {zzzz} {d} {M} {yy}
+            1. a new format string (or FormatSpec) with a component randomly removed, e.g {h} {a} {m}: {zzzz} {d} {M} {yy}
             2. the removed component (NOTE: still contains the curly braces)
                 e.g {ss}
         """
 
         # identify all components
-        components = self.regex_find_component.findall(format_spec) 
+        components = self.find_components(format_spec)
         assert len(components) > 0
 
         # check no duplicate components
@@ -195,13 +243,19 @@ class Generate:
 
         # get a random component
         # NOTE: random_component still contains the curly braces, e.g {ss}
-        random_component = choice(components)
+        if rng is None:
+            rng = self.rng
+
+        random_component = rng.choice(components)
 
         # remove it
+        if isinstance(format_spec, FormatSpec):
+            return format_spec.remove_component(random_component), random_component
+
         return format_spec.replace(random_component, ""), random_component
 
     
-    def get_visible_components(self, format_spec : str) -> Dict:
+    def get_visible_components(self, format_spec : Union[str, FormatSpec]) -> Dict:
         """
 
         Get the components that are visible in the output string. 
@@ -210,6 +264,7 @@ class Generate:
 
         :param format_spec: the format of the datetime; 
             format_spec: {h}:{mm}:{s} {a} {ZZ} {MMMM}#{EEEE} {ON(day)}#{yyyy}
+            or a FormatSpec, in which case the components are looked up directly
 
 
 
@@ -224,6 +279,9 @@ class Generate:
         
         """
 
+        if isinstance(format_spec, FormatSpec):
+            return self.get_visible_components_from_list(format_spec.components, format_spec.string)
+
         visible_components = {}
 
         for possible_component, possible_component_formats in self.possible_components.items():
@@ -235,6 +293,96 @@ class Generate:
                         raise RuntimeError(f"Found the component {possible_component} more than once in the format {format_spec}. Token is '{possible_component_format}'.")
 
         return visible_components
+
+    def get_visible_components_from_list(self, components : Iterable[str], format_spec : str = None) -> Dict:
+        """
+        get_visible_components_from_list: same as get_visible_components(), from the list of components of the format spec
+
+        :param components: e.g ("{h}", "{mm}", "{MMMM}")
+
+        :param format_spec: optional; only used in error messages
+
+        :return: a dict with visible components and the format, in the same order as get_visible_components()
+        """
+
+        found = {}
+        for token in components:
+            possible_component = self.component_of_token.get(token)
+
+            if possible_component is None:
+                continue
+
+            if possible_component in found:
+                raise RuntimeError(f"Found the component {possible_component} more than once in the format {format_spec}. Token is '{token}'.")
+
+            found[possible_component] = token
+
+        return { possible_component : found[possible_component] for possible_component in self.possible_components if possible_component in found }
+
+    def template_components(self, template : FormatTemplate) -> Set[str]:
+        """
+        template_components: the components that a format template always shows, whatever the values of its placeholders
+
+        e.g {h}{separator}{m}{separator}{s}.{microsecond} => {"hour", "minute", "second", "microsecond"}
+        """
+
+        components = { self.component_of_token[token] for token in template.tokens if token in self.component_of_token }
+
+        # NOTE: the placeholders day, month, year, microsecond and timezone are always filled with a token of that component
+        components.update(placeholder for placeholder in template.placeholders if placeholder in self.possible_components)
+
+        return components
+
+    def constrained_template_choices(self, schemas : List[str], required_components : Iterable[str]) -> Tuple[List[Tuple], List[int]]:
+        """
+        constrained_template_choices: the combinations of date and time templates whose format specs show all the required components
+
+        the weight of a combination is its probability in generate() without constraint, i.e
+            1/len(schemas) * 1/len(date templates of the schema) * 1/len(self.time_templates) * 1/len(time templates of the list)
+        so that drawing a combination is the same as drawing without constraint and rejecting the format specs without the components
+
+        :param schemas: date schemas to draw from
+
+        :param required_components: e.g ["minute", "second"]
+
+        :return: 2-tuple
+            1. list of 3-tuples (schema, date template, time template)
+            2. integer cumulative weights, for rng.choices(..., cum_weights=...)
+        """
+
+        required_components = set(required_components)
+
+        unknown_components = required_components - set(self.possible_components)
+        if len(unknown_components) > 0:
+            raise ValueError(f"Unknown required components {sorted(unknown_components)}; possible components are {list(self.possible_components)}")
+
+        # NOTE: integer weights, common denominator of the number of templates per schema and per time list
+        date_denominator = lcm(*[len(self.date_templates[schema]) for schema in schemas])
+        time_denominator = lcm(*[len(time_template_list) for time_template_list in self.time_templates])
+
+        combinations = []
+        cum_weights = []
+        total_weight = 0
+
+        for schema in schemas:
+            for date_template in self.date_templates[schema]:
+                date_components = self.template_components(date_template)
+
+                for time_template_list in self.time_templates:
+                    for time_template in time_template_list:
+
+                        if not required_components <= date_components | self.template_components(time_template):
+                            continue
+
+                        total_weight += (date_denominator // len(self.date_templates[schema])) * (time_denominator // len(time_template_list))
+
+                        combinations.append((schema, date_template, time_template))
+                        cum_weights.append(total_weight)
+
+        if len(combinations) == 0:
+            raise ValueError(f"No format spec shows the components {sorted(required_components)} with the schemas {schemas}")
+
+        return combinations, cum_weights
     
     def generate(self
                 , output : str
@@ -249,6 +397,12 @@ class Generate:
                 , microseconds : bool = True
                 , add_timezone : bool = True
                 , store_visible_components : bool = False
+                , store_format_spec : bool = False
+                , seed : Seed = None
+                , single_pass_rendering : bool = True
+                , store_component_spans : bool = False
+                , required_components : Iterable[str] = None
+                , sampler : Callable[[Random], datetime] = None
                 ) -> Iterator[ Tuple[ TrainingPair, datetime] ]:
 
         """
@@ -289,6 +443,28 @@ class Generate:
         :param add_timezone: if True, a random timezone is added
             if False, a UTC datetime is generated
 
+        :param store_format_spec: if True, store the format spec of the input string in aux["format_spec"], e.g {dd}-{MMM}-{yyyy}
+
+        :param seed: optional; seed (or random.Random) for a reproducible run; if None, the generator's stream is used
+
+        :param single_pass_rendering: if True, each component is rendered once, and the input string is assembled from the components
+            if False, each component is rendered on its own for verify_null_components(), then the whole format spec is rendered again
+            NOTE: both generate the same observations; with single pass rendering, formats that Babel cannot render for a locale
+            are skipped instead of raising UnhandledFormat
+
+        :param store_component_spans: if True, store the spans of the visible components in the input string in aux["component_spans"],
+            e.g [("{dd}", 0, 2), ("{MMM}", 3, 6)]; requires single_pass_rendering
+            NOTE: the spans are None if they cannot be computed (e.g whitespace normalised across two components)
+
+        :param required_components: optional; components that all format specs must show, e.g ["minute", "second"]
+            only the combinations of date and time formats that show these components are drawn, with the same weights
+            as without constraint (see constrained_template_choices)
+            NOTE: remove_random_component_probability can still remove a required component; set it to 0.0 to keep them
+
+        :param sampler: optional; draws the datetime of each observation from the random stream, e.g a random_datetime.DaySampler
+            if None, datetimes are drawn uniformly in [start_date; end_date]
+            NOTE: with a sampler, start_date, end_date and microseconds are not used; they are settings of the sampler
+
         :return: function is a generator -> an iterator of 2-tuples
             1. TrainingPairs (namedtuple)
             2. the input date
@@ -300,6 +476,8 @@ class Generate:
         if locale_schema not in self.locales:
             raise RuntimeError(f"Locale schema '{locale_schema}' not found")
 
+        rng = make_rng(seed) if seed is not None else self.rng
+
         # month_schema
         if month_schema is not None:
             self.date_model.set_month_schema(month_schema)
@@ -332,6 +510,16 @@ class Generate:
         if num_schemas == 0:
             raise RuntimeError(f"No schemas found; schemas = {schemas}")
 
+        # only draw the combinations of date and time formats that show the required components
+        if required_components is not None:
+            constrained_choices, constrained_cum_weights = self.constrained_template_choices(schemas, required_components)
+
+        # random datetimes in the range [start_date; end_date], drawn in batches
+        if sampler is None:
+            random_datetimes = iter_random_utc_datetimes(start_date, end_date, microseconds=microseconds, timezone=add_timezone, rng=numpy_rng(rng))
+        else:
+            random_datetimes = iter(lambda: sampler(rng), None)
+
         # NOTE: use a while loop because we may have to skip certain pairs (see continue statements)
         idx = 0
         while idx < num_observations:
@@ -342,118 +530,123 @@ class Generate:
 
             # generate16.9: generate a random datetime in the range [start_date; ...] with UTC timezone
             if not incremental:
-                dt_utc = random_utc_datetime(start_date, end_date, microseconds=microseconds, timezone=add_timezone)
+                dt_utc = next(random_datetimes)
             else:
                 # incremental mode: choose a random datetime to start, then ascending increments
                 if idx == 0:
-                    dt_utc = random_utc_datetime(start_date, end_date, microseconds=microseconds, timezone=add_timezone)
+                    dt_utc = next(random_datetimes)
                 else:
-                    dt_utc += timedelta(seconds=randint(1000, 10000))
+                    dt_utc += timedelta(seconds=rng.randint(1000, 10000))
 
 
 
             # generate16.9: apply a random timezone
             # NOTE: calls to astimezone() on certain dates generate OverflowError errors
-            # HACK: select another timezone if this conversion does not work
-            d = None
+            # => the timezone is drawn among the timezones that can represent this datetime
             if not add_timezone:
+                this_timezone = None
                 d = dt_utc
             else:
-                random_timezone_attempt = 0
-                while d is None:
-                    
-                    this_timezone_name = choice(all_timezones)
-
-                    try:
-                        this_timezone =  timezone(this_timezone_name)
-
-                        # move the UCT datetime to this timezone
-                        d = dt_utc.astimezone(this_timezone)
-                        assert d.tzinfo is not None
-                    
-                    except OverflowError as e:
-
-                        # only show a warning every 10 errors
-                        random_timezone_attempt += 1
-                        
-                        if random_timezone_attempt == 10:
-                            random_timezone_attempt = 0
+                # NOTE: the timezone is kept for output "timezone"
+                this_timezone = self.timezone_pool.random_zone(dt_utc, rng)
+                d = dt_utc.astimezone(this_timezone)
+                assert d.tzinfo is not None
             
 
             # iterate on the list of schemas determined above
             # current schemas in date/generate18: day-month-yy, day-month-weekday-yy, month-day-yy, month-day-weekday-yy
             # day-month-yyyy, day-month-weekday-yyyy, month-day-yyyy, month-day-weekday-yyyy
-            schema = choice(schemas)
+            # NOTE: with required components, the schema, date and time formats are drawn together
+            if required_components is None:
+                schema = rng.choice(schemas)
+            else:
+                schema, date_template, time_template = rng.choices(constrained_choices, cum_weights=constrained_cum_weights)[0]
          
             # -- iterate on date formats --
-            raw_date_format_spec =choice(self.date_model.format_spec[schema])
+            # NOTE: the format specs are precompiled templates (see __init__); placeholders are filled in one pass
+            if required_components is None:
+                date_template = rng.choice(self.date_templates[schema])
 
             # iterate on self.whitespace_characters
-            whitespace_character = choice(self.whitespace_characters)
-            date_format_spec1 = raw_date_format_spec.replace(r"{whitespace}", whitespace_character)
+            whitespace_character = rng.choice(self.whitespace_characters)
             
             # generate 10: iterate on date separators: space . / -
-            date_separator = choice(self.date_model.separators)
-            date_format_spec0 = date_format_spec1.replace(r"{separator}", date_separator)
+            date_separator = rng.choice(self.date_model.separators)
 
             # generate16.12: date/generate17 create day/month and year tokens that need to be resolved
-            date_format_spec = self.date_model.resolve_dmy_tokens(date_format_spec0)
+            dmy_tokens = self.date_model.choose_dmy_tokens(year="year" in date_template.placeholders, rng=rng)
+
+            date_format_spec = date_template.fill({ "whitespace" : whitespace_character, "separator" : date_separator, **dmy_tokens })
 
             # -- iterate on time formats --
             # NOTE: time generate8 'format_specs' is a list of formats, with 1 and 2-digit minutes
-            raw_time_format_spec_list = choice(self.time_model.format_specs)
-            raw_time_format_spec = choice(raw_time_format_spec_list)
+            if required_components is None:
+                time_template_list = rng.choice(self.time_templates)
+                time_template = rng.choice(time_template_list)
 
-            time_separator = choice(self.time_model.separators)
+            time_separator = rng.choice(self.time_model.separators)
 
             # generate16.10: iterate on microsecond format
-            microsecond_format = choice(self.time_model.microsecond_formats)
-                
-            raw_time_format_spec = raw_time_format_spec.replace(r"{separator}", time_separator)
-            time_format_spec2 = raw_time_format_spec.replace(r"{whitespace}", whitespace_character)            
-            time_format_spec1 = time_format_spec2.replace(r"{microsecond}", microsecond_format)
+            microsecond_format = rng.choice(self.time_model.microsecond_formats)
 
             # generate16.12: iterate on timezone formats
-            timezone_format = choice(self.time_model.timezone_formats)
-            time_format_spec = time_format_spec1.replace(r"{timezone}", timezone_format)
+            timezone_format = rng.choice(self.time_model.timezone_formats)
+
+            _time_format_spec = time_template.fill({ "whitespace" : whitespace_character
+                                                    , "separator" : time_separator
+                                                    , "microsecond" : microsecond_format
+                                                    , "timezone" : timezone_format
+                                                    })
+            time_format_spec = _time_format_spec.string
 
             # finally, combine date and time by iterating on datetime formats ( date+time or time+date)
-            raw_datetime_format_spec = choice(self.format_spec)
+            datetime_template = rng.choice(self.datetime_templates)
 
             # generate 16.4: iterate on different datetime delimiters
-            datetime_delimiter = choice(self.datetime_delimiters)
-    
-            datetime_format_spec = raw_datetime_format_spec.replace(r"{datetime_delimiter}", datetime_delimiter)
-            datetime_format_spec = datetime_format_spec.replace(r"{date}", date_format_spec )
-            datetime_format_spec = datetime_format_spec.replace(r"{time}", time_format_spec )
+            datetime_delimiter = rng.choice(self.datetime_delimiters)
 
-            _format_spec = datetime_format_spec
+            _format_spec = datetime_template.fill({ "date" : date_format_spec, "time" : _time_format_spec, "datetime_delimiter" : datetime_delimiter })
 
             # choose a random locale
-            locale = choice(self.locales[locale_schema])
+            locale = rng.choice(self.locales[locale_schema])
 
 
             # check that no components are missing; some of the underlying generators create empty strings for some locales
-            _check, _msg = self.verify_null_components(_format_spec, dt=d, locale=locale)
+            if single_pass_rendering:
+                # generate16.23: render each component once; the input string is assembled from these components below
+                try:
+                    rendered_components = self.custom_formatter.render_components(_format_spec.components, d, locale=locale)
+                except UnhandledFormat:
+                    # NOTE: a format that Babel cannot render for this locale (KeyError); other errors are raised
+                    continue
+
+                if self.custom_formatter.find_null_component(rendered_components, _format_spec.components) is not None:
+                    # invalid format
+                    continue
 
-            if not _check:
-                # invalid format
-                continue
+            else:
+                _check, _msg = self.verify_null_components(_format_spec, dt=d, locale=locale)
+
+                if not _check:
+                    # invalid format
+                    continue
 
             # generate16.11: randomly remove a part. e.g {ss}
             component_removed = False
             removed_component = None
 
-            if remove_random_component_probability is not None and uniform(0.0, 1.0) < remove_random_component_probability:
+            if remove_random_component_probability is not None and rng.uniform(0.0, 1.0) < remove_random_component_probability:
                 # NOTE: format_spec will have a random component removed
-                format_spec, removed_component = self.remove_random_component(_format_spec)
+                compiled_format_spec, removed_component = self.remove_random_component(_format_spec, rng=rng)
                 component_removed = True # sanity check below
 
                 # debugging
-                #input_str = self.custom_formatter.apply(format_spec, d, locale=locale)
-                #print(f"Removed component {removed_component} | in : {_format_spec} | out : {format_spec} | input_str : {input_str}")
+                #input_str = self.custom_formatter.apply(compiled_format_spec.string, d, locale=locale)
+                #print(f"Removed component {removed_component} | in : {_format_spec.string} | out : {compiled_format_spec.string} | input_str : {input_str}")
             else:
-                format_spec = _format_spec
+                compiled_format_spec = _format_spec
+
+            format_spec = compiled_format_spec.string
 
           
 
@@ -461,8 +654,13 @@ class Generate:
             # NOTE: custom_formatter also applies Babel formatting
             # NOTE: custom_formatter also applies full normalisation
             # r"{ZZ}" - creates key errors => ignore
+            component_spans = None
             try:
-                input_str = self.custom_formatter.apply(format_spec, d, locale=locale)
+                if single_pass_rendering:
+                    rendered = self.custom_formatter.assemble(compiled_format_spec, rendered_components, spans=store_component_spans)
+                    input_str, component_spans = rendered.string, rendered.spans
+                else:
+                    input_str = self.custom_formatter.apply(format_spec, d, locale=locale)
             except:
                 continue
 
@@ -988,13 +1186,127 @@ class Generate:
                 
                 if aux_info is None:
                     aux_info = {}
-                aux_info["visible_components"] = self.get_visible_components(format_spec)
+                aux_info["visible_components"] = self.get_visible_components(compiled_format_spec)
+
+            # add the format spec to aux
+            if store_format_spec:
+
+                if aux_info is None:
+                    aux_info = {}
+                aux_info["format_spec"] = format_spec
+
+            # add the spans of the components in the input string to aux
+            if store_component_spans:
+
+                if aux_info is None:
+                    aux_info = {}
+                aux_info["component_spans"] = component_spans
 
             # v7: generator function
             idx += 1
             yield (TrainingPair(input=input_str, output=output_str, locale=locale, aux=aux_info), d)
 
 
+    def generate_parallel(self
+                        , output : str
+                        , num_observations : int
+                        , workers : int = None
+                        , chunk_size : int = 10000
+                        , seed : int = None
+                        , **kwargs
+                        ) -> Iterator[ Tuple[ TrainingPair, datetime] ]:
+
+        """
+        generate_parallel: same as generate(), but the observations are generated in chunks by a pool of worker processes
+
+        each chunk is generated by a worker with its own Generate (and CustomFormatter) and its own random stream,
+        seeded deterministically from 'seed' and the index of the chunk (see random_state.shard_seed); the chunks are returned in order
+
+        NOTE: chunk i of a parallel run is the same as a single-process run with seed shard_seed(seed, i)
+
+        :param output: see generate()
+
+        :param num_observations: see generate()
+
+        :param workers: number of worker processes; default is the number of CPUs
+
+        :param chunk_size: number of observations generated by a worker in one go
+
+        :param seed: optional; seed of the run; if None, a random seed is used
+
+        :param kwargs: other parameters of generate(); 'incremental' is not supported
+
+        :return: function is a generator -> an iterator of 2-tuples
+            1. TrainingPairs (namedtuple)
+            2. the input date
+        """
+
+        if kwargs.get("incremental", False):
+            raise ValueError("incremental datetimes cannot be generated in parallel")
+
+        if chunk_size <= 0:
+            raise ValueError(f"chunk_size must be positive; got {chunk_size}")
+
+        if workers is None:
+            workers = cpu_count()
+
+        if seed is None:
+            seed = random_seed()
+
+        # one independent random stream per chunk
+        num_chunks = -(-num_observations // chunk_size)
+        chunk_seeds = shard_seeds(seed, num_chunks)
+
+        chunks = []
+        for chunk_idx, chunk_seed in enumerate(chunk_seeds):
+            chunk_observations = min(chunk_size, num_observations - chunk_idx * chunk_size)
+            chunks.append((output, chunk_observations, chunk_seed, kwargs))
+
+        with TemporaryDirectory() as tmp_dir:
+
+            # the num2words and locale tables are built once, and loaded by the workers so that they start warm
+            locales = self.locales[kwargs.get("locale_schema", "mini.10")]
+
+            number_word_tables_file = join(tmp_dir, "number_word_tables.json")
+            self.custom_formatter.save_number_word_tables(number_word_tables_file, locales=locales)
+
+            locale_tables_file = join(tmp_dir, "locale_tables.json")
+            self.custom_formatter.save_locale_tables(locale_tables_file, locales=locales)
+
+            # NOTE: imap returns the chunks in order
+            with Pool(processes=workers, initializer=_init_worker, initargs=(self.date_model.month_schema, number_word_tables_file, locale_tables_file)) as pool:
+                for observations in pool.imap(_generate_chunk, chunks):
+                    yield from observations
+
+
+# ------------
+# worker state
+# ------------
+
+# generate_parallel: each worker process has its own generator
+_worker_generator = None
+
+def _init_worker(month_schema : str, number_word_tables_file : str = None, locale_tables_file : str = None):
+    global _worker_generator
+    _worker_generator = Generate(month_schema=month_schema)
+
+    if number_word_tables_file is not None:
+        _worker_generator.custom_formatter.load_number_word_tables(number_word_tables_file)
+
+    if locale_tables_file is not None:
+        _worker_generator.custom_formatter.load_locale_tables(locale_tables_file)
+
+def _generate_chunk(chunk : Tuple) -> List[ Tuple[ TrainingPair, datetime] ]:
+    """
+    generate one chunk of observations in a worker process
+
+    :param chunk: 4-tuple (output, num_observations, seed, kwargs of generate())
+    """
+    output, num_observations, chunk_seed, kwargs = chunk
+
+    return list(_worker_generator.generate(output, num_observations, seed=chunk_seed, **kwargs))
+
+
 # ----
 # main
 # ----
@@ -1020,10 +1332,20 @@ if __name__ == "__main__":
         cmd_line_parser.add_argument('--month_schema', type=str, help='month tokens to use (all, arabic, roman, unambiguous)', default="all")
         
         cmd_line_parser.add_argument('--csv', type=str, help='output to a quoted csv', default=None)
+        cmd_line_parser.add_argument('--output_file', type=str, help='output file: .jsonl, .csv, optionally .gz, e.g benchmark.jsonl.gz', default=None)
+        cmd_line_parser.add_argument('--flush_size', type=int, help='number of rows buffered before writing to the output file', default=10000)
         cmd_line_parser.add_argument('--incremental', default=False, dest='incremental', action='store_true', help='incremental datetimes')
         cmd_line_parser.add_argument('--inputs', default=False, dest='inputs', action='store_true', help='only show inputs in compact form')
         cmd_line_parser.add_argument('--targets', default=False, dest='targets', action='store_true', help='only show targets in compact form')
 
+        # parallel generation
+        cmd_line_parser.add_argument('--workers', type=int, help='number of worker processes; if not set, generate in a single process', default=None)
+        cmd_line_parser.add_argument('--chunk_size', type=int, help='number of observations per chunk, when generating with workers', default=10000)
+        cmd_line_parser.add_argument('--seed', type=int, help='seed for a reproducible run', default=None)
+        cmd_line_parser.add_argument('--shard', type=int, help='generate only this shard of the run (requires --seed); same as chunk SHARD of a parallel run', default=None)
+
+        cmd_line_parser.add_argument('--reference_rendering', default=True, dest='single_pass_rendering', action='store_false', help='render each component, then the whole format spec again (slower reference path)')
+
         cmd_line_parser.add_argument('--debug', default=False, dest='debug', action='store_true', help='debugging')
         cmd_line_parser.add_argument('--debug2', default=False, dest='debug2', action='store_true', help='debugging')
         args = cmd_line_parser.parse_args()
@@ -1053,43 +1375,75 @@ if __name__ == "__main__":
 
 
         # generate data
-        results = generator.generate(args.output
-                                    , args.num_observations
-                                    , start_date=start_date
-                                    , end_date=end_date
-                                    , schemas=schemas
-                                    , month_schema=args.month_schema
-                                    , locale_schema=args.locale_schema
-                                    , remove_random_component_probability=args.remove_random_component_probability
-                                    , incremental=args.incremental
-                                    )
+        generate_args = dict(start_date=start_date
+                            , end_date=end_date
+                            , schemas=schemas
+                            , month_schema=args.month_schema
+                            , locale_schema=args.locale_schema
+                            , remove_random_component_probability=args.remove_random_component_probability
+                            , incremental=args.incremental
+                            , single_pass_rendering=args.single_pass_rendering
+                            )
+
+        # columnar output files have a column for the format spec and for each visible component
+        if args.output_file and is_columnar(args.output_file):
+            generate_args.update(store_format_spec=True, store_visible_components=True)
+
+        if args.workers is None:
+            # a shard of a run has its own random stream
+            seed = args.seed
+            if args.shard is not None:
+                if args.seed is None:
+                    raise ValueError("--shard requires --seed")
+                seed = shard_seed(args.seed, args.shard)
+
+            results = generator.generate(args.output, args.num_observations, seed=seed, **generate_args)
+        else:
+            results = generator.generate_parallel(args.output
+                                                , args.num_observations
+                                                , workers=args.workers
+                                                , chunk_size=args.chunk_size
+                                                , seed=args.seed
+                                                , **generate_args
+                                                )
 
 
         # open file
-        if args.csv:
-            file = open(args.csv, "w")
+        # output file; written to a temporary file and renamed on completion
+        sink = None
+        if args.output_file and is_columnar(args.output_file):
+            sink = open_sink(args.output_file, flush_size=args.flush_size, components=generator.possible_components)
+        elif args.output_file:
+            sink = open_sink(args.output_file, flush_size=args.flush_size)
+        elif args.csv:
+            sink = CsvSink(args.csv, flush_size=args.flush_size)
 
         # show output
         counter = 0
-        for _, (training_pair, dt) in enumerate(results, start=1):
+        try:
+            for _, (training_pair, dt) in enumerate(results, start=1):
 
-            counter += 1
+                counter += 1
 
-            if args.inputs:
-                print(training_pair.input)
+                if sink is not None:
+                    sink.write(training_pair, dt)
 
-            elif args.targets:
-                print(training_pair.output)
+                elif args.inputs:
+                    print(training_pair.input)
 
-            elif args.csv:
-                output = f'"{training_pair.input}","{training_pair.output}"\n'
-                file.write(output)
-            
-            else:
-                print(training_pair, "|", dt)
+                elif args.targets:
+                    print(training_pair.output)
+                
+                else:
+                    print(training_pair, "|", dt)
+
+        except BaseException:
+            if sink is not None:
+                sink.abort()
+            raise
 
-        if args.csv:
-            file.close()
+        if sink is not None:
+            sink.close()
 
 
         
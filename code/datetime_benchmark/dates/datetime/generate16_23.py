@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""
+generate16_23.py: importable name of generate16.23.py
+
+"generate16.23" cannot be imported with an import statement because of the dot; this module loads generate16.23.py
+and takes its place, e.g
+
+    from dates.datetime.generate16_23 import Generate
+
+"""
+
+import sys
+from importlib.util import module_from_spec, spec_from_file_location
+from os.path import dirname, join
+
+
+# NOTE: the module is registered under this module's name, so that its functions can be pickled (see generate_parallel)
+_spec = spec_from_file_location(__name__, join(dirname(__file__), "generate16.23.py"))
+_module = module_from_spec(_spec)
+
+sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
@@ -12,7 +12,6 @@ python3 generate14.py format 10 --inputs
 
 from collections import namedtuple
 from datetime import date, datetime, time, timedelta
-from random import choice
 from typing import Any, List, Set, Dict, Tuple, Optional, Union, Iterable, Iterator
 
 # 3rd party
@@ -21,7 +20,9 @@ from pytz import timezone, all_timezones
 
 # locals
 from config import Config as DateConfig
-from random_datetime import random_utc_datetime
+from random_datetime import iter_random_utc_datetimes
+from random_state import Seed, make_rng, numpy_rng
+from timezone_pool import default_timezone_pool
 from custom_formatter import CustomFormatter
 from normalise_whitespace import NormaliseWhitespace
 from normalise_tokens import NormaliseTokens
@@ -59,6 +60,12 @@ class Generate:
 
         self.locales = self.date_config.locales
 
+        # default random stream; see generate(seed=...) for reproducible runs
+        self.rng = make_rng()
+
+        # preloaded timezones, with the range of datetimes each timezone can represent
+        self.timezone_pool = default_timezone_pool()
+
         # generate14: CustomFormatter
         self.custom_formatter = CustomFormatter()
         
@@ -339,6 +346,7 @@ class Generate:
                 , start_date : datetime = None 
                 , schemas : List[str] = None
                 , locale_schema : str = None
+                , seed : Seed = None
                 ) -> Iterator[ Tuple[ TrainingPair, datetime] ]:
 
         """
@@ -349,6 +357,8 @@ class Generate:
 
         :param start_date: optional; start date(time) of the dates; a default value will be generated if None
 
+        :param seed: optional; seed (or random.Random) for a reproducible run; if None, the generator's stream is used
+
         :return: function is a generator -> an iterator of 2-tuples
             1. TrainingPairs (namedtuple)
             2. the input date
@@ -356,6 +366,8 @@ class Generate:
         """
 
         assert isinstance(output, str)
+
+        rng = make_rng(seed) if seed is not None else self.rng
         
         # set start date
         if start_date is None:
@@ -363,42 +375,34 @@ class Generate:
 
         d = start_date
 
+        # random datetimes in the range [start_date; ...], drawn in batches
+        random_datetimes = iter_random_utc_datetimes(start_date, rng=numpy_rng(rng))
+
         # built-in formats
         for idx in range(0, num_observations):
 
             # generate11: generate a random time in the range [start_date; ...] with UTC timezone
-            dt_utc = random_utc_datetime(start_date)
+            dt_utc = next(random_datetimes)
 
             # generate11: iterate on timezones
             # NOTE: calls to astimezone() on certain dates generate OverflowError errors
-            # HACK: select another timezone if this conversion does not work
-            d = None
-            while d is None:
-                
-                this_timezone_name = choice(all_timezones)
-                try:
-                    this_timezone =  timezone(this_timezone_name)
-
-                    # move the UCT datetime to this timezone
-                    d = dt_utc.astimezone(this_timezone)
-                
-                except OverflowError as e:
-                    pass
+            # => the timezone is drawn among the timezones that can represent this datetime
+            d = self.timezone_pool.astimezone(dt_utc, rng)
 
             
          
-            locale = choice(self.locales)
+            locale = rng.choice(self.locales)
                 
             # generate8: iterate on 1-digit and 2-digit minutes
-            format_spec_list = choice(self.format_specs)
-            raw_format_spec = choice(format_spec_list)
-            separator_character = choice(self.separators)
+            format_spec_list = rng.choice(self.format_specs)
+            raw_format_spec = rng.choice(format_spec_list)
+            separator_character = rng.choice(self.separators)
 
             # generate12: iterate on microsecond format
-            microsecond_format = choice(self.microsecond_formats)
+            microsecond_format = rng.choice(self.microsecond_formats)
 
             # generate14: iterate on timezone formats
-            timezone_format = choice(self.timezone_formats)
+            timezone_format = rng.choice(self.timezone_formats)
                         
             # {whitespace} token is replaced with the values from whitespace_characters
             format_spec = raw_format_spec.replace(r"{whitespace}", self.whitespace_character)
@@ -463,6 +467,7 @@ if __name__ == "__main__":
         
         cmd_line_parser.add_argument('--start_date', type=str, help='start datetime', default=None)
         cmd_line_parser.add_argument('--inputs', default=False, dest='inputs', action='store_true', help='only print input sequences')
+        cmd_line_parser.add_argument('--seed', type=int, help='seed for a reproducible run', default=None)
 
         cmd_line_parser.add_argument('--debug', default=False, dest='debug', action='store_true', help='debugging')
         args = cmd_line_parser.parse_args()
@@ -474,7 +479,7 @@ if __name__ == "__main__":
         start_date = datetime.fromisoformat(args.start_date) if args.start_date is not None else None
         print(f"start_date : {start_date}")
 
-        results = generator.generate(args.output, args.num_observations, start_date=start_date)
+        results = generator.generate(args.output, args.num_observations, start_date=start_date, seed=args.seed)
 
         # show output
         for idx, (training_pair, _) in enumerate(results, start=1):
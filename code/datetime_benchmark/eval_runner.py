@@ -0,0 +1,466 @@
+# -*- coding: utf-8 -*-
+"""
+eval_runner.py: Send the inputs of benchmark tasks to a model endpoint and write the predictions, ready for scorer.py
+
+- prompts are sent in batches (--batch_size prompts per request), with at most --concurrency requests in flight
+- failed requests (connection errors, timeouts, 429, 5xx) are retried with exponential backoff and jitter, or after the
+    Retry-After header of the response if any
+- rate limits: a 429 pauses all the requests, and then spaces them out (the spacing shrinks again with each success);
+    --requests_per_second paces the requests from the start
+- completed rows are appended to a checkpoint file as they arrive; a crashed or interrupted run resumes where it stopped
+- with --cache_file, the predictions are also kept in a PredictionCache keyed by (model, parameters, prompt template,
+    input): rows already in the cache are not sent again, e.g a re-run of the same model with the same settings
+
+PROTOCOL (same as mock_endpoint.py)
+- POST a JSON object {"prompts" : [prompt, ...]}, with "model" and "parameters" (decoding parameters) if set
+- the response is a JSON object {"predictions" : [prediction, ...]}, in the same order as the prompts
+- another protocol can be used by overriding EvalRunner.encode() and EvalRunner.decode()
+
+FILES, for a task directory ../../a.2 and --output_dir predictions
+- predictions/a.2.checkpoint.jsonl: {"idx" : ..., "prediction" : ...} per completed row, in order of completion
+- predictions/a.2.jsonl: {"idx" : ..., "prediction" : ...} per row, in the order of benchmark.jsonl; written when all the
+    rows are done, after which the checkpoint is removed
+
+USAGE
+    python3 mock_endpoint.py --task_dirs ../../a.2 ../../year.2 --mode noisy --port 8000 &
+    python3 eval_runner.py --task_dirs ../../a.2 ../../year.2 --endpoint http://127.0.0.1:8000 --output_dir predictions
+    python3 scorer.py --benchmark_dir ../.. --predictions_dir predictions
+
+    # same, with a prediction cache
+    python3 eval_runner.py --task_dirs ../../a.2 --endpoint http://127.0.0.1:8000 --output_dir predictions --model my-model --parameters '{"temperature" : 0}' --cache_file predictions.sqlite
+
+"""
+
+# system
+import asyncio
+import json
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+from os.path import basename, exists, join, normpath
+from random import random
+from time import monotonic, time
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+# locals
+from prediction_cache import PredictionCache, cache_key
+from scorer import find_benchmark_file, load_benchmark
+
+
+# HTTP statuses worth retrying
+RETRY_STATUSES = (408, 429, 500, 502, 503, 504)
+
+# seconds between two requests after a first 429, if the server asks for no wait (e.g Retry-After: 0); below it, no spacing
+MIN_ADAPTIVE_INTERVAL = 0.001
+
+
+class RetryableError(Exception):
+
+    """
+    RetryableError: a request failed, and can be retried
+
+    :param retry_after: optional; seconds to wait before the next request, e.g from a Retry-After header
+    """
+
+    def __init__(self, message : str, retry_after : float = None, rate_limited : bool = False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.rate_limited = rate_limited
+
+
+class EvalRunner:
+
+    """
+    EvalRunner: send the prompts of benchmark tasks to a model endpoint, with batching, bounded concurrency, retries
+    and checkpoints
+    """
+
+    def __init__(self
+                , endpoint : str
+                , concurrency : int = 8
+                , batch_size : int = 8
+                , max_retries : int = 8
+                , backoff : float = 0.5
+                , max_backoff : float = 30.0
+                , timeout : float = 60.0
+                , requests_per_second : float = None
+                , prompt_template : str = "{input}"
+                , headers : Dict[str, str] = None
+                , model : str = None
+                , parameters : Dict[str, Any] = None
+                , cache : PredictionCache = None
+                ):
+        """
+        :param endpoint: URL of the model endpoint, e.g http://127.0.0.1:8000
+
+        :param concurrency: maximum number of requests in flight
+
+        :param batch_size: number of prompts per request
+
+        :param max_retries: number of retries of a request before the run fails
+
+        :param backoff: seconds before the first retry; doubled at each retry, up to max_backoff, with jitter
+
+        :param max_backoff: maximum seconds between two retries
+
+        :param timeout: seconds before a request times out
+
+        :param requests_per_second: optional; maximum rate of requests
+
+        :param prompt_template: prompt of a row, e.g "Convert to ISO 8601: {input}"
+
+        :param headers: optional; extra HTTP headers, e.g {"Authorization" : "Bearer ..."}
+
+        :param model: optional; model id, sent with each request, e.g "my-model-2025-01"
+
+        :param parameters: optional; decoding parameters, sent with each request, e.g {"temperature" : 0}
+
+        :param cache: optional; PredictionCache consulted before sending a row, and filled with the predictions
+        """
+        if concurrency <= 0 or batch_size <= 0:
+            raise ValueError(f"concurrency and batch_size must be positive; got {concurrency} and {batch_size}")
+
+        self.endpoint = endpoint
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.requests_per_second = requests_per_second
+        self.prompt_template = prompt_template
+        self.headers = { "Content-Type" : "application/json", **(headers or {}) }
+        self.model = model
+        self.parameters = parameters
+        self.cache = cache
+
+        # NOTE: urllib is blocking: each request in flight runs in a thread
+        self.executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        # monotonic time before which no request is sent (set by 429 responses), and of the next request slot
+        self.paused_until = 0.0
+        self.next_slot = 0.0
+
+        # seconds between two requests, learnt from 429 responses: increased by a 429, relaxed by each success
+        # NOTE: increased once per burst of 429s, i.e only by the requests sent after the last increase
+        self.adaptive_interval = 0.0
+        self.adapted_at = 0.0
+
+        # requests, retries, 429 responses and rows found in the cache so far
+        self.stats = { "requests" : 0, "retries" : 0, "rate_limited" : 0, "cached" : 0 }
+
+    def encode(self, prompts : List[str]) -> bytes:
+        """
+        encode: body of the request of a batch of prompts
+        """
+        body = { "prompts" : prompts }
+
+        if self.model is not None:
+            body["model"] = self.model
+
+        if self.parameters is not None:
+            body["parameters"] = self.parameters
+
+        return json.dumps(body).encode("utf-8")
+
+    def decode(self, body : bytes, num_prompts : int) -> List[str]:
+        """
+        decode: predictions of the response body of a batch of num_prompts prompts
+        """
+        predictions = json.loads(body)["predictions"]
+
+        if len(predictions) != num_prompts:
+            raise RetryableError(f"Expected {num_prompts} predictions, got {len(predictions)}")
+
+        return predictions
+
+    def post(self, prompts : List[str]) -> List[str]:
+        """
+        post: send one request (blocking)
+
+        :raises RetryableError: if the request can be retried
+        """
+        request = Request(self.endpoint, data=self.encode(prompts), headers=self.headers, method="POST")
+
+        try:
+            with urlopen(request, timeout=self.timeout) as response:
+                return self.decode(response.read(), len(prompts))
+
+        except HTTPError as e:
+            if e.code not in RETRY_STATUSES:
+                raise RuntimeError(f"{self.endpoint}: HTTP {e.code} {e.reason}")
+
+            retry_after = e.headers.get("Retry-After") if e.headers is not None else None
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                # NOTE: an HTTP date is ignored, i.e the request is retried after the backoff
+                retry_after = None
+
+            raise RetryableError(f"HTTP {e.code}", retry_after=retry_after, rate_limited=e.code == 429)
+
+        except (URLError, ConnectionError, socket.timeout) as e:
+            raise RetryableError(str(e))
+
+    def interval(self) -> float:
+        """
+        interval: minimum seconds between two requests, from requests_per_second and from the 429 responses so far
+        """
+        interval = 1.0 / self.requests_per_second if self.requests_per_second is not None else 0.0
+
+        return max(interval, self.adaptive_interval)
+
+    async def wait_turn(self):
+        """
+        wait_turn: wait for a pause (429) to end, and for the next request slot
+        """
+        while True:
+            now = monotonic()
+            start = max(self.paused_until, self.next_slot, now)
+
+            if start <= now:
+                break
+
+            await asyncio.sleep(start - now)
+
+        # NOTE: the slot is taken before the request is sent, so that the requests waiting for a slot are spread out
+        self.next_slot = max(self.next_slot, monotonic()) + self.interval()
+
+    async def request(self, prompts : List[str]) -> List[str]:
+        """
+        request: send a batch of prompts, with retries
+
+        :return: predictions, in the same order as the prompts
+        """
+        loop = asyncio.get_running_loop()
+
+        for attempt in range(self.max_retries + 1):
+            await self.wait_turn()
+            self.stats["requests"] += 1
+            sent_at = monotonic()
+
+            try:
+                predictions = await loop.run_in_executor(self.executor, self.post, prompts)
+
+                self.adaptive_interval = self.adaptive_interval * 0.98 if self.adaptive_interval > MIN_ADAPTIVE_INTERVAL else 0.0
+
+                return predictions
+
+            except RetryableError as e:
+                if attempt == self.max_retries:
+                    raise RuntimeError(f"{self.endpoint}: {e} after {self.max_retries} retries")
+
+                self.stats["retries"] += 1
+
+                # NOTE: the server's Retry-After, if any, takes precedence over the backoff; with jitter, so that the
+                # paused requests are not all sent again at once
+                if e.retry_after is not None:
+                    delay = min(e.retry_after, self.max_backoff) * (1.0 + random())
+                else:
+                    delay = min(self.backoff * 2 ** attempt, self.max_backoff) * (0.5 + random())
+
+                if e.rate_limited:
+                    # NOTE: every request waits, not only this one, and the requests are then spaced out
+                    self.stats["rate_limited"] += 1
+                    self.paused_until = max(self.paused_until, monotonic() + delay)
+                    if sent_at >= self.adapted_at:
+                        retry_after = e.retry_after if e.retry_after is not None else self.backoff
+                        self.adaptive_interval = min(max(1.5 * self.adaptive_interval, retry_after, MIN_ADAPTIVE_INTERVAL), self.max_backoff)
+                        self.adapted_at = monotonic()
+
+                await asyncio.sleep(delay)
+
+    async def run_task(self, task_dir : str, output_dir : str, max_rows : int = None) -> Tuple[str, int, int]:
+        """
+        run_task: predictions of all the rows of a task, resumed from its checkpoint if any
+
+        :param task_dir: task directory, e.g ../../a.2
+
+        :param output_dir: directory of the predictions and checkpoint files
+
+        :param max_rows: optional; stop after this many rows in total (e.g to test resuming); the predictions file is
+            written only when all the rows are done
+
+        :return: 3-tuple: task name, number of rows, number of rows predicted by this run (sent or found in the cache)
+        """
+        task = basename(normpath(task_dir))
+
+        benchmark_file = find_benchmark_file(task_dir)
+        if benchmark_file is None:
+            raise ValueError(f"No benchmark file in {task_dir}")
+
+        rows = load_benchmark(benchmark_file)
+        predictions_file = join(output_dir, task + ".jsonl")
+        checkpoint_file = join(output_dir, task + ".checkpoint.jsonl")
+
+        if exists(predictions_file):
+            return task, len(rows), 0
+
+        predictions = read_checkpoint(checkpoint_file)
+        pending = [idx for idx in range(len(rows)) if idx not in predictions]
+        if max_rows is not None:
+            pending = pending[:max(max_rows - len(predictions), 0)]
+
+        num_pending = len(pending)
+        keys = { idx : cache_key(self.model, self.parameters, self.prompt_template, rows[idx]["input"]) for idx in pending } if self.cache is not None else {}
+
+        with open(checkpoint_file, "a", encoding="utf-8") as checkpoint:
+
+            def complete(batch : List[int], batch_predictions : List[Optional[str]]):
+                # NOTE: one write per batch, flushed, so that a crash loses at most the batches in flight
+                checkpoint.write("".join(json.dumps({ "idx" : idx, "prediction" : prediction }) + "\n" for idx, prediction in zip(batch, batch_predictions)))
+                checkpoint.flush()
+                predictions.update(zip(batch, batch_predictions))
+
+            # rows in the cache: all looked up at once, and not sent
+            if self.cache is not None:
+                cached = self.cache.get_many(keys.values())
+                hits = [idx for idx in pending if keys[idx] in cached]
+
+                complete(hits, [cached[keys[idx]] for idx in hits])
+                self.stats["cached"] += len(hits)
+
+                pending = [idx for idx in pending if keys[idx] not in cached]
+
+            batches = asyncio.Queue()
+            for start in range(0, len(pending), self.batch_size):
+                batches.put_nowait(pending[start:start + self.batch_size])
+
+            async def worker():
+                while not batches.empty():
+                    batch = batches.get_nowait()
+                    batch_predictions = await self.request([self.prompt_template.format(input=rows[idx]["input"]) for idx in batch])
+
+                    complete(batch, batch_predictions)
+
+                    if self.cache is not None:
+                        self.cache.put_many((keys[idx], prediction) for idx, prediction in zip(batch, batch_predictions))
+
+            # NOTE: on the first error (or if the run is cancelled), the other workers are cancelled and awaited before the
+            # checkpoint is closed, so that no request is sent and no batch is completed after the run has failed
+            workers = [asyncio.create_task(worker()) for _ in range(self.concurrency)]
+            try:
+                done, _ = await asyncio.wait(workers, return_when=asyncio.FIRST_EXCEPTION)
+            finally:
+                for worker_task in workers:
+                    worker_task.cancel()
+                await asyncio.gather(*workers, return_exceptions=True)
+
+            for worker_task in done:
+                worker_task.result()
+
+        if len(predictions) == len(rows):
+            write_predictions(predictions_file, [predictions[idx] for idx in range(len(rows))])
+            os.remove(checkpoint_file)
+
+        return task, len(rows), num_pending
+
+    async def run(self, task_dirs : List[str], output_dir : str, max_rows : int = None) -> List[Tuple[str, int, int]]:
+        """
+        run: run_task() for each task, one after the other
+        """
+        os.makedirs(output_dir, exist_ok=True)
+
+        try:
+            return [await self.run_task(task_dir, output_dir, max_rows=max_rows) for task_dir in task_dirs]
+        finally:
+            self.executor.shutdown(wait=False)
+
+
+def read_checkpoint(filename : str) -> Dict[int, Optional[str]]:
+    """
+    read_checkpoint: predictions of a checkpoint file, idx => prediction; empty if there is no checkpoint
+
+    NOTE: a truncated last line (e.g a crash while writing) is ignored, i.e its rows are predicted again
+    """
+    predictions = {}
+
+    if not exists(filename):
+        return predictions
+
+    with open(filename, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+
+            predictions[row["idx"]] = row["prediction"]
+
+    return predictions
+
+
+def write_predictions(filename : str, predictions : List[Optional[str]]):
+    """
+    write_predictions: predictions file of a task, in the order of benchmark.jsonl; see scorer.load_predictions()
+    """
+    temp_filename = filename + ".tmp"
+
+    with open(temp_filename, "w", encoding="utf-8") as f:
+        for idx, prediction in enumerate(predictions):
+            f.write(json.dumps({ "idx" : idx, "prediction" : prediction }) + "\n")
+
+    os.replace(temp_filename, filename)
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='send the inputs of benchmark tasks to a model endpoint and write the predictions')
+        cmd_line_parser.add_argument('--task_dirs', type=str, nargs='+', required=True, help='task directories, e.g ../../a.2 ../../year.2')
+        cmd_line_parser.add_argument('--endpoint', type=str, required=True, help='URL of the model endpoint, e.g http://127.0.0.1:8000')
+        cmd_line_parser.add_argument('--output_dir', type=str, required=True, help='directory of the predictions files, e.g predictions')
+        cmd_line_parser.add_argument('--concurrency', type=int, default=8, help='maximum number of requests in flight')
+        cmd_line_parser.add_argument('--batch_size', type=int, default=8, help='number of prompts per request')
+        cmd_line_parser.add_argument('--max_retries', type=int, default=8, help='number of retries of a request before the run fails')
+        cmd_line_parser.add_argument('--timeout', type=float, default=60.0, help='seconds before a request times out')
+        cmd_line_parser.add_argument('--requests_per_second', type=float, default=None, help='optional; maximum rate of requests')
+        cmd_line_parser.add_argument('--prompt_template', type=str, default='{input}', help='prompt of a row, e.g "Convert to ISO 8601: {input}"')
+        cmd_line_parser.add_argument('--model', type=str, default=None, help='optional; model id, sent with each request and part of the cache key')
+        cmd_line_parser.add_argument('--parameters', type=str, default=None, help='optional; decoding parameters as a JSON object, e.g \'{"temperature" : 0}\'')
+        cmd_line_parser.add_argument('--cache_file', type=str, default=None, help='optional; SQLite prediction cache, e.g predictions.sqlite')
+        cmd_line_parser.add_argument('--cache_max_mb', type=float, default=None, help='optional; maximum size of the cached predictions')
+        cmd_line_parser.add_argument('--max_rows', type=int, default=None, help='optional; stop after this many rows per task; the run can be resumed')
+        args = cmd_line_parser.parse_args()
+
+        cache = None
+        if args.cache_file is not None:
+            cache = PredictionCache(args.cache_file, max_bytes=int(args.cache_max_mb * 2**20) if args.cache_max_mb is not None else None)
+
+        runner = EvalRunner(args.endpoint
+                            , concurrency=args.concurrency
+                            , batch_size=args.batch_size
+                            , max_retries=args.max_retries
+                            , timeout=args.timeout
+                            , requests_per_second=args.requests_per_second
+                            , prompt_template=args.prompt_template
+                            , model=args.model
+                            , parameters=json.loads(args.parameters) if args.parameters is not None else None
+                            , cache=cache
+                            )
+
+        start = time()
+        results = asyncio.run(runner.run(args.task_dirs, args.output_dir, max_rows=args.max_rows))
+        elapsed = time() - start
+
+        for task, num_rows, num_predicted in results:
+            print(f"{task}: {num_predicted} rows predicted ({num_rows} rows)")
+
+        num_predicted = sum(result[2] for result in results)
+        print(f"{num_predicted} rows in {elapsed:.2f}s ({num_predicted / max(elapsed, 1e-9):.0f} rows/sec); {runner.stats}")
+
+        if cache is not None:
+            print(f"cache: {cache.stats()}")
+            cache.close()
+
+
+    # main entry point
+    main()
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+format_template.py: Precompiled format specs
+
+A raw format spec such as "{day}{separator}{month}{separator}{yyyy}" is compiled once into a tuple of slots:
+    - literals, e.g "."
+    - tokens, i.e the components of the datetime, e.g {yyyy}
+    - placeholders, to be filled for each observation, e.g {separator}, {day}
+
+Filling the placeholders of a template generates a FormatSpec, which carries the list of its components so that
+they do not have to be found again in the string with a regex.
+
+EXAMPLES
+    template = FormatTemplate(r"{day}{separator}{month}{separator}{yyyy}", placeholders=["day", "month", "separator"])
+
+    format_spec = template.fill({"day" : "{dd}", "month" : "{MMM}", "separator" : "-"})
+
+    format_spec.string      # {dd}-{MMM}-{yyyy}
+    format_spec.components  # ('{dd}', '{MMM}', '{yyyy}')
+
+NOTE: a placeholder can be filled with a literal (e.g "-"), a token (e.g "{dd}") or another FormatSpec
+    (e.g the date part of a datetime)
+
+"""
+
+# system
+from re import compile
+from typing import Dict, Iterable, NamedTuple, Tuple, Union
+
+
+# a component or placeholder in curly braces, e.g {dd}, {C(day)}
+# NOTE: same regex as Generate.regex_find_component in generate16.23
+REGEX_FIND_COMPONENT = compile(r"{(?:[^{}])*}")
+
+# slot types
+LITERAL = 0
+TOKEN = 1
+PLACEHOLDER = 2
+
+
+def is_token(piece : str) -> bool:
+    """
+    is_token: True if the piece of a format spec is a token (component) in curly braces, e.g {dd}
+    """
+    return len(piece) > 1 and piece[0] == "{" and piece[-1] == "}"
+
+
+class FormatSpec(NamedTuple):
+
+    """
+    FormatSpec: a format spec, ready to be rendered by the CustomFormatter
+    """
+
+    string : str                # the format spec, e.g {dd}-{MMM}-{yyyy}
+    pieces : Tuple[str, ...]    # literals and tokens, in order, e.g ('{dd}', '-', '{MMM}', '-', '{yyyy}')
+    components : Tuple[str, ...] # tokens only, in order, e.g ('{dd}', '{MMM}', '{yyyy}')
+
+    @classmethod
+    def from_pieces(cls, pieces : Iterable[str]) -> "FormatSpec":
+        pieces = tuple(piece for piece in pieces if piece)
+        return cls("".join(pieces), pieces, tuple(piece for piece in pieces if is_token(piece)))
+
+    @classmethod
+    def parse(cls, format_spec : str) -> "FormatSpec":
+        """
+        parse: create a FormatSpec from a format string, e.g {h} {a} {m}:{ss}
+        """
+        return FormatTemplate(format_spec).fill({})
+
+    def remove_component(self, component : str) -> "FormatSpec":
+        """
+        remove_component: remove a component, e.g {ss}; the component is simply replaced with a blank string
+
+        :return: a new FormatSpec
+        """
+        return FormatSpec.from_pieces(piece for piece in self.pieces if piece != component)
+
+
+class FormatTemplate:
+
+    """
+    FormatTemplate: a raw format spec, compiled into literal, token and placeholder slots
+    """
+
+    def __init__(self, raw_format_spec : str, placeholders : Iterable[str] = ()):
+        """
+        :param raw_format_spec: e.g {day}{separator}{month}{separator}{yyyy}
+
+        :param placeholders: names of the placeholders to be filled, e.g ["day", "month", "separator"]
+            any other name in curly braces is a token, e.g {yyyy}
+        """
+
+        self.raw_format_spec = raw_format_spec
+
+        placeholders = set(placeholders)
+
+        slots = []
+        position = 0
+        for match in REGEX_FIND_COMPONENT.finditer(raw_format_spec):
+
+            if match.start() > position:
+                slots.append((LITERAL, raw_format_spec[position : match.start()]))
+
+            name = match.group(0)[1:-1]
+            if name in placeholders:
+                slots.append((PLACEHOLDER, name))
+            else:
+                slots.append((TOKEN, match.group(0)))
+
+            position = match.end()
+
+        if position < len(raw_format_spec):
+            slots.append((LITERAL, raw_format_spec[position:]))
+
+        self.slots = tuple(slots)
+
+        # placeholders present in this template, e.g {"day", "month", "separator"}
+        self.placeholders = frozenset(value for slot_type, value in self.slots if slot_type == PLACEHOLDER)
+
+        # tokens present in this template, independently of the placeholders, e.g ("{yyyy}",)
+        self.tokens = tuple(value for slot_type, value in self.slots if slot_type == TOKEN)
+
+    def __repr__(self):
+        return f"FormatTemplate({self.raw_format_spec!r})"
+
+    def fill(self, values : Dict[str, Union[str, FormatSpec]]) -> FormatSpec:
+        """
+        fill: fill the placeholders
+
+        :param values: value of each placeholder; a literal, a token (e.g {dd}) or a FormatSpec
+
+        :return: FormatSpec
+        """
+
+        pieces = []
+        for slot_type, value in self.slots:
+
+            if slot_type == PLACEHOLDER:
+                value = values[value]
+
+                if isinstance(value, FormatSpec):
+                    pieces.extend(value.pieces)
+                    continue
+
+            if value:
+                pieces.append(value)
+
+        return FormatSpec("".join(pieces), tuple(pieces), tuple(piece for piece in pieces if is_token(piece)))
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+locale_tables.py: Tables of the names Babel renders for a locale, e.g month names {MMM}, weekday names {EEEE}, AM/PM {a}
+
+For a given locale, a name field has only a few possible values (12 months, 7 weekdays, 2 periods, 4 quarters, 1 era);
+the values are rendered once with Babel, and then looked up by index instead of formatting each datetime with Babel.
+
+NAME FIELDS
+- month: M, L with 3 to 5 letters, e.g MMM => "Apr"
+- weekday: E, e, c, e.g EEEE => "Sunday"
+- period: a, e.g a => "PM"
+- quarter: Q, q, e.g QQQ => "Q2"
+- era: G, e.g G => "AD"
+
+NOTES
+- the tables are filled by rendering a representative datetime of each value with Babel, so a lookup gives the same string
+    as Babel; the strings are not normalised (see CustomFormatter.normalise_cache_size)
+- fields that Babel cannot render for a locale (KeyError, ValueError) are not tabulated: rendering falls back to Babel,
+    which raises the same error
+- the other fields (numbers, timezone names and offsets, ...) depend on more than an index, and are rendered by Babel
+- the tables are built on first use, one (locale, field) at a time; with ~800 locales (babel.all) they can be built once
+    and saved, e.g for worker processes to start warm
+
+USAGE
+    locale_tables = LocaleTables()
+
+    locale_tables.render("MMM", dt, "fr_FR")        # "avr.", same as format_datetime(dt, "MMM", locale="fr_FR")
+    locale_tables.render("dd", dt, "fr_FR")         # None: not a name field
+
+    # prebuild and save the tables of all Babel locales
+    python3 locale_tables.py --locale_schema babel.all --output_file locale_tables.json
+
+"""
+
+# system
+import json
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional, Tuple, Union
+
+# 3rd party
+import babel.dates
+from babel import Locale
+from babel.localedata import locale_identifiers
+
+
+# Monday 1 January 2001; weekday 0
+REFERENCE_DATETIME = datetime(2001, 1, 1)
+
+# name kinds: number of values, representative datetime of each value (0-based index), index of a datetime
+NAME_KINDS : Dict[str, Tuple[int, Callable[[int], datetime], Callable[[Union[date, datetime]], int]]] = {
+    "month" : (12, lambda idx : REFERENCE_DATETIME.replace(month=idx + 1), lambda dt : dt.month - 1)
+    , "weekday" : (7, lambda idx : REFERENCE_DATETIME + timedelta(days=idx), lambda dt : dt.weekday())
+    , "period" : (2, lambda idx : REFERENCE_DATETIME.replace(hour=12 * idx), lambda dt : int(getattr(dt, "hour", 0) >= 12))
+    , "quarter" : (4, lambda idx : REFERENCE_DATETIME.replace(month=3 * idx + 1), lambda dt : (dt.month - 1) // 3)
+    # NOTE: datetime years are positive, i.e always the same era
+    , "era" : (1, lambda idx : REFERENCE_DATETIME, lambda dt : 0)
+}
+
+# field => name kind, e.g "MMM" => "month"
+NAME_FIELDS : Dict[str, str] = {
+    **{ char * num : "month" for char in "ML" for num in range(3, 6) }
+    , **{ char * num : "weekday" for char in "Eec" for num in range(1, 7) }
+    , **{ "a" * num : "period" for num in range(1, 6) }
+    , **{ char * num : "quarter" for char in "Qq" for num in range(1, 6) }
+    , **{ "G" * num : "era" for num in range(1, 6) }
+}
+
+
+class LocaleTables:
+
+    """
+    LocaleTables: names rendered by Babel for each locale and name field, looked up by index
+    """
+
+    def __init__(self, filename : str = None):
+        """
+        :param filename: optional; tables saved with save(); if None, the tables are built on first use
+        """
+
+        # Locale objects, e.g "en_US" => Locale("en", territory="US")
+        self.locale_cache = {}
+
+        # (locale, field) => tuple of names, indexed as in NAME_KINDS; None if the field cannot be tabulated for the locale
+        self.tables : Dict[Tuple[str, str], Optional[Tuple[str, ...]]] = {}
+
+        if filename is not None:
+            self.load(filename)
+
+    def get_locale(self, locale : str) -> Locale:
+        babel_locale = self.locale_cache.get(locale)
+
+        if babel_locale is None:
+            babel_locale = Locale.parse(locale)
+            self.locale_cache[locale] = babel_locale
+
+        return babel_locale
+
+    def build_table(self, locale : str, field : str) -> Optional[Tuple[str, ...]]:
+        """
+        build_table: render each value of a name field with Babel
+
+        :param locale: e.g "fr_FR"
+
+        :param field: one of NAME_FIELDS, e.g "MMM"
+
+        :return: tuple of names, indexed as in NAME_KINDS; None if Babel cannot render the field for this locale
+        """
+        num_values, representative, _ = NAME_KINDS[NAME_FIELDS[field]]
+        babel_locale = self.get_locale(locale)
+
+        try:
+            return tuple(babel.dates.DateTimeFormat(representative(idx), babel_locale)[field] for idx in range(num_values))
+        except (KeyError, ValueError):
+            return None
+
+    def table(self, locale : str, field : str) -> Optional[Tuple[str, ...]]:
+        """
+        table: the table of a name field for a locale, built on first use
+
+        :return: see build_table()
+        """
+        key = (locale, field)
+
+        try:
+            return self.tables[key]
+        except KeyError:
+            table = self.tables[key] = self.build_table(locale, field)
+            return table
+
+    def render(self, field : str, dt : Union[date, datetime], locale : str) -> Optional[str]:
+        """
+        render: render a name field, e.g "MMM" => "Apr"
+
+        :param field: a Babel field, without curly brackets, e.g "MMM"
+
+        :param dt: date or datetime
+
+        :param locale: locale name, e.g "en_US"
+
+        :return: same string as Babel; None if the field is not tabulated, i.e it should be rendered by Babel
+        """
+        kind = NAME_FIELDS.get(field)
+        if kind is None:
+            return None
+
+        table = self.table(str(locale), field)
+        if table is None:
+            return None
+
+        return table[NAME_KINDS[kind][2](dt)]
+
+    def build(self, locales : Iterable[str]):
+        """
+        build: build the tables of all name fields for the locales, e.g before save()
+        """
+        for locale in locales:
+            for field in NAME_FIELDS:
+                self.table(locale, field)
+
+    def save(self, filename : str, locales : Iterable[str] = None):
+        """
+        save: save the tables built so far to a json file
+
+        :param filename: e.g locale_tables.json
+
+        :param locales: optional; build the tables of these locales first, e.g all locales of a locale schema
+        """
+        if locales is not None:
+            self.build(locales)
+
+        tables = { f"{locale}|{field}" : table for (locale, field), table in self.tables.items() }
+
+        with open(filename, "w", encoding="utf-8") as file:
+            json.dump(tables, file, ensure_ascii=False)
+
+    def load(self, filename : str):
+        """
+        load: load tables saved with save()
+        """
+        with open(filename, "r", encoding="utf-8") as file:
+            tables = json.load(file)
+
+        for key, table in tables.items():
+            locale, field = key.split("|")
+
+            if field not in NAME_FIELDS:
+                raise ValueError(f"Invalid locale table '{key}' in {filename}: unknown field '{field}'")
+
+            num_values = NAME_KINDS[NAME_FIELDS[field]][0]
+            if table is not None and len(table) != num_values:
+                raise ValueError(f"Invalid locale table '{key}' in {filename}: expected {num_values} names, found {len(table)}")
+
+            self.tables[(locale, field)] = tuple(table) if table is not None else None
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+    from time import time
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='build and save the locale tables')
+        cmd_line_parser.add_argument('--locale_schema', type=str, default='babel.all', help='locales: babel.all or a comma separated list of locales, e.g en_US,fr_FR')
+        cmd_line_parser.add_argument('--output_file', type=str, required=True, help='json file, e.g locale_tables.json')
+        args = cmd_line_parser.parse_args()
+
+        locales = list(locale_identifiers()) if args.locale_schema == 'babel.all' else args.locale_schema.split(',')
+
+        start = time()
+
+        locale_tables = LocaleTables()
+        locale_tables.save(args.output_file, locales=locales)
+
+        print(f"{len(locale_tables.tables)} tables for {len(locales)} locales in {time() - start:.1f}s => {args.output_file}")
+
+
+    # main entry point
+    main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+lru_cache.py: A bounded cache with least-recently-used eviction and hit/miss/eviction counters
+
+Unlike functools.lru_cache, the cache is an object that can be owned by another object (e.g a formatter),
+inspected, cleared and sized per instance.
+
+USAGE
+    cache = LRUCache(maxsize=1000)
+
+    value = cache.get(key)
+    if value is None:
+        value = compute(key)
+        cache.put(key, value)
+
+    # or, equivalently
+    value = cache.get_or_compute(key, compute)
+
+    cache.stats()   # {'size': 1, 'maxsize': 1000, 'hits': 0, 'misses': 1, 'evictions': 0}
+
+"""
+
+# system
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class LRUCache:
+
+    """
+    LRUCache: a bounded mapping; when full, the least recently used entry is evicted
+    """
+
+    def __init__(self, maxsize : int = 1024):
+        """
+        :param maxsize: maximum number of entries; must be positive
+        """
+        if maxsize <= 0:
+            raise ValueError(f"maxsize must be positive; got {maxsize}")
+
+        self.maxsize = maxsize
+
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key : Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key : Hashable, default : Any = None) -> Any:
+        """
+        get: look up a key, and mark it as the most recently used
+
+        :return: the value, or default if the key is not in the cache
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            return default
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key : Hashable, value : Any):
+        """
+        put: add or replace an entry; evict the least recently used entry if the cache is full
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def get_or_compute(self, key : Hashable, compute : Callable[[Hashable], Any]) -> Any:
+        """
+        get_or_compute: look up a key; on a miss, compute the value with compute(key) and cache it
+
+        NOTE: exceptions raised by compute() are propagated, and nothing is cached
+        """
+        try:
+            value = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            value = compute(key)
+            self.put(key, value)
+            return value
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def clear(self):
+        """
+        clear: remove all entries; counters are kept
+        """
+        self.entries.clear()
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        stats: size and counters of the cache
+
+        :return: dict with keys size, maxsize, hits, misses, evictions
+        """
+        return { "size" : len(self.entries)
+                , "maxsize" : self.maxsize
+                , "hits" : self.hits
+                , "misses" : self.misses
+                , "evictions" : self.evictions
+                }
@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+mock_endpoint.py: Local stand-in for a model endpoint, built from the targets of benchmark tasks, e.g to test eval_runner.py offline
+
+PROTOCOL (same as eval_runner.py)
+- POST a JSON object {"prompts" : [prompt, ...]}
+- the response is a JSON object {"predictions" : [prediction, ...]}, in the same order as the prompts
+
+MODES
+- echo: the prediction is the prompt
+- oracle: the prediction is the target of the prompt, i.e a perfect model
+- noisy: the target, except for a share of the prompts (--noise): the date shifted by a few days, or an unparsable answer
+- a prompt that is not in the tasks gets an empty prediction (oracle, noisy)
+
+FAILURES
+- --latency: seconds per request, e.g 0.05
+- --max_requests_per_second: above this rate (after a burst of one second of requests), requests get 429 Too Many
+    Requests with a Retry-After header
+- --error_rate: share of the requests that get 500 Internal Server Error
+
+USAGE
+    python3 mock_endpoint.py --task_dirs ../../a.2 ../../year.2 --mode noisy --port 8000
+
+    # in-process, e.g in a script
+    endpoint = MockEndpoint(MockModel(prompts, targets, mode="oracle"))
+    endpoint.start()
+    ...
+    endpoint.stop()
+
+"""
+
+# system
+import json
+import threading
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from random import Random
+from time import monotonic, sleep
+from typing import List, Optional
+
+# locals
+from scorer import find_benchmark_file, load_benchmark
+
+
+MODES = ("echo", "oracle", "noisy")
+
+
+class MockServer(ThreadingHTTPServer):
+
+    """
+    MockServer: one thread per request, with a listen backlog for many concurrent clients
+    """
+
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class MockModel:
+
+    """
+    MockModel: answers prompts from the targets of benchmark tasks
+    """
+
+    def __init__(self, prompts : List[str], targets : List[str], mode : str = "oracle", noise : float = 0.2, seed : int = 0):
+        """
+        :param prompts: prompts, e.g the inputs of benchmark.jsonl
+
+        :param targets: target of each prompt
+
+        :param mode: echo, oracle or noisy
+
+        :param noise: share of wrong predictions in noisy mode
+
+        :param seed: seed of the noisy predictions
+        """
+        if mode not in MODES:
+            raise ValueError(f"Invalid mode '{mode}'; expected one of {MODES}")
+
+        self.answers = dict(zip(prompts, targets))
+        self.mode = mode
+        self.noise = noise
+        self.rng = Random(seed)
+
+        # NOTE: the handler threads share the random generator
+        self.lock = threading.Lock()
+
+    def perturb(self, target : str) -> str:
+        """
+        perturb: a wrong prediction, e.g the date shifted by a few days, or an unparsable answer
+        """
+        with self.lock:
+            shift = self.rng.choice([-3, -2, -1, 1, 2, 3])
+            unparsable = self.rng.random() < 0.25
+
+        if unparsable:
+            return f"The answer is {target}."
+
+        if target.isdigit():
+            return str(max(int(target) + shift, 0))
+
+        try:
+            return (datetime.fromisoformat(target) + timedelta(days=shift)).isoformat()
+        except (ValueError, OverflowError):
+            return target[::-1]
+
+    def predict(self, prompt : str) -> str:
+        """
+        predict: the prediction of a prompt
+        """
+        if self.mode == "echo":
+            return prompt
+
+        target = self.answers.get(prompt)
+        if target is None:
+            return ""
+
+        if self.mode == "noisy":
+            with self.lock:
+                wrong = self.rng.random() < self.noise
+
+            if wrong:
+                return self.perturb(target)
+
+        return target
+
+
+class MockEndpoint:
+
+    """
+    MockEndpoint: HTTP server answering {"prompts" : [...]} with {"predictions" : [...]}
+    """
+
+    def __init__(self
+                , model : MockModel
+                , host : str = "127.0.0.1"
+                , port : int = 0
+                , latency : float = 0.0
+                , max_requests_per_second : float = None
+                , error_rate : float = 0.0
+                , seed : int = 0
+                ):
+        """
+        :param model: MockModel
+
+        :param host: host of the server
+
+        :param port: port of the server; 0 for any free port, see url
+
+        :param latency: seconds slept per request
+
+        :param max_requests_per_second: optional; above this rate, requests get 429 with a Retry-After header
+
+        :param error_rate: share of the requests that get 500
+
+        :param seed: seed of the errors
+        """
+        self.model = model
+        self.latency = latency
+        self.max_requests_per_second = max_requests_per_second
+        self.error_rate = error_rate
+        self.rng = Random(seed)
+
+        # requests, prompts, 429 and 500 responses so far
+        self.stats = { "requests" : 0, "prompts" : 0, "rate_limited" : 0, "errors" : 0 }
+
+        # NOTE: token bucket: max_requests_per_second tokens per second, up to a burst of one second of requests
+        self.lock = threading.Lock()
+        self.capacity = max(max_requests_per_second or 0.0, 1.0)
+        self.tokens = self.capacity
+        self.refilled_at = monotonic()
+
+        self.server = MockServer((host, port), self.handler_class())
+        self.thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def admit(self) -> Optional[int]:
+        """
+        admit: check a new request against the rate limit and the error rate
+
+        :return: None if the request is served; else the HTTP status, 429 or 500
+        """
+        with self.lock:
+            self.stats["requests"] += 1
+
+            if self.max_requests_per_second is not None:
+                now = monotonic()
+                self.tokens = min(self.tokens + (now - self.refilled_at) * self.max_requests_per_second, self.capacity)
+                self.refilled_at = now
+
+                if self.tokens < 1.0:
+                    self.stats["rate_limited"] += 1
+                    return 429
+
+                self.tokens -= 1.0
+
+            if self.rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500
+
+        return None
+
+    def handler_class(self):
+        endpoint = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                # NOTE: the body is read before any response, so that the client can always send it
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+                status = endpoint.admit()
+
+                if status == 429:
+                    # NOTE: seconds until the next token
+                    with endpoint.lock:
+                        retry_after = (1.0 - endpoint.tokens) / endpoint.max_requests_per_second
+                    self.respond(429, { "error" : "rate limited" }, { "Retry-After" : f"{retry_after:.3f}" })
+                    return
+
+                if status == 500:
+                    self.respond(500, { "error" : "internal error" })
+                    return
+
+                try:
+                    prompts = json.loads(body)["prompts"]
+                except (ValueError, KeyError, TypeError):
+                    self.respond(400, { "error" : "expected {\"prompts\" : [...]}" })
+                    return
+
+                if endpoint.latency > 0:
+                    sleep(endpoint.latency)
+
+                with endpoint.lock:
+                    endpoint.stats["prompts"] += len(prompts)
+
+                self.respond(200, { "predictions" : [endpoint.model.predict(prompt) for prompt in prompts] })
+
+            def respond(self, status : int, body : dict, headers : dict = None):
+                data = json.dumps(body).encode("utf-8")
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                # NOTE: no line per request
+                pass
+
+        return Handler
+
+    def start(self):
+        """
+        start: serve in a background thread
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def load_model(task_dirs : List[str], mode : str = "oracle", noise : float = 0.2, prompt_template : str = "{input}", seed : int = 0) -> MockModel:
+    """
+    load_model: MockModel answering the prompts of benchmark tasks
+
+    :param task_dirs: task directories, e.g ../../a.2
+
+    :param prompt_template: the prompts sent by eval_runner.py, e.g "{input}"
+    """
+    prompts, targets = [], []
+
+    for task_dir in task_dirs:
+        benchmark_file = find_benchmark_file(task_dir)
+        if benchmark_file is None:
+            raise ValueError(f"No benchmark file in {task_dir}")
+
+        for row in load_benchmark(benchmark_file):
+            prompts.append(prompt_template.format(input=row["input"]))
+            targets.append(row["target"])
+
+    return MockModel(prompts, targets, mode=mode, noise=noise, seed=seed)
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='local stand-in for a model endpoint, built from the targets of benchmark tasks')
+        cmd_line_parser.add_argument('--task_dirs', type=str, nargs='+', required=True, help='task directories, e.g ../../a.2 ../../year.2')
+        cmd_line_parser.add_argument('--mode', type=str, default='oracle', choices=MODES, help='echo, oracle or noisy')
+        cmd_line_parser.add_argument('--noise', type=float, default=0.2, help='share of wrong predictions in noisy mode')
+        cmd_line_parser.add_argument('--prompt_template', type=str, default='{input}', help='same as eval_runner.py --prompt_template')
+        cmd_line_parser.add_argument('--host', type=str, default='127.0.0.1', help='host of the server')
+        cmd_line_parser.add_argument('--port', type=int, default=8000, help='port of the server')
+        cmd_line_parser.add_argument('--latency', type=float, default=0.0, help='seconds per request')
+        cmd_line_parser.add_argument('--max_requests_per_second', type=float, default=None, help='optional; above this rate, requests get 429')
+        cmd_line_parser.add_argument('--error_rate', type=float, default=0.0, help='share of the requests that get 500')
+        cmd_line_parser.add_argument('--seed', type=int, default=0, help='seed of the noisy predictions and the errors')
+        args = cmd_line_parser.parse_args()
+
+        model = load_model(args.task_dirs, mode=args.mode, noise=args.noise, prompt_template=args.prompt_template, seed=args.seed)
+
+        endpoint = MockEndpoint(model
+                                , host=args.host
+                                , port=args.port
+                                , latency=args.latency
+                                , max_requests_per_second=args.max_requests_per_second
+                                , error_rate=args.error_rate
+                                , seed=args.seed
+                                )
+
+        print(f"{args.mode} endpoint for {len(model.answers)} prompts on {endpoint.url}")
+
+        try:
+            endpoint.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            endpoint.server.server_close()
+            print(endpoint.stats)
+
+
+    # main entry point
+    main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+normalise_batch.py: Apply a string normalisation to a batch of strings, e.g all the model outputs of an evaluation
+
+- the batch can be a list (or any iterable) of str, a NumPy array (StringDType, object, unicode or bytes) or an Arrow
+    string array (Array or ChunkedArray)
+- repeated strings are normalised once (memoisation over the batch)
+- very large batches can be normalised by a pool of worker processes; only the distinct strings are sent to the workers
+
+NOTES
+- the result is a list of str, in the same order as the batch; nulls (None, e.g Arrow nulls) are kept as None
+- bytes are decoded as UTF-8
+
+USAGE
+    normalise_many(NormaliseWhitespace().normalise, ["29 May  2021", "29 May  2021"])    # ["29 May 2021", "29 May 2021"]
+
+    # or, with the normalisers
+    NormaliseString().normalise_many(model_outputs, workers=8)
+
+"""
+
+# system
+from multiprocessing import Pool, cpu_count
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+# 3rd party
+import numpy as np
+
+
+# below this number of distinct strings, worker processes cost more than they save
+MIN_PARALLEL_STRINGS = 100000
+
+
+def string_list(values : Any) -> List[Optional[str]]:
+    """
+    string_list: convert a batch of strings to a list of str
+
+    :param values: list or iterable of str, NumPy array of strings or Arrow string array
+
+    :return: list of str (or None for nulls)
+    """
+
+    # Arrow Array or ChunkedArray
+    # NOTE: checked by attribute, so that pyarrow is not needed for the other batches
+    if hasattr(values, "to_pylist"):
+        return values.to_pylist()
+
+    if isinstance(values, np.ndarray):
+        values = values.ravel()
+
+        if values.dtype.kind == "S":
+            return [value.decode("utf-8") for value in values.tolist()]
+
+        if values.dtype.kind not in ("U", "T", "O"):
+            raise ValueError(f"Expected an array of strings; got dtype {values.dtype}")
+
+        return values.tolist()
+
+    return list(values)
+
+
+def normalise_many(function : Callable[[str], str]
+                , values : Any
+                , workers : int = None
+                , chunk_size : int = 10000
+                ) -> List[Optional[str]]:
+    """
+    normalise_many: apply a normalisation function to a batch of strings; each distinct string is normalised once
+
+    :param function: normalisation of one string, e.g NormaliseWhitespace().normalise; must be picklable if workers > 1
+
+    :param values: batch of strings; see string_list()
+
+    :param workers: optional; number of worker processes
+        - None: worker processes are used if there are at least MIN_PARALLEL_STRINGS distinct strings (one per CPU)
+        - 1: no worker processes
+
+    :param chunk_size: number of distinct strings sent to a worker in one go
+
+    :return: list of normalised strings, in the same order as values
+    """
+
+    if chunk_size <= 0:
+        raise ValueError(f"chunk_size must be positive; got {chunk_size}")
+
+    values = string_list(values)
+
+    # distinct strings, in order of first occurrence
+    distinct = list(dict.fromkeys(value for value in values if value is not None))
+
+    if workers is None:
+        workers = cpu_count() if len(distinct) >= MIN_PARALLEL_STRINGS else 1
+
+    if workers > 1 and len(distinct) > chunk_size:
+        chunks = [distinct[idx:idx + chunk_size] for idx in range(0, len(distinct), chunk_size)]
+
+        # NOTE: the function is sent once to each worker, not with each chunk
+        with Pool(processes=workers, initializer=_init_worker, initargs=(function,)) as pool:
+            normalised = [s for chunk in pool.imap(_normalise_chunk, chunks) for s in chunk]
+    else:
+        normalised = [function(value) for value in distinct]
+
+    memo : Dict[str, str] = dict(zip(distinct, normalised))
+    memo[None] = None
+
+    return [memo[value] for value in values]
+
+
+# ------------
+# worker state
+# ------------
+
+# normalise_many: the normalisation function of each worker process
+_worker_function = None
+
+def _init_worker(function : Callable[[str], str]):
+    global _worker_function
+    _worker_function = function
+
+def _normalise_chunk(chunk : List[str]) -> List[str]:
+    """
+    normalise one chunk of distinct strings in a worker process
+    """
+    return [_worker_function(value) for value in chunk]
@@ -13,13 +13,27 @@ generates/dates/datetime/custom_formatter.py
 USAGE
 python3 normalise_string.py "ABC  äbc" # => abc abc
 
+# one string per line, e.g model outputs; each distinct line is normalised once
+python3 normalise_string.py --input_file outputs.txt --workers 8 > normalised.txt
+
+NOTES
+- optional memoisation (see cache_size): normalised strings are kept in a bounded LRU cache, keyed on the raw string
+    - worthwhile for strings that repeat, e.g month names, weekday names, timezone names and AM/PM markers of each locale;
+    normalise_string(s, cache=False) bypasses the cache for strings that rarely repeat, e.g whole rendered datetimes
+
 edward | 2023-07-28
 
 BACKLOG
         
 """
 
+# system
+from functools import partial
+from typing import Any, Dict, List, Optional
+
 # locals
+from lru_cache import LRUCache
+from normalise_batch import normalise_many
 from normalise_whitespace import NormaliseWhitespace
 from normalise_tokens import NormaliseTokens
 from normalise_unicode import NormaliseUnicode
@@ -35,13 +49,15 @@ class NormaliseString:
         - cast to lower case
     """
 
-    def __init__(self, normalise : bool = True):
+    def __init__(self, normalise : bool = True, cache_size : int = None):
         """
         :param normalise: apply full normalisation
             # 1. unicode
             # 2. tokens (e.g convert .. to .)
             # 3. whitespace (e.g "\u202f" to " ")
             # 4. convert to lower case
+
+        :param cache_size: optional; maximum number of normalised strings kept in memory; None for no cache
         
         """
 
@@ -51,8 +67,17 @@ class NormaliseString:
         self.normalise_whitespace = NormaliseWhitespace()
         self.normalise_unicode = NormaliseUnicode()
 
+        # raw string => normalised string, before lower case and strip
+        self.cache = LRUCache(maxsize=cache_size) if cache_size is not None else None
 
-    def normalise_string(self, s : str, strip : bool = True, to_lower : bool = True) -> str:
+    def flatten(self, s : str) -> str:
+        """
+        flatten: unicode, tokens and whitespace normalisation of a string
+        """
+        return self.normalise_whitespace.normalise(self.normalise_tokens.normalise(self.normalise_unicode.normalise(s)))
+
+
+    def normalise_string(self, s : str, strip : bool = True, to_lower : bool = True, cache : bool = True) -> str:
         """
         normalise_string: apply full normalisation to a string
 
@@ -64,10 +89,15 @@ class NormaliseString:
 
         :param to_lower: set to True to cast string to lower case
 
+        :param cache: set to False to bypass the cache (if any), e.g for a string that is unlikely to be seen again
+
         :return: normalised string
         
         """
-        s0 = self.normalise_whitespace.normalise(self.normalise_tokens.normalise(self.normalise_unicode.normalise(s)))
+        if self.cache is None or not cache:
+            s0 = self.flatten(s)
+        else:
+            s0 = self.cache.get_or_compute(s, self.flatten)
             
         s1 = s0.lower() if to_lower else s0
 
@@ -75,6 +105,41 @@ class NormaliseString:
             return s1.strip()
         else:
             return s1
+
+    def normalise_string_reference(self, s : str, strip : bool = True, to_lower : bool = True) -> str:
+        """
+        normalise_string_reference: same as normalise_string(), with the reference (unoptimised) algorithms and no cache
+        """
+        s0 = self.normalise_whitespace.normalise_reference(self.normalise_tokens.normalise_reference(self.normalise_unicode.normalise_reference(s)))
+
+        s1 = s0.lower() if to_lower else s0
+
+        if strip:
+            return s1.strip()
+        else:
+            return s1
+
+    def cache_stats(self) -> Dict[str, int]:
+        """
+        cache_stats: size and hit/miss/eviction counters of the cache; empty if there is no cache
+        """
+        return self.cache.stats() if self.cache is not None else {}
+
+    def normalise_many(self, values : Any, strip : bool = True, to_lower : bool = True, workers : int = None) -> List[Optional[str]]:
+        """
+        normalise_many: apply full normalisation to a batch of strings; each distinct string is normalised once
+
+        :param values: list of str, NumPy array of strings or Arrow string array; see normalise_batch
+
+        :param strip: see normalise_string()
+
+        :param to_lower: see normalise_string()
+
+        :param workers: optional; number of worker processes; see normalise_batch.normalise_many()
+
+        :return: list of normalised strings, in the same order as values
+        """
+        return normalise_many(partial(self.normalise_string, strip=strip, to_lower=to_lower), values, workers=workers)
     
     
    
@@ -87,12 +152,26 @@ if __name__ == '__main__':
 
         # init command line arguments
         cmd_line_parser = ArgumentParser(description='driver for NormaliseString')
-        cmd_line_parser.add_argument('input_string', type=str, default=None, help='string to be normalised')
+        cmd_line_parser.add_argument('input_string', type=str, nargs='?', default=None, help='string to be normalised')
+        cmd_line_parser.add_argument('--input_file', type=str, default=None, help='file of strings to be normalised, one per line')
+        cmd_line_parser.add_argument('--workers', type=int, default=None, help='number of worker processes for --input_file; default is one per CPU for large files')
         cmd_line_parser.add_argument('--debug', default=False, dest='debug', action='store_true', help='debugging')
         args = cmd_line_parser.parse_args()
 
+        if (args.input_string is None) == (args.input_file is None):
+            cmd_line_parser.error("expected either an input string or --input_file")
+
         normalise_string = NormaliseString()
 
+        if args.input_file is not None:
+            with open(args.input_file, "r", encoding="utf-8") as f:
+                lines = f.read().splitlines()
+
+            for output_string in normalise_string.normalise_many(lines, workers=args.workers):
+                print(output_string)
+
+            return
+
         output_string = normalise_string.normalise_string(args.input_string)
         print(output_string)
 
@@ -9,14 +9,23 @@ tokens that are not part of LDMLTokens are not normalised, e.g EEEE remains EEEE
 
 e.g 29 May  2021, 7:23:11 PM
 
+NOTES
+- all tokens are replaced in one pass with a pre-compiled regex; the result is the same as replacing each token in order
+    (see normalise_reference), because a replacement such as {day} cannot create another token
+
 edward | 2021-06-03
 
 BACKLOG
 """
 
 
+# system
+from re import compile, escape
+from typing import Any, List, Optional
+
 # locals
 from ldml_tokens import LDMLTokens
+from normalise_batch import normalise_many
 
 class NormaliseTokens:
 
@@ -25,6 +34,12 @@ class NormaliseTokens:
 
         self.ldml_tokens = LDMLTokens()
 
+        # {token} -> {normalised token}, e.g {dd} -> {day}
+        self.replacements = { '{' + token + '}' : '{' + self.ldml_tokens[token] + '}' for token in self.ldml_tokens }
+
+        # NOTE: longest tokens first, e.g {dd} before {d}
+        self.regex_tokens = compile("|".join(escape(search_pattern) for search_pattern in sorted(self.replacements, key=len, reverse=True)))
+
         
     
     def normalise(self, format_spec : str) -> str:
@@ -41,6 +56,30 @@ class NormaliseTokens:
         # argument checks
         assert isinstance(format_spec, str)
 
+        # no token
+        if '{' not in format_spec:
+            return format_spec
+
+        return self.regex_tokens.sub(lambda match : self.replacements[match.group(0)], format_spec)
+
+    def normalise_many(self, values : Any, workers : int = None) -> List[Optional[str]]:
+        """
+        normalise_many: normalise a batch of format strings; each distinct string is normalised once
+
+        :param values: list of str, NumPy array of strings or Arrow string array; see normalise_batch
+
+        :param workers: optional; number of worker processes; see normalise_batch.normalise_many()
+
+        :return: list of normalised strings, in the same order as values
+        """
+        return normalise_many(self.normalise, values, workers=workers)
+
+    def normalise_reference(self, format_spec : str) -> str:
+        """
+        normalise_reference: same as normalise(), replacing each token in order
+        """
+        assert isinstance(format_spec, str)
+
         clean_format = format_spec
 
         for token in self.ldml_tokens:
@@ -15,8 +15,12 @@ edward | 2021-09-09
 BACKLOG
 """
 
+from typing import Any, List, Optional
 from unicodedata import normalize
 
+# locals
+from normalise_batch import normalise_many
+
 
 class NormaliseUnicode:
     """
@@ -37,6 +41,10 @@ class NormaliseUnicode:
 
         """
 
+        # NOTE: ASCII strings are already normalised
+        if input_str.isascii():
+            return input_str
+
         # NOTE: it seems the unicode x character used by Babel for exponents does not get translated by the normalize NFKD
         # => manual override
         # e.g "8,531523381499447×10^+7"
@@ -53,4 +61,23 @@ class NormaliseUnicode:
         # src: https://stackoverflow.com/questions/51710082/what-does-unicodedata-normalize-do-in-python
         return normalize(u'NFKD', input_str).encode('ascii', 'ignore').decode('ascii')
 
-   
+    def normalise_reference(self, input_str : str) -> str:
+        """
+        normalise_reference: same as normalise(), without the fast path for ASCII strings
+        """
+        if "×" in input_str:
+            input_str = input_str.replace("×", "x")
+
+        return normalize(u'NFKD', input_str).encode('ascii', 'ignore').decode('ascii')
+
+    def normalise_many(self, values : Any, workers : int = None) -> List[Optional[str]]:
+        """
+        normalise_many: normalise a batch of Unicode strings; each distinct string is normalised once
+
+        :param values: list of str, NumPy array of strings or Arrow string array; see normalise_batch
+
+        :param workers: optional; number of worker processes; see normalise_batch.normalise_many()
+
+        :return: list of normalised strings, in the same order as values
+        """
+        return normalise_many(self.normalise, values, workers=workers)
@@ -17,13 +17,21 @@ edward | 2021-06-03 | Initial version
 edward | 2022-02-14 | , delimiter should not be replaced because it could be a valid part of a string, e.g a number!!
 edward | 2022-02-14 | TAB delimiter added
 
+NOTES
+- the replacements are pre-compiled: duplicates are dropped, and ASCII strings skip the non-ASCII replacements;
+    the result is the same as replacing each item of whitespace_to_be_replaced in order (see normalise_reference)
+- str.replace() is faster than str.translate() with a table here, since most strings contain none of the items
+
 BACKLOG
-- can the replacement algorithm not be pre-compiled?
 """
 
 # system
 from datetime import date, datetime, time, timedelta
-from typing import List, Set, Dict, Tuple, Optional, Union, Iterable
+from typing import Any, List, Set, Dict, Tuple, Optional, Union, Iterable
+
+# locals
+from normalise_batch import normalise_many
+
 
 class NormaliseWhitespace:
 
@@ -59,6 +67,28 @@ class NormaliseWhitespace:
                             
                 ]
 
+        # pre-compiled replacements, in the same order as whitespace_to_be_replaced; see compile_replacements
+        self.replacements = self.compile_replacements(self.whitespace_to_be_replaced, self.normalisation_character)
+        self.ascii_replacements = [ chars for chars in self.replacements if chars.isascii() ]
+
+    @staticmethod
+    def compile_replacements(items : List[str], replacement : str) -> List[str]:
+        """
+        compile_replacements: items to be replaced in order, without repeated single characters, e.g "\xa0" and "\u00a0"
+
+        NOTE: replacing a single character a second time has no effect: its occurrences were removed by the first replacement,
+        and replacing other items only adds the replacement
+        """
+        compiled = []
+
+        for chars in items:
+            if len(chars) == 1 and chars != replacement and chars in compiled:
+                continue
+
+            compiled.append(chars)
+
+        return compiled
+
     
     def normalise(self, date_str : str) -> str:
         
@@ -74,7 +104,8 @@ class NormaliseWhitespace:
         # argument checks
         assert isinstance(date_str, str)
 
-        for chars in self.whitespace_to_be_replaced:
+        # NOTE: the non-ASCII items cannot occur in an ASCII string
+        for chars in (self.ascii_replacements if date_str.isascii() else self.replacements):
             date_str = date_str.replace(chars, self.normalisation_character)
 
         # normalise whitespace does not mean transform to lower case... probably a breaking change, sorry
@@ -82,4 +113,25 @@ class NormaliseWhitespace:
         #return date_str.strip().lower()
         return date_str.strip()
 
-   
+    def normalise_many(self, values : Any, workers : int = None) -> List[Optional[str]]:
+        """
+        normalise_many: normalise a batch of date/datetime strings; each distinct string is normalised once
+
+        :param values: list of str, NumPy array of strings or Arrow string array; see normalise_batch
+
+        :param workers: optional; number of worker processes; see normalise_batch.normalise_many()
+
+        :return: list of normalised strings, in the same order as values
+        """
+        return normalise_many(self.normalise, values, workers=workers)
+
+    def normalise_reference(self, date_str : str) -> str:
+        """
+        normalise_reference: same as normalise(), replacing each item of whitespace_to_be_replaced in order
+        """
+        assert isinstance(date_str, str)
+
+        for chars in self.whitespace_to_be_replaced:
+            date_str = date_str.replace(chars, self.normalisation_character)
+
+        return date_str.strip()
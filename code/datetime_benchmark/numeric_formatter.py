@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+numeric_formatter.py: Render Babel patterns made of numeric fields without Babel, e.g "dd/MM/yyyy HH:mm:ss.SSS Z"
+
+The numeric fields are rendered the same way in every locale: Babel formats them with '%0*d' and no locale digits.
+A pattern is tokenized once, as Babel does (literals, quotes, fields); if all its fields are numeric, it is rendered
+with plain string formatting, else the caller falls back to Babel.
+
+NUMERIC FIELDS
+- d, dd: day of month
+- M, MM, L, LL: month
+- y, yy, yyyy, ..., Y (ISO year), u: year; yy keeps the last 2 digits
+- h, hh, H, HH, K, KK, k, kk: hour
+- m, mm, s, ss: minute, second
+- S, SS, ...: fraction of seconds, rounded as Babel does (e.g S of .96 renders "10")
+- Z, ZZ, ZZZ, ZZZZZ, X..XXXXX, x..xxxxx: UTC offsets, e.g +0200, +02:00, Z
+
+NOTES
+- ZZZZ and OOOO (e.g "GMT+02:00") depend on the locale, and are rendered by Babel
+- naive datetimes are rendered as UTC, and dates at midnight UTC, as Babel does
+- verify_against_babel() compares the renderings with Babel; see __main__
+
+USAGE
+    numeric_formatter = NumericFormatter()
+
+    numeric_formatter.format("dd/MM/yyyy", dt)     # "07/04/2007"
+    numeric_formatter.format("dd MMM yyyy", dt)    # None: MMM is not numeric
+
+"""
+
+# system
+from datetime import date, datetime, time
+from random import Random
+from typing import Iterable, List, Optional, Tuple, Union
+
+# 3rd party
+import babel.dates
+
+# locals
+from lru_cache import LRUCache
+
+
+# numeric fields: field character => supported lengths (None: any length)
+NUMERIC_FIELDS = {
+    "d" : (1, 2)
+    , "M" : (1, 2)
+    , "L" : (1, 2)
+    , "y" : None
+    , "Y" : None
+    , "u" : None
+    , "h" : (1, 2)
+    , "H" : (1, 2)
+    , "K" : (1, 2)
+    , "k" : (1, 2)
+    , "m" : (1, 2)
+    , "s" : (1, 2)
+    , "S" : None
+    , "Z" : (1, 2, 3, 5)
+    , "X" : (1, 2, 3, 4, 5)
+    , "x" : (1, 2, 3, 4, 5)
+}
+
+
+def is_numeric_field(char : str, num : int) -> bool:
+    """
+    is_numeric_field: True if the field, e.g ("d", 2) for dd, is rendered without Babel
+    """
+    lengths = NUMERIC_FIELDS.get(char, ())
+    return lengths is None or num in lengths
+
+
+def format_offset(offset_seconds : int, width : str, return_z : bool) -> str:
+    """
+    format_offset: same as babel.dates.get_timezone_gmt() for the locale-independent widths
+
+    :param offset_seconds: UTC offset in seconds
+
+    :param width: "short" (+0200), "iso8601" (+02:00) or "iso8601_short" (+02)
+
+    :param return_z: "Z" for a zero offset
+    """
+    # NOTE: same arithmetic as Babel, including negative offsets that are not whole hours
+    hours, seconds = divmod(offset_seconds, 3600)
+
+    if return_z and hours == 0 and seconds == 0:
+        return "Z"
+
+    if seconds == 0 and width == "iso8601_short":
+        return "%+03d" % hours
+
+    if width == "iso8601":
+        return "%+03d:%02d" % (hours, seconds // 60)
+
+    return "%+03d%02d" % (hours, seconds // 60)
+
+
+# offset fields: (char, num) => (width, return_z), as in babel.dates.DateTimeFormat.format_timezone()
+OFFSET_FIELDS = {
+    ("Z", 1) : ("short", False)
+    , ("Z", 2) : ("short", False)
+    , ("Z", 3) : ("short", False)
+    , ("Z", 5) : ("iso8601", True)
+    , ("X", 1) : ("iso8601_short", True)
+    , ("X", 2) : ("short", True)
+    , ("X", 4) : ("short", True)
+    , ("X", 3) : ("iso8601", True)
+    , ("X", 5) : ("iso8601", True)
+    , ("x", 1) : ("iso8601_short", False)
+    , ("x", 2) : ("short", False)
+    , ("x", 4) : ("short", False)
+    , ("x", 3) : ("iso8601", False)
+    , ("x", 5) : ("iso8601", False)
+}
+
+
+def format_field(char : str, num : int, value : datetime, offset_seconds : int) -> str:
+    """
+    format_field: render a numeric field, as babel.dates.DateTimeFormat does
+
+    :param value: a datetime
+
+    :param offset_seconds: UTC offset of value in seconds
+    """
+
+    if char == "d":
+        return "%0*d" % (num, value.day)
+
+    if char in ("M", "L"):
+        return "%0*d" % (num, value.month)
+
+    if char in ("y", "Y", "u"):
+        year = "%0*d" % (num, value.isocalendar()[0] if char == "Y" else value.year)
+        return year[-2:] if num == 2 else year
+
+    if char == "h":
+        return "%0*d" % (num, value.hour % 12 if value.hour % 12 != 0 else 12)
+
+    if char == "H":
+        return "%0*d" % (num, value.hour)
+
+    if char == "K":
+        return "%0*d" % (num, value.hour % 12)
+
+    if char == "k":
+        return "%0*d" % (num, value.hour if value.hour != 0 else 24)
+
+    if char == "m":
+        return "%0*d" % (num, value.minute)
+
+    if char == "s":
+        return "%0*d" % (num, value.second)
+
+    if char == "S":
+        # NOTE: same float rounding as Babel
+        return "%0*d" % (num, round(value.microsecond / 1000000, num) * 10**num)
+
+    return format_offset(offset_seconds, *OFFSET_FIELDS[(char, num)])
+
+
+class NumericFormatter:
+
+    """
+    NumericFormatter: render Babel patterns made of numeric fields, without Babel
+    """
+
+    def __init__(self, pattern_cache_size : int = 10000):
+        """
+        :param pattern_cache_size: maximum number of tokenized patterns kept in memory
+        """
+
+        # pattern => tuple of literals (str) and fields (char, num); None if a field is not numeric
+        self.pattern_cache = LRUCache(maxsize=pattern_cache_size)
+
+    @staticmethod
+    def compile(pattern : str) -> Optional[Tuple[Union[str, Tuple[str, int]], ...]]:
+        """
+        compile: tokenize a Babel pattern, as Babel does
+
+        :return: tuple of literals (str) and fields (char, num); None if a field is not numeric
+        """
+        pieces = []
+
+        for token_type, token_value in babel.dates.tokenize_pattern(pattern):
+            if token_type == "chars":
+                pieces.append(token_value)
+            elif is_numeric_field(*token_value):
+                pieces.append(token_value)
+            else:
+                return None
+
+        return tuple(pieces)
+
+    def format(self, pattern : str, dt : Union[date, datetime]) -> Optional[str]:
+        """
+        format: render a Babel pattern
+
+        :param pattern: Babel pattern, e.g "dd/MM/yyyy"
+
+        :param dt: date or datetime
+
+        :return: same string as babel.dates.format_datetime(dt, pattern, locale) in any locale; None if the pattern
+            has a field that is not numeric, or dt is not a date, i.e the pattern should be rendered by Babel
+        """
+
+        if not isinstance(dt, date):
+            return None
+
+        pieces = self.pattern_cache.get_or_compute(pattern, self.compile)
+        if pieces is None:
+            return None
+
+        # NOTE: as Babel, dates are rendered at midnight and naive datetimes in UTC
+        value = dt if isinstance(dt, datetime) else datetime.combine(dt, time())
+
+        offset = value.utcoffset()
+        offset_seconds = offset.days * 86400 + offset.seconds if offset is not None else 0
+
+        return "".join(piece if isinstance(piece, str) else format_field(piece[0], piece[1], value, offset_seconds) for piece in pieces)
+
+
+def verify_against_babel(locales : Iterable[str], num_datetimes : int = 1000, patterns : Iterable[str] = None, seed : int = 0) -> List[Tuple[str, str, str, str, str]]:
+    """
+    verify_against_babel: differential test of NumericFormatter against babel.dates.format_datetime()
+
+    :param locales: locale names, e.g Config().locales
+
+    :param num_datetimes: number of random datetimes per locale; naive, UTC, in random timezones, and dates
+
+    :param patterns: optional; patterns to check; default is each numeric field on its own and a few combinations
+
+    :param seed: seed of the random datetimes
+
+    :return: list of mismatches (locale, pattern, datetime, expected, rendered); empty if all renderings are the same
+    """
+    from pytz import all_timezones, timezone, utc
+
+    if patterns is None:
+        patterns = [char * num for char, lengths in NUMERIC_FIELDS.items() for num in (lengths or range(1, 7))]
+        patterns += ["dd/MM/yyyy", "d.M.yy", "yyyy-MM-dd'T'HH:mm:ss.SSSSSSXXX", "h:mm:ss 'o''clock' Z", "k:mm K:mm hh:mm:ss.S", "d-yyyyy Y u"]
+
+    numeric_formatter = NumericFormatter()
+    rng = Random(seed)
+
+    mismatches = []
+
+    for locale in locales:
+        for _ in range(num_datetimes):
+            dt = datetime(rng.randint(1, 9998), rng.randint(1, 12), rng.randint(1, 28), rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59), rng.choice([0, rng.randint(0, 999999), 999999]))
+
+            kind = rng.randrange(4)
+            if kind == 1:
+                dt = utc.localize(dt)
+            elif kind == 2:
+                dt = utc.localize(dt).astimezone(timezone(rng.choice(all_timezones)))
+            elif kind == 3:
+                dt = dt.date()
+
+            for pattern in patterns:
+                expected = babel.dates.format_datetime(dt, pattern, locale=locale)
+                rendered = numeric_formatter.format(pattern, dt)
+
+                if rendered != expected:
+                    mismatches.append((locale, pattern, dt.isoformat(), expected, rendered))
+
+    return mismatches
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+    from babel.localedata import locale_identifiers
+
+    from config import Config
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='differential test of NumericFormatter against Babel')
+        cmd_line_parser.add_argument('--locale_schema', type=str, default='config', help='locales: config (Config().locales) or babel.all')
+        cmd_line_parser.add_argument('--num_datetimes', type=int, default=200, help='number of random datetimes per locale')
+        cmd_line_parser.add_argument('--seed', type=int, default=0, help='seed of the random datetimes')
+        args = cmd_line_parser.parse_args()
+
+        locales = list(locale_identifiers()) if args.locale_schema == 'babel.all' else Config().locales
+
+        mismatches = verify_against_babel(locales, num_datetimes=args.num_datetimes, seed=args.seed)
+
+        for mismatch in mismatches[:20]:
+            print(mismatch)
+
+        print(f"{len(locales)} locales, {args.num_datetimes} datetimes per locale: {len(mismatches)} mismatches")
+
+        if len(mismatches) > 0:
+            raise RuntimeError("NumericFormatter does not match Babel")
+
+
+    # main entry point
+    main()
@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+"""
+prediction_cache.py: On-disk cache of model predictions (SQLite), so that repeated evaluation runs do not call the model again
+
+- a prediction is keyed by the SHA-256 of (model id, decoding parameters, prompt template, input), e.g the same model with
+    another temperature or another prompt template is another key
+- the cache is bounded in size (bytes of the predictions): the least recently used predictions are evicted
+- hits, misses, writes and evictions are counted; see stats()
+- the cache can be exported to a JSONL file (optionally gzipped) and imported on another machine
+
+NOTES
+- the first prediction of a key is kept: a key is not overwritten, e.g by a second run of a model that is not deterministic
+- lookups and writes are done in bulk (get_many, put_many), one transaction each, e.g for all the rows of a task at once
+- the cache is used by eval_runner.py with --cache_file
+
+USAGE
+    cache = PredictionCache("predictions.sqlite", max_bytes=1 << 30)
+
+    keys = [cache_key("my-model", {"temperature" : 0}, "{input}", row["input"]) for row in rows]
+    cached = cache.get_many(keys)                   # key => prediction, for the keys in the cache
+    cache.put_many(zip(keys, predictions))
+
+    python3 prediction_cache.py --cache_file predictions.sqlite --export_file predictions_cache.jsonl.gz
+    python3 prediction_cache.py --cache_file predictions.sqlite --import_file predictions_cache.jsonl.gz
+
+"""
+
+# system
+import gzip
+import hashlib
+import json
+import sqlite3
+from time import time
+from typing import Any, Dict, Iterable, List, Tuple
+
+
+# number of keys per SELECT ... IN (...) statement; SQLite limits the number of parameters of a statement
+SELECT_CHUNK_SIZE = 500
+
+# after an eviction, the cache is at most this share of max_bytes, so that evictions are not run on every write
+EVICTION_TARGET = 0.9
+
+
+def cache_key(model : str, parameters : Dict[str, Any], prompt_template : str, input : str) -> str:
+    """
+    cache_key: SHA-256 (hex) of a model call
+
+    :param model: model id, e.g "my-model-2025-01"
+
+    :param parameters: decoding parameters, e.g {"temperature" : 0, "max_tokens" : 32}; the order of the keys does not matter
+
+    :param prompt_template: e.g "Convert to ISO 8601: {input}"
+
+    :param input: input of the benchmark row
+    """
+    data = json.dumps([model, parameters or {}, prompt_template, input], sort_keys=True, ensure_ascii=False)
+
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+
+    """
+    PredictionCache: SQLite cache of predictions, key => prediction, bounded in size with LRU eviction
+    """
+
+    def __init__(self, filename : str, max_bytes : int = None):
+        """
+        :param filename: SQLite file, created if needed, e.g predictions.sqlite
+
+        :param max_bytes: optional; maximum total size of the predictions (UTF-8 bytes); None for no bound
+        """
+        self.filename = filename
+        self.max_bytes = max_bytes
+
+        self.connection = sqlite3.connect(filename)
+
+        # NOTE: WAL, so that readers (e.g export) do not block the writes of a run
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS predictions (key TEXT PRIMARY KEY, prediction TEXT, size INTEGER NOT NULL, accessed REAL NOT NULL)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed)")
+
+        self.total_bytes = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM predictions").fetchone()[0]
+
+        # counters of this session
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+    def get_many(self, keys : Iterable[str]) -> Dict[str, str]:
+        """
+        get_many: predictions of the keys in the cache
+
+        :param keys: keys, see cache_key()
+
+        :return: key => prediction, for the keys in the cache (hits); the other keys are misses
+        """
+        keys = list(dict.fromkeys(keys))
+        found = {}
+
+        for start in range(0, len(keys), SELECT_CHUNK_SIZE):
+            chunk = keys[start:start + SELECT_CHUNK_SIZE]
+            rows = self.connection.execute(f"SELECT key, prediction FROM predictions WHERE key IN ({','.join('?' * len(chunk))})", chunk)
+            found.update(rows)
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+
+        if len(found) > 0:
+            now = time()
+            with self.connection:
+                self.connection.executemany("UPDATE predictions SET accessed = ? WHERE key = ?", ((now, key) for key in found))
+
+        return found
+
+    def get(self, key : str) -> Any:
+        """
+        get: prediction of a key; None if the key is not in the cache
+        """
+        return self.get_many([key]).get(key)
+
+    def put_many(self, items : Iterable[Tuple[str, str]]):
+        """
+        put_many: add predictions to the cache, then evict the least recently used predictions if the cache is too big
+
+        :param items: (key, prediction) pairs; a key already in the cache is not overwritten
+        """
+        now = time()
+
+        with self.connection:
+            for key, prediction in items:
+                size = len(prediction.encode("utf-8")) if prediction is not None else 0
+
+                cursor = self.connection.execute("INSERT OR IGNORE INTO predictions (key, prediction, size, accessed) VALUES (?, ?, ?, ?)", (key, prediction, size, now))
+                if cursor.rowcount > 0:
+                    self.total_bytes += size
+                    self.writes += 1
+
+        if self.max_bytes is not None and self.total_bytes > self.max_bytes:
+            self.evict(int(self.max_bytes * EVICTION_TARGET))
+
+    def put(self, key : str, prediction : str):
+        self.put_many([(key, prediction)])
+
+    def evict(self, target_bytes : int):
+        """
+        evict: remove the least recently used predictions until the cache is at most target_bytes
+        """
+        with self.connection:
+            while self.total_bytes > target_bytes:
+                rows = self.connection.execute("SELECT key, size FROM predictions ORDER BY accessed LIMIT ?", (SELECT_CHUNK_SIZE,)).fetchall()
+                if len(rows) == 0:
+                    break
+
+                evicted = []
+                for key, size in rows:
+                    if self.total_bytes <= target_bytes:
+                        break
+                    evicted.append((key,))
+                    self.total_bytes -= size
+
+                self.connection.executemany("DELETE FROM predictions WHERE key = ?", evicted)
+                self.evictions += len(evicted)
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        stats: size of the cache, and hit/miss/write/eviction counters of this session
+        """
+        lookups = self.hits + self.misses
+
+        return {
+            "entries" : len(self)
+            , "bytes" : self.total_bytes
+            , "max_bytes" : self.max_bytes
+            , "hits" : self.hits
+            , "misses" : self.misses
+            , "hit_rate" : self.hits / lookups if lookups > 0 else None
+            , "writes" : self.writes
+            , "evictions" : self.evictions
+        }
+
+    def export_jsonl(self, filename : str) -> int:
+        """
+        export_jsonl: write the cache to a JSONL file, one {"key" : ..., "prediction" : ...} per line; gzipped if the name ends with .gz
+
+        :return: number of predictions written
+        """
+        count = 0
+
+        with (gzip.open(filename, "wt", encoding="utf-8") if filename.endswith(".gz") else open(filename, "w", encoding="utf-8")) as f:
+            for key, prediction in self.connection.execute("SELECT key, prediction FROM predictions ORDER BY accessed"):
+                f.write(json.dumps({ "key" : key, "prediction" : prediction }, ensure_ascii=False) + "\n")
+                count += 1
+
+        return count
+
+    def import_jsonl(self, filename : str, batch_size : int = 10000) -> int:
+        """
+        import_jsonl: add the predictions of a file written by export_jsonl(); the keys already in the cache are kept
+
+        :return: number of predictions added
+        """
+        writes = self.writes
+
+        with (gzip.open(filename, "rt", encoding="utf-8") if filename.endswith(".gz") else open(filename, "r", encoding="utf-8")) as f:
+            batch : List[Tuple[str, str]] = []
+
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    batch.append((row["key"], row["prediction"]))
+
+                if len(batch) >= batch_size:
+                    self.put_many(batch)
+                    batch = []
+
+            self.put_many(batch)
+
+        return self.writes - writes
+
+    def close(self):
+        self.connection.close()
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='inspect, export, import or shrink a prediction cache')
+        cmd_line_parser.add_argument('--cache_file', type=str, required=True, help='SQLite file of the cache, e.g predictions.sqlite')
+        cmd_line_parser.add_argument('--export_file', type=str, default=None, help='optional; write the cache to a JSONL file, e.g predictions_cache.jsonl.gz')
+        cmd_line_parser.add_argument('--import_file', type=str, default=None, help='optional; add the predictions of an exported file')
+        cmd_line_parser.add_argument('--max_mb', type=float, default=None, help='optional; evict the least recently used predictions above this size')
+        args = cmd_line_parser.parse_args()
+
+        cache = PredictionCache(args.cache_file, max_bytes=int(args.max_mb * 2**20) if args.max_mb is not None else None)
+
+        if args.import_file is not None:
+            print(f"{cache.import_jsonl(args.import_file)} predictions imported from {args.import_file}")
+
+        if args.max_mb is not None and cache.total_bytes > cache.max_bytes:
+            cache.evict(cache.max_bytes)
+
+        if args.export_file is not None:
+            print(f"{cache.export_jsonl(args.export_file)} predictions exported to {args.export_file}")
+
+        print(cache.stats())
+        cache.close()
+
+
+    # main entry point
+    main()
@@ -1,58 +1,105 @@
 # -*- coding: utf-8 -*-
 """
 random_datetime.py: Generate a random datetime between two datetimes
+
+NOTES
+- datetimes are drawn uniformly over the interval [start_datetime; end_datetime], as an offset from the UNIX epoch
+    - with the default interval (1970-01-01 to 9999-12-31), this is the same distribution as drawing year, month, day, ...
+    independently and rejecting invalid dates, but without the retries
+
+- random_utc_datetimes() draws a batch of datetimes in one shot with NumPy (datetime64[us])
+
+- DaySampler draws datetimes whose date satisfies a condition (e.g adding a day stays in the same month) directly,
+    with the same distribution as drawing uniformly and rejecting the datetimes that do not satisfy the condition
+
 """
 
-from datetime import date, datetime
+from datetime import date, datetime, timedelta
+from random import Random, randint, randrange
+from typing import Callable, Iterator, Optional, Union
+
+# 3rd party
+import numpy as np
 from pytz import utc
-from random import randint
 
-def random_date(start_date : date, end_date : date = date(9999, 12, 31)):
 
+# all offsets are computed relative to the UNIX epoch
+EPOCH = datetime(1970, 1, 1)
+
+# default interval
+DEFAULT_START_DATETIME = datetime(1970, 1, 1, 0, 0, 0)
+DEFAULT_END_DATETIME = datetime(9999, 12, 31, 23, 59, 59, 999999)
+
+MICROSECONDS_PER_SECOND = 1_000_000
+SECONDS_PER_DAY = 86400
+
+# the Gregorian calendar repeats itself every 400 years, i.e every 146097 days (months, leap years and days of week)
+GREGORIAN_CYCLE_DAYS = 146097
+
+
+def to_epoch_microseconds(dt : datetime) -> int:
     """
-    random_date: generate a random date with year, month and day
+    to_epoch_microseconds: number of microseconds between the UNIX epoch and dt
 
-    NOTE: you can then use dt.localize() to then cast to another datetime
+    :param dt: a datetime; if it has a timezone, it is first moved to UTC
 
-    :param start_date: 
+    :return: an integer number of microseconds (negative before 1970)
+    """
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(utc).replace(tzinfo=None)
 
-    :param end_date: 
+    delta = dt - EPOCH
 
-    :return: a date with year, month and day
+    return (delta.days * 86400 + delta.seconds) * MICROSECONDS_PER_SECOND + delta.microseconds
+
+
+def epoch_offset_bounds(start_datetime : datetime, end_datetime : datetime, microseconds : bool = True):
     """
-    
+    epoch_offset_bounds: bounds of the offsets to draw from, inclusive
 
-    dt = None
+    :param microseconds: if True, offsets are in microseconds
+        if False, offsets are in whole seconds (i.e datetimes have no microseconds)
 
-    # keep looping until we find a valid date
-    # this is not very elegant/efficient but handles the cases where we don't know that maximum number of days possible in a month, as this depends on the month, leap year, leap century, etc
-    attempt = 0
-    while dt is None:
-        day = None
-        month = None
-        year = None
-            
-        try:
-            year = randint(start_date.year, end_date.year)
-            month = randint(start_date.month, end_date.month)
-            day = randint(start_date.day, end_date.day)
+    :return: 2-tuple (low, high) of integers
+    """
 
-            dt = date( year=year, month=month, day=day)
+    low = to_epoch_microseconds(start_datetime)
+    high = to_epoch_microseconds(end_datetime)
 
-        except Exception as e:
-            attempt += 1
+    if not microseconds:
+        # round the interval inwards to whole seconds
+        low = -(-low // MICROSECONDS_PER_SECOND)
+        high = high // MICROSECONDS_PER_SECOND
 
-            if attempt >= 50:
-                module_logger.warning(f"Error creating random datetime ({e}) | day : {day}, month : {month}, year : {year} => trying again")
+    if low > high:
+        raise ValueError(f"Empty interval: start {start_datetime} is after end {end_datetime}")
 
-                # reset counter
-                attempt = 0
-                
-                # try again...
+    return low, high
 
-    return dt
 
-def random_utc_datetime(start_datetime : datetime, end_datetime : datetime = None, microseconds : bool = True, timezone : bool = True):
+def random_date(start_date : date, end_date : date = date(9999, 12, 31), rng : Optional[Random] = None):
+
+    """
+    random_date: generate a random date with year, month and day
+
+    NOTE: you can then use dt.localize() to then cast to another datetime
+
+    :param start_date:
+
+    :param end_date:
+
+    :param rng: optional; random stream; if None, the random module is used
+
+    :return: a date with year, month and day
+    """
+
+    # draw the day uniformly between the two dates; no need to know the number of days in a month, leap years, etc.
+    _randint = rng.randint if rng is not None else randint
+
+    return date.fromordinal(_randint(start_date.toordinal(), end_date.toordinal()))
+
+
+def random_utc_datetime(start_datetime : datetime, end_datetime : datetime = None, microseconds : bool = True, timezone : bool = True, rng : Optional[Random] = None):
 
     """
     random_utc_datetime: generate a random datetime with year, month, day, hour, minute and second with UTC timezone
@@ -69,43 +116,392 @@ def random_utc_datetime(start_datetime : datetime, end_datetime : datetime = Non
     :param timezone: if True, UTC timezone is added
         if False, no timezone are added (set to None)
 
+    :param rng: optional; random stream; if None, the random module is used
+
     :return: a datetime with year, month, day, hour, minute and second with UTC timezone
     """
 
+    if start_datetime is None:
+        start_datetime = DEFAULT_START_DATETIME
+
+    if end_datetime is None:
+        end_datetime = DEFAULT_END_DATETIME
+
+    low, high = epoch_offset_bounds(start_datetime, end_datetime, microseconds=microseconds)
+
+    offset = rng.randint(low, high) if rng is not None else randint(low, high)
+
+    if microseconds:
+        dt = EPOCH + timedelta(microseconds=offset)
+    else:
+        dt = EPOCH + timedelta(seconds=offset)
+
+    # add UTC into the datetime
+    # NOTE: you can then use dt.localize() to then cast to another datetime
+    return dt.replace(tzinfo=utc) if timezone else dt
+
+
+def random_utc_datetimes(n : int
+                        , start_datetime : datetime = None
+                        , end_datetime : datetime = None
+                        , microseconds : bool = True
+                        , timezone : bool = True
+                        , as_datetime : bool = False
+                        , rng : Optional[np.random.Generator] = None
+                        ) -> Union[np.ndarray, Iterator[datetime]]:
+
+    """
+    random_utc_datetimes: generate n random datetimes in one shot
+
+    the datetimes are drawn as int64 offsets from the UNIX epoch, uniformly over [start_datetime; end_datetime]
+
+    :param n: number of datetimes to generate
+
+    :param start_datetime: start datetime; default is 1 1 1970
+
+    :param end_datetime: end datetime; default is 31 12 9999
+
+    :param microseconds: if True, random microseconds are added
+        if False, no microseconds are added (set to 0)
+
+    :param timezone: only used if as_datetime is True
+        if True, UTC timezone is added
+        if False, no timezone are added (set to None)
+
+    :param as_datetime: if False, return a NumPy array
+        if True, return an iterator of datetimes, materialised lazily
+
+    :param rng: optional; NumPy random generator; a new one is created if None
+
+    :return: a NumPy array of datetime64[us] (always in UTC, without timezone)
+        or an iterator of datetimes if as_datetime is True
+    """
+
+    if start_datetime is None:
+        start_datetime = DEFAULT_START_DATETIME
+
     if end_datetime is None:
-        end_datetime = datetime(9999, 12, 31, 23, 59, 59, 999999)
-    
-
-    dt = None
-
-
-
-    # keep looping until we find a valid datetime
-    # this is not very elegant/efficient but handles the cases where we don't know that maximum number of days possible in a month, as this depends on the month, leap year, leap century, etc
-    attempt = 0
-    while dt is None:
-        try:
-            year=randint(start_datetime.year, end_datetime.year)
-            month=randint(start_datetime.month, end_datetime.month)
-            day=randint(start_datetime.day, end_datetime.day)
-
-            dt = datetime(  year=year
-                            , month=month
-                            , day=day
-                            , hour=randint(start_datetime.hour, end_datetime.hour)
-                            , minute=randint(start_datetime.minute, end_datetime.minute)
-                            , second=randint(start_datetime.second, end_datetime.second)
-                            , microsecond=randint(start_datetime.microsecond, end_datetime.microsecond) if microseconds else 0
-
-                            # add UTC into the datetime
-                            # NOTE: you can then use dt.localize() to then cast to another datetime
-                            , tzinfo=utc if timezone else None
-                        )
-        except Exception as e:
-            attempt += 1
-
-            
-            #module_logger.warning(f"Error creating random datetime ({e}) | attempt {attempt} | day : {day}, month : {month}, year : {year} => trying again")
-                
-
-    return dt
\ No newline at end of file
+        end_datetime = DEFAULT_END_DATETIME
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    low, high = epoch_offset_bounds(start_datetime, end_datetime, microseconds=microseconds)
+
+    offsets = rng.integers(low, high, size=n, endpoint=True, dtype=np.int64)
+
+    if microseconds:
+        values = offsets.astype("datetime64[us]")
+    else:
+        values = offsets.astype("datetime64[s]").astype("datetime64[us]")
+
+    if as_datetime:
+        return iter_datetimes(values, timezone=timezone)
+
+    return values
+
+
+def iter_datetimes(values : np.ndarray, timezone : bool = True, chunk_size : int = 65536) -> Iterator[datetime]:
+    """
+    iter_datetimes: lazily convert an array of datetime64 to datetimes
+
+    :param values: NumPy array of datetime64, in UTC
+
+    :param timezone: if True, UTC timezone is added
+        if False, no timezone are added (set to None)
+
+    :param chunk_size: number of values converted at a time
+
+    :return: an iterator of datetimes
+    """
+
+    values = values.astype("datetime64[us]")
+
+    for idx in range(0, len(values), chunk_size):
+        for dt in values[idx : idx + chunk_size].tolist():
+            yield dt.replace(tzinfo=utc) if timezone else dt
+
+
+def iter_random_utc_datetimes(start_datetime : datetime = None
+                              , end_datetime : datetime = None
+                              , microseconds : bool = True
+                              , timezone : bool = True
+                              , rng : Optional[np.random.Generator] = None
+                              , batch_size : int = 4096
+                              ) -> Iterator[datetime]:
+    """
+    iter_random_utc_datetimes: an endless stream of random datetimes, drawn in batches of batch_size
+
+    use this in generators that consume one datetime per observation, but do not know in advance
+    how many observations will be skipped
+
+    :return: an (infinite) iterator of datetimes; see random_utc_datetimes() for the parameters
+    """
+
+    if rng is None:
+        rng = np.random.default_rng()
+
+    while True:
+        yield from random_utc_datetimes(batch_size
+                                        , start_datetime=start_datetime
+                                        , end_datetime=end_datetime
+                                        , microseconds=microseconds
+                                        , timezone=timezone
+                                        , as_datetime=True
+                                        , rng=rng
+                                        )
+
+
+def shift_condition(shift : Callable[[np.ndarray], np.ndarray], same_month : int) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    shift_condition: condition on a date, that the shifted date stays in (or leaves) the month of the date
+
+    :param shift: vectorised shift of dates: NumPy array of datetime64[D] -> NumPy array of datetime64[D],
+        e.g arithmetic_task.ArithmeticTask.date_shift()
+
+    :param same_month:
+        * 1: the shifted date has the same month as the date
+        * -1: the shifted date has a different month than the date, in the same year
+
+    :return: a vectorised condition: NumPy array of datetime64[D] -> NumPy array of bool
+    """
+
+    if same_month not in (1, -1):
+        raise ValueError(f"Unhandled 'same_month' : {same_month} ({type(same_month)})")
+
+    def condition(dates : np.ndarray) -> np.ndarray:
+        return same_month_mask(dates, shift(dates), same_month)
+
+    return condition
+
+
+def same_month_mask(values : np.ndarray, shifted : np.ndarray, same_month : int) -> np.ndarray:
+    """
+    same_month_mask: vectorised same month filter, e.g of iso8601_tasks
+
+    :param values: NumPy array of datetime64
+
+    :param shifted: NumPy array of datetime64, same length as values
+
+    :param same_month: see shift_condition()
+
+    :return: NumPy array of bool
+    """
+
+    # NOTE: month of the year [0-11]
+    months = values.astype("datetime64[M]").astype(np.int64) % 12
+    shifted_months = shifted.astype("datetime64[M]").astype(np.int64) % 12
+
+    if same_month == 1:
+        return months == shifted_months
+
+    if same_month == -1:
+        same_year = values.astype("datetime64[Y]") == shifted.astype("datetime64[Y]")
+
+        return (months != shifted_months) & same_year
+
+    raise ValueError(f"Unhandled 'same_month' : {same_month} ({type(same_month)})")
+
+
+def day_shift_condition(days : int, same_month : int) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    day_shift_condition: condition on a date, that the date shifted by a number of days stays in (or leaves) its month
+
+    :param days: number of days added to the date; negative to subtract days
+
+    :param same_month: see shift_condition()
+    """
+    return shift_condition(lambda dates : dates + np.timedelta64(days, "D"), same_month)
+
+
+class DaySampler:
+
+    """
+    DaySampler: draw datetimes uniformly among the datetimes of [start_datetime; end_datetime] whose date satisfies a condition
+
+    NOTES
+    - the distribution is exactly the one of random_utc_datetime() followed by rejecting the datetimes whose date
+        does not satisfy the condition, but each datetime costs a single draw
+    - the condition is evaluated once, on the days of one 400-year Gregorian cycle; it must therefore only depend on the
+        position of the date in the calendar (month, day, leap year, day of week, ...), e.g day_shift_condition()
+
+    USAGE
+        sampler = DaySampler(day_shift_condition(1, -1), microseconds=False, timezone=False)
+
+        dt = sampler(rng)       # the last day of a month, except December
+
+        # batches, with NumPy
+        values = sampler.sample(1000, np_rng)   # datetime64[us]
+    """
+
+    def __init__(self
+                , condition : Callable[[np.ndarray], np.ndarray]
+                , start_datetime : datetime = None
+                , end_datetime : datetime = None
+                , microseconds : bool = True
+                , timezone : bool = True
+                ):
+        """
+        :param condition: vectorised condition on dates: NumPy array of datetime64[D] -> NumPy array of bool
+
+        :param start_datetime: start datetime; default is 1 1 1970
+
+        :param end_datetime: end datetime; default is 31 12 9999
+
+        :param microseconds: if True, random microseconds are added
+            if False, no microseconds are added (set to 0)
+
+        :param timezone: if True, UTC timezone is added
+            if False, no timezone are added (set to None)
+        """
+
+        if start_datetime is None:
+            start_datetime = DEFAULT_START_DATETIME
+
+        if end_datetime is None:
+            end_datetime = DEFAULT_END_DATETIME
+
+        self.microseconds = microseconds
+        self.timezone = timezone
+
+        # offsets are drawn in microseconds or seconds; see epoch_offset_bounds()
+        self.units_per_day = SECONDS_PER_DAY * (MICROSECONDS_PER_SECOND if microseconds else 1)
+
+        low, high = epoch_offset_bounds(start_datetime, end_datetime, microseconds=microseconds)
+
+        # days since the UNIX epoch, and offsets within the first and the last days
+        self.first_day, self.first_unit = divmod(low, self.units_per_day)
+        self.last_day, self.last_unit = divmod(high, self.units_per_day)
+
+        # accepted days of one cycle, starting at the UNIX epoch; the day d is accepted if accepted[d % GREGORIAN_CYCLE_DAYS]
+        cycle = np.arange(GREGORIAN_CYCLE_DAYS, dtype=np.int64).astype("datetime64[D]")
+        self.accepted = np.asarray(condition(cycle), dtype=bool)
+
+        # cumulative[i]: number of accepted days before the day i of the cycle
+        self.cumulative = np.concatenate([[0], np.cumsum(self.accepted, dtype=np.int64)])
+        self.accepted_per_cycle = int(self.cumulative[-1])
+
+        # the interval is split in the (partial) first day, the whole days in between and the (partial) last day
+        if self.first_day == self.last_day:
+            self.head = self.last_unit - self.first_unit + 1 if self.is_accepted(self.first_day) else 0
+            self.middle_start = 0
+            self.middle = 0
+            self.tail = 0
+        else:
+            self.head = self.units_per_day - self.first_unit if self.is_accepted(self.first_day) else 0
+            self.middle_start = self.count_before(self.first_day + 1)
+            self.middle = self.count_before(self.last_day) - self.middle_start
+            self.tail = self.last_unit + 1 if self.is_accepted(self.last_day) else 0
+
+        # number of datetimes to draw from
+        self.size = self.head + self.middle * self.units_per_day + self.tail
+
+        if self.size == 0:
+            raise ValueError(f"No datetime between {start_datetime} and {end_datetime} satisfies the condition")
+
+    def is_accepted(self, day : int) -> bool:
+        """
+        is_accepted: True if the day (days since the UNIX epoch) satisfies the condition
+        """
+        return bool(self.accepted[day % GREGORIAN_CYCLE_DAYS])
+
+    def count_before(self, day : int) -> int:
+        """
+        count_before: number of accepted days before the day (days since the UNIX epoch), counted from the cycle of the UNIX epoch
+        """
+        cycles, position = divmod(day, GREGORIAN_CYCLE_DAYS)
+
+        return cycles * self.accepted_per_cycle + int(self.cumulative[position])
+
+    def accepted_day(self, index : int) -> int:
+        """
+        accepted_day: the accepted day (days since the UNIX epoch) with a given index; inverse of count_before()
+        """
+        cycles, rank = divmod(index, self.accepted_per_cycle)
+
+        return cycles * GREGORIAN_CYCLE_DAYS + int(np.searchsorted(self.cumulative, rank, side="right")) - 1
+
+    def offset(self, draw : int) -> int:
+        """
+        offset: the offset from the UNIX epoch (in microseconds or seconds) of a draw in [0; size)
+        """
+        if draw < self.head:
+            return self.first_day * self.units_per_day + self.first_unit + draw
+
+        draw -= self.head
+        if draw < self.middle * self.units_per_day:
+            index, unit = divmod(draw, self.units_per_day)
+            return self.accepted_day(self.middle_start + index) * self.units_per_day + unit
+
+        return self.last_day * self.units_per_day + draw - self.middle * self.units_per_day
+
+    def __call__(self, rng : Optional[Random] = None) -> datetime:
+        """
+        draw a datetime
+
+        :param rng: optional; random stream; if None, the random module is used
+
+        :return: a datetime, with UTC timezone if timezone is True
+        """
+
+        draw = rng.randrange(self.size) if rng is not None else randrange(self.size)
+
+        if self.microseconds:
+            dt = EPOCH + timedelta(microseconds=self.offset(draw))
+        else:
+            dt = EPOCH + timedelta(seconds=self.offset(draw))
+
+        return dt.replace(tzinfo=utc) if self.timezone else dt
+
+    def sample(self, n : int, rng : Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        sample: draw n datetimes in one shot; vectorised version of __call__()
+
+        :param n: number of datetimes to draw
+
+        :param rng: optional; NumPy random generator; a new one is created if None
+
+        :return: a NumPy array of datetime64[us] (always in UTC, without timezone)
+        """
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        draws = rng.integers(0, self.size, size=n, dtype=np.int64)
+
+        units_per_day = self.units_per_day
+
+        # draws in the first day
+        offsets = self.first_day * units_per_day + self.first_unit + draws
+
+        # draws in the whole days in between
+        draws = draws - self.head
+        middle = (draws >= 0) & (draws < self.middle * units_per_day)
+
+        index, unit = np.divmod(draws[middle], units_per_day)
+        cycles, rank = np.divmod(self.middle_start + index, self.accepted_per_cycle)
+        days = cycles * GREGORIAN_CYCLE_DAYS + np.searchsorted(self.cumulative, rank, side="right") - 1
+
+        offsets[middle] = days * units_per_day + unit
+
+        # draws in the last day
+        tail = draws >= self.middle * units_per_day
+        offsets[tail] = self.last_day * units_per_day + draws[tail] - self.middle * units_per_day
+
+        if self.microseconds:
+            return offsets.astype("datetime64[us]")
+
+        return offsets.astype("datetime64[s]").astype("datetime64[us]")
+
+    def iter_samples(self, rng : Optional[np.random.Generator] = None, batch_size : int = 4096) -> Iterator[datetime]:
+        """
+        iter_samples: an endless stream of datetimes, drawn in batches of batch_size with sample()
+
+        :return: an (infinite) iterator of datetimes, with UTC timezone if timezone is True
+        """
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        while True:
+            yield from iter_datetimes(self.sample(batch_size, rng), timezone=self.timezone)
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+random_state.py: Seeded random streams for the generators
+
+A run is defined by a seed; the same seed generates the same observations.
+
+Large runs can be split into shards (e.g chunks of a parallel run, or nodes of a cluster): each shard has its own
+independent stream, derived from the seed of the run and the index of the shard with NumPy's SeedSequence.
+A shard can therefore be (re)generated on its own, without generating the other shards.
+
+USAGE
+    rng = make_rng(42)                  # a random.Random
+    rng = make_rng(shard_seed(42, 3))   # the stream of shard 3 of run 42
+
+"""
+
+from random import Random
+from typing import List, Optional, Union
+
+# 3rd party
+import numpy as np
+
+
+# a seed can be an integer, an existing stream, or None (random seed)
+Seed = Optional[Union[int, Random]]
+
+
+def make_rng(seed : Seed = None) -> Random:
+    """
+    make_rng: create a random stream
+
+    :param seed: an integer seed
+        - None: a new stream with a random seed
+        - Random: returned as is, so that a stream can be passed down to other generators
+
+    :return: random.Random
+    """
+    if isinstance(seed, Random):
+        return seed
+
+    return Random(seed)
+
+
+def numpy_rng(rng : Random) -> np.random.Generator:
+    """
+    numpy_rng: create a NumPy generator seeded from a random stream
+
+    :param rng: random.Random
+
+    :return: numpy.random.Generator
+    """
+    return np.random.default_rng(rng.getrandbits(128))
+
+
+def random_seed() -> int:
+    """
+    random_seed: a new random seed, e.g if the seed of a sharded run was not specified
+
+    :return: 128-bit integer
+    """
+    return int(np.random.SeedSequence().entropy)
+
+
+def shard_seed(seed : int, shard : int) -> int:
+    """
+    shard_seed: seed of a shard of a run
+
+    NOTE: the seed of a shard only depends on the seed of the run and the index of the shard (not on the number of shards)
+
+    :param seed: seed of the run
+
+    :param shard: index of the shard, 0, 1, 2, ...
+
+    :return: 128-bit integer
+    """
+    state = np.random.SeedSequence(seed, spawn_key=(shard,)).generate_state(4)
+
+    return int.from_bytes(state.tobytes(), "little")
+
+
+def shard_seeds(seed : int, num_shards : int) -> List[int]:
+    """
+    shard_seeds: seeds of the shards 0, 1, ..., num_shards - 1 of a run
+
+    :return: list of 128-bit integers
+    """
+    return [shard_seed(seed, shard) for shard in range(num_shards)]
@@ -0,0 +1,362 @@
+# -*- coding: utf-8 -*-
+"""
+scorer.py: Score model predictions against the DATETIME benchmark tasks, e.g a.2, year.2, iso8601.add.day.1.x
+
+Predictions are normalised with NormaliseString (unicode, tokens, whitespace; not lower case), then scored in bulk:
+- exact: the normalised prediction is the same string as the target
+- year ... second: accuracy of each component
+    - ISO-8601 targets (a.2, iso8601.*, natural_form.*): components parsed from the prediction, e.g 5951-02-11T01:12:31
+    - component targets (year.2, month.2, ...): the prediction as an integer, e.g "07" == "7"
+- abs_day_error: mean and median of |prediction - target| in days, for ISO-8601 targets
+    (for component targets, in units of the component)
+- parse_failures: predictions that cannot be parsed (e.g not YYYY-MM-DDTHH:MM:SS, or an invalid date)
+
+NOTES
+- a benchmark file is .jsonl (one {"input", "target"} per line), optionally gzipped (.jsonl.gz), or .json.gz
+    ({"meta" : ..., "data" : [{"idx", "input", "target", ...}, ...]})
+- a predictions file is .jsonl with a "prediction" key per line, or .txt with one prediction per line; optionally gzipped;
+    the predictions are in the same order as the benchmark
+- the ISO-8601 predictions are parsed as a NumPy array of fixed width strings, all rows at once
+
+USAGE
+    # one task
+    python3 scorer.py --benchmark ../../a.2/benchmark.jsonl --predictions a.2.jsonl
+
+    # all the tasks with a predictions file in predictions/, e.g predictions/a.2.jsonl, predictions/year.2.txt
+    python3 scorer.py --benchmark_dir ../.. --predictions_dir predictions --output_file scores.json
+
+"""
+
+# system
+import gzip
+import json
+from os import listdir
+from os.path import basename, dirname, exists, isdir, join
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# 3rd party
+import numpy as np
+
+# locals
+from normalise_string import NormaliseString
+
+
+COMPONENTS = ("year", "month", "day", "hour", "minute", "second")
+
+# YYYY-MM-DDTHH:MM:SS
+ISO8601_WIDTH = 19
+ISO8601_SEPARATORS = { 4 : b"-", 7 : b"-", 10 : b"T", 13 : b":", 16 : b":" }
+ISO8601_FIELDS = ((0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19))
+
+# names of the benchmark and predictions files, in order of preference
+BENCHMARK_FILES = ("benchmark.jsonl", "benchmark.jsonl.gz", "benchmark.json.gz")
+PREDICTION_EXTENSIONS = (".jsonl", ".jsonl.gz", ".txt", ".txt.gz")
+
+
+class TaskScore(NamedTuple):
+
+    """
+    TaskScore: scores of the predictions of one task
+    """
+
+    task : str                                      # e.g a.2
+    rows : int
+    exact : float                                   # share of exact matches
+    components : Dict[str, float]                   # accuracy of each component, e.g {"year" : 0.98, ...}
+    parse_failures : int
+    mean_abs_error : Optional[float]                # days for ISO-8601 targets; None if no prediction could be parsed
+    median_abs_error : Optional[float]
+
+
+def open_text(filename : str):
+    """
+    open_text: open a text file, gzipped if the name ends with .gz
+    """
+    if filename.endswith(".gz"):
+        return gzip.open(filename, "rt", encoding="utf-8")
+
+    return open(filename, "r", encoding="utf-8")
+
+
+def load_benchmark(filename : str) -> List[dict]:
+    """
+    load_benchmark: the rows of a benchmark file (.jsonl, .jsonl.gz or .json.gz), in order, e.g {"input" : ..., "target" : ...}
+    """
+    if filename.endswith(".json.gz"):
+        with open_text(filename) as f:
+            return json.load(f)["data"]
+
+    with open_text(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_targets(filename : str) -> List[str]:
+    """
+    load_targets: the targets of a benchmark file (.jsonl, .jsonl.gz or .json.gz), in order
+    """
+    return [row["target"] for row in load_benchmark(filename)]
+
+
+def load_predictions(filename : str) -> List[Optional[str]]:
+    """
+    load_predictions: the predictions of a .jsonl file ("prediction" key) or a .txt file (one per line), in order
+
+    NOTE: a missing or null prediction is None, and scored as wrong
+    """
+    with open_text(filename) as f:
+        if ".jsonl" in basename(filename):
+            return [json.loads(line).get("prediction") for line in f if line.strip()]
+
+        return f.read().splitlines()
+
+
+def task_component(task : str) -> Optional[str]:
+    """
+    task_component: the component of a component task, e.g year.2 => year; None for ISO-8601 targets, e.g a.2
+    """
+    component = task.split(".")[0]
+
+    return component if component in COMPONENTS else None
+
+
+def parse_iso8601(values : List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    parse_iso8601: parse YYYY-MM-DDTHH:MM:SS strings in bulk
+
+    :return: 2-tuple
+        1. components, NumPy array (n, 6) of int64: year, month, day, hour, minute, second
+        2. valid, NumPy array (n,) of bool: the string has the right format, and is a valid date and time
+    """
+    n = len(values)
+
+    # NOTE: strings of another length, or not ASCII, are replaced with an empty string, which is not valid
+    fixed = [value if value is not None and len(value) == ISO8601_WIDTH and value.isascii() else "" for value in values]
+    chars = np.array(fixed, dtype=f"S{ISO8601_WIDTH}").view(np.uint8).reshape(n, ISO8601_WIDTH)
+
+    valid = np.ones(n, dtype=bool)
+    for position, separator in ISO8601_SEPARATORS.items():
+        valid &= chars[:, position] == ord(separator)
+
+    # NOTE: uint8 wraps around, i.e characters below "0" become > 9
+    digits = chars - np.uint8(ord("0"))
+
+    components = np.empty((n, len(ISO8601_FIELDS)), dtype=np.int64)
+    for idx, (start, end) in enumerate(ISO8601_FIELDS):
+        field = digits[:, start:end]
+        valid &= (field <= 9).all(axis=1)
+
+        components[:, idx] = field @ (10 ** np.arange(end - start - 1, -1, -1, dtype=np.int64))
+
+    year, month, day, hour, minute, second = components.T
+
+    valid &= (month >= 1) & (month <= 12) & (day >= 1) & (hour <= 23) & (minute <= 59) & (second <= 59)
+
+    # day within the month
+    months = ((year - 1970) * 12 + np.clip(month, 1, 12) - 1).astype("datetime64[M]")
+    valid &= (months.astype("datetime64[D]") + np.maximum(day - 1, 0)).astype("datetime64[M]") == months
+
+    return components, valid
+
+
+def epoch_days(components : np.ndarray) -> np.ndarray:
+    """
+    epoch_days: days since 1970-01-01 of the dates of parse_iso8601() components (only meaningful for valid rows)
+    """
+    year, month, day = components[:, 0], np.clip(components[:, 1], 1, 12), components[:, 2]
+
+    months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+
+    return (months.astype("datetime64[D]") - np.datetime64(0, "D")).astype(np.int64) + day - 1
+
+
+def parse_integers(values : List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    parse_integers: parse predictions of component tasks as integers, e.g "07" => 7
+
+    :return: 2-tuple: values (int64) and valid (bool), NumPy arrays (n,)
+    """
+    valid = np.array([value is not None and 0 < len(value) <= 9 and value.isascii() and value.isdigit() for value in values], dtype=bool)
+    parsed = np.array([int(value) if ok else 0 for value, ok in zip(values, valid)], dtype=np.int64)
+
+    return parsed, valid
+
+
+class Scorer:
+
+    """
+    Scorer: score predictions against benchmark targets
+    """
+
+    def __init__(self, workers : int = None):
+        """
+        :param workers: optional; number of worker processes to normalise the predictions; see NormaliseString.normalise_many()
+        """
+        self.normalise_string = NormaliseString()
+        self.workers = workers
+
+    def normalise(self, values : List[Optional[str]]) -> List[Optional[str]]:
+        """
+        normalise: normalise predictions or targets; not lower case, e.g the T of ISO-8601 is kept
+        """
+        return self.normalise_string.normalise_many(values, to_lower=False, workers=self.workers)
+
+    def score(self, task : str, targets : List[str], predictions : List[Optional[str]]) -> TaskScore:
+        """
+        score: score the predictions of a task
+
+        :param task: task name, e.g a.2, year.2, iso8601.add.day.1.x
+
+        :param targets: targets of the benchmark, in order
+
+        :param predictions: predictions, in the same order as targets
+
+        :return: TaskScore
+        """
+        if len(predictions) != len(targets):
+            raise ValueError(f"{task}: {len(predictions)} predictions for {len(targets)} targets")
+
+        n = len(targets)
+        if n == 0:
+            raise ValueError(f"{task}: no targets")
+
+        targets = self.normalise(targets)
+        predictions = self.normalise(predictions)
+
+        exact = float(np.mean(np.array(predictions, dtype=object) == np.array(targets, dtype=object)))
+
+        component = task_component(task)
+
+        if component is None:
+            target_components, target_valid = parse_iso8601(targets)
+            if not target_valid.all():
+                raise ValueError(f"{task}: target '{targets[int(np.flatnonzero(~target_valid)[0])]}' is not an ISO-8601 datetime")
+
+            predicted_components, valid = parse_iso8601(predictions)
+
+            correct = (predicted_components == target_components) & valid[:, None]
+            components = { name : float(correct[:, idx].mean()) for idx, name in enumerate(COMPONENTS) }
+
+            errors = np.abs(epoch_days(predicted_components) - epoch_days(target_components))[valid]
+
+        else:
+            target_values, target_valid = parse_integers(targets)
+            if not target_valid.all():
+                raise ValueError(f"{task}: target '{targets[int(np.flatnonzero(~target_valid)[0])]}' is not an integer")
+
+            predicted_values, valid = parse_integers(predictions)
+
+            components = { component : float(((predicted_values == target_values) & valid).mean()) }
+
+            errors = np.abs(predicted_values - target_values)[valid]
+
+        return TaskScore(task
+                        , n
+                        , exact
+                        , components
+                        , int(n - valid.sum())
+                        , float(errors.mean()) if len(errors) > 0 else None
+                        , float(np.median(errors)) if len(errors) > 0 else None
+                        )
+
+    def score_files(self, benchmark_file : str, predictions_file : str, task : str = None) -> TaskScore:
+        """
+        score_files: score a predictions file against a benchmark file
+
+        :param task: optional; task name; default is the name of the benchmark directory, e.g a.2
+        """
+        if task is None:
+            task = basename(dirname(benchmark_file))
+
+        return self.score(task, load_targets(benchmark_file), load_predictions(predictions_file))
+
+
+def find_benchmark_file(task_dir : str) -> Optional[str]:
+    """
+    find_benchmark_file: the benchmark file of a task directory, e.g a.2/benchmark.jsonl
+    """
+    for name in BENCHMARK_FILES:
+        if exists(join(task_dir, name)):
+            return join(task_dir, name)
+
+    return None
+
+
+def find_predictions_file(predictions_dir : str, task : str) -> Optional[str]:
+    """
+    find_predictions_file: the predictions file of a task, e.g predictions/a.2.jsonl
+    """
+    for extension in PREDICTION_EXTENSIONS:
+        if exists(join(predictions_dir, task + extension)):
+            return join(predictions_dir, task + extension)
+
+    return None
+
+
+def summary_table(scores : List[TaskScore]) -> str:
+    """
+    summary_table: one line per task; components in %, errors in days (or units of the component)
+    """
+    lines = [f"{'task':<28} {'rows':>7} {'exact':>7} " + " ".join(f"{name:>7}" for name in COMPONENTS) + f" {'fails':>6} {'mean_err':>9} {'med_err':>8}"]
+
+    for score in scores:
+        components = " ".join(f"{100 * score.components[name]:>7.2f}" if name in score.components else f"{'':>7}" for name in COMPONENTS)
+        mean_error = f"{score.mean_abs_error:>9.2f}" if score.mean_abs_error is not None else f"{'':>9}"
+        median_error = f"{score.median_abs_error:>8.1f}" if score.median_abs_error is not None else f"{'':>8}"
+
+        lines.append(f"{score.task:<28} {score.rows:>7} {100 * score.exact:>7.2f} {components} {score.parse_failures:>6} {mean_error} {median_error}")
+
+    return "\n".join(lines)
+
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+    from time import time
+
+
+    def main():
+
+        # init command line arguments
+        cmd_line_parser = ArgumentParser(description='score model predictions against the DATETIME benchmark tasks')
+        cmd_line_parser.add_argument('--benchmark', type=str, default=None, help='benchmark file of one task, e.g ../../a.2/benchmark.jsonl')
+        cmd_line_parser.add_argument('--predictions', type=str, default=None, help='predictions file of one task, e.g a.2.jsonl')
+        cmd_line_parser.add_argument('--task', type=str, default=None, help='optional; task name of --benchmark; default is its directory name')
+        cmd_line_parser.add_argument('--benchmark_dir', type=str, default=None, help='directory of the task directories, e.g ../..')
+        cmd_line_parser.add_argument('--predictions_dir', type=str, default=None, help='directory of the predictions files, named after the tasks, e.g predictions/a.2.jsonl')
+        cmd_line_parser.add_argument('--workers', type=int, default=None, help='optional; number of worker processes to normalise the predictions')
+        cmd_line_parser.add_argument('--output_file', type=str, default=None, help='optional; json file of the scores')
+        args = cmd_line_parser.parse_args()
+
+        scorer = Scorer(workers=args.workers)
+        start = time()
+
+        if args.benchmark is not None and args.predictions is not None:
+            scores = [scorer.score_files(args.benchmark, args.predictions, task=args.task)]
+
+        elif args.benchmark_dir is not None and args.predictions_dir is not None:
+            scores = []
+            for task in sorted(listdir(args.benchmark_dir)):
+                task_dir = join(args.benchmark_dir, task)
+                benchmark_file = find_benchmark_file(task_dir) if isdir(task_dir) else None
+                predictions_file = find_predictions_file(args.predictions_dir, task)
+
+                if benchmark_file is not None and predictions_file is not None:
+                    scores.append(scorer.score(task, load_targets(benchmark_file), load_predictions(predictions_file)))
+
+            if len(scores) == 0:
+                raise RuntimeError(f"No predictions in {args.predictions_dir} for the tasks in {args.benchmark_dir}")
+
+        else:
+            cmd_line_parser.error("expected --benchmark and --predictions, or --benchmark_dir and --predictions_dir")
+
+        print(summary_table(scores))
+        print(f"{sum(score.rows for score in scores)} predictions scored in {time() - start:.2f}s")
+
+        if args.output_file is not None:
+            with open(args.output_file, "w", encoding="utf-8") as f:
+                json.dump([score._asdict() for score in scores], f, indent=2)
+
+
+    # main entry point
+    main()
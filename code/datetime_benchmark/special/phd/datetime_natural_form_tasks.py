@@ -14,16 +14,23 @@ python3 datetime_natural_form_tasks.py add.day.1 1000 --schemas "day-month-yyyy,
 # -------
 
 from collections import namedtuple
+from sys import maxsize
 from datetime import date, datetime, time, timedelta
 from typing import Any, List, Set, Dict, Tuple, Optional, Union, Iterable, Iterator
 
 
 # locals
-from random_datetime import random_utc_datetime
+from arithmetic_task import parse_task
+from random_datetime import DaySampler, shift_condition
+from random_state import Seed, make_rng
 from training_pair import TrainingPair
 from dates.datetime.generate16_23 import Generate as BaseGenerator
 
 
+# the components shown by all input strings
+REQUIRED_COMPONENTS = ("year", "month", "day", "hour", "minute", "second")
+
+
 # -----
 # class
 # -----
@@ -53,6 +60,7 @@ class Generate:
                 , start_date = None # for compatibility with the generic signature of the generate() function
                 , schemas : List[str] = None
                 , locale_schema : str = "mini.10"
+                , seed : Seed = None
                 ) -> Iterator[ Tuple[ TrainingPair, Any] ]:
 
         """
@@ -69,6 +77,8 @@ class Generate:
             * -1: only the observations are kept where the output month is different to the input month
                 if the year is different, observation is discarded   
 
+            NOTE: the input datetimes are drawn directly among the datetimes that satisfy the condition (see random_datetime.DaySampler)
+
         :param schemas: optional; list schemas to be used; at the moment only month-day and day-month are supported
             a schema is a group of formats, grouped according to some logic, e.g day first, month first, etc
             if None, all available schemas are used
@@ -82,6 +92,8 @@ class Generate:
 
         :param start_date: optional; start date(time) of the dates; a default value will be generated if None
 
+        :param seed: optional; seed (or random.Random) for a reproducible run
+
         :return: function is a generator -> an iterator of 2-tuples
             1. TrainingPairs (namedtuple)
             2. the input number
@@ -101,9 +113,30 @@ class Generate:
             
         assert isinstance(output, str)
 
+        rng = make_rng(seed)
+
+        # the task is parsed once, e.g add.day.1 => ArithmeticTask("add", "day", 1)
+        task = parse_task(output)
+
+        if task is None and output != "model":
+            raise NotImplementedError(f"Unhandled output format '{output}'")
+
+        if task is None and same_month != 0:
+            raise ValueError(f"'same_month' {same_month} requires an arithmetic task; got '{output}'")
+
+        # same month filters: if the resulting month only depends on the date (e.g add.day.1), draw the input datetimes among
+        # the datetimes whose month is kept
+        # NOTE: same distribution as drawing all datetimes and discarding the observations, without the discarded observations
+        # NOTE: otherwise (e.g add.hour.5), the observations whose month is not kept are discarded below
+        sampler = None
+        if same_month != 0 and task.is_date_shift:
+            sampler = DaySampler(shift_condition(task.date_shift(), same_month), start_datetime=start_date, microseconds=False, timezone=False)
+
         # use the source generator to generate a datetime in human form
+        # NOTE: only the format specs showing all of REQUIRED_COMPONENTS are drawn
+        # NOTE: the source is endless; observations can still be discarded below (e.g output datetime out of range)
         source = self.source_generator.generate("model"
-                                                , num_observations * 1000
+                                                , maxsize
                                                 , locale_schema=locale_schema
                                                 , schemas=schemas
                                                 , month_schema=month_schema
@@ -111,6 +144,9 @@ class Generate:
                                                 , add_timezone=False
                                                 , store_visible_components=True
                                                 , remove_random_component_probability=0.0
+                                                , required_components=REQUIRED_COMPONENTS
+                                                , sampler=sampler
+                                                , seed=rng
                                                 )
        
         idx = 0
@@ -118,16 +154,12 @@ class Generate:
 
             training_pair, _dt = next(source)
 
-            
             assert "visible_components" in training_pair.aux
-            #print(f"{idx} | input : {training_pair.input}")
+            #print(f"input : {training_pair.input}")
             #print(f"visible_components : {training_pair.aux}") 
 
-            if "minute" not in training_pair.aux["visible_components"]:
-                continue
-
-            if "second" not in training_pair.aux["visible_components"]:
-                continue
+            assert "minute" in training_pair.aux["visible_components"]
+            assert "second" in training_pair.aux["visible_components"]
 
             input_dt = _dt
                 #datetime(year=_dt.year
@@ -148,49 +180,19 @@ class Generate:
            
             input_str = training_pair.input
             
-            if output == "model":
+            if task is None:
                 output_str = self.model_name
-            
-            elif output == "add.day.1":
-                output_dt = input_dt + timedelta(days=1)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.2":
-                output_dt = input_dt + timedelta(days=2)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.10":
-                output_dt = input_dt + timedelta(days=10)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.20":
-                output_dt = input_dt + timedelta(days=20)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.50":
-                output_dt = input_dt + timedelta(days=50)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.100":
-                output_dt = input_dt + timedelta(days=100)
-                output_str = output_dt.isoformat()
-            
-            elif output == "add.day.250":
-                output_dt = input_dt + timedelta(days=250)
-                output_str = output_dt.isoformat()
-
-            elif output == "subtract.day.1":
-                output_dt = input_dt - timedelta(days=1)
-                output_str = output_dt.isoformat()
+            else:
+                # NOTE: the output datetime can be out of range, e.g 9999-12-31 + 1 day => skip
+                try:
+                    output_dt = task.apply(input_dt)
+                except OverflowError:
+                    continue
 
-            elif output == "subtract.day.2":
-                output_dt = input_dt - timedelta(days=2)
                 output_str = output_dt.isoformat()
-
-            else:
-                raise NotImplementedError(f"Unhandled output format '{output}'")
             
             # same month filters
+            # NOTE: with a sampler, all datetimes are accepted
             accepted = False
             if same_month == 0:
                 accepted = True
@@ -221,6 +223,7 @@ class Generate:
 if __name__ == "__main__":
 
     from argparse import ArgumentParser
+    from training_pair_sink import open_sink
 
     def main():
 
@@ -240,7 +243,11 @@ if __name__ == "__main__":
         cmd_line_parser.add_argument('--inputs', default=False, dest='inputs', action='store_true', help='show inputs only')
         cmd_line_parser.add_argument('--targets', default=False, dest='targets', action='store_true', help='only show targetsuts in compact form')
         cmd_line_parser.add_argument('--outputs', default=False, dest='outputs', action='store_true', help='show outputs only')
+        cmd_line_parser.add_argument('--output_file', type=str, help='output file: .jsonl, .csv, optionally .gz, e.g benchmark.jsonl.gz', default=None)
+        cmd_line_parser.add_argument('--flush_size', type=int, help='number of rows buffered before writing to the output file', default=10000)
         
+        cmd_line_parser.add_argument('--seed', type=int, help='seed for a reproducible run', default=None)
+
         cmd_line_parser.add_argument('--debug', default=False, dest='debug', action='store_true', help='debugging')
         cmd_line_parser.add_argument('--debug2', default=False, dest='debug2', action='store_true', help='debugging')
         args = cmd_line_parser.parse_args()
@@ -263,11 +270,18 @@ if __name__ == "__main__":
         results = generator.generate(args.output
                                     , num_observations=args.num_observations
                                     , same_month=args.same_month
+                                    , seed=args.seed
                                     , month_schema=args.month_schema
                                     , locale_schema=args.locale_schema
                                     , schemas=schemas
                                     )
 
+        # write to a file; written to a temporary file and renamed on completion
+        if args.output_file:
+            with open_sink(args.output_file, flush_size=args.flush_size) as sink:
+                sink.write_many(results)
+            return
+
         # show output
         if args.preview_rows:
             print(f"\nfirst {args.preview_rows} rows")
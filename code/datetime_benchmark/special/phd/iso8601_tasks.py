@@ -5,9 +5,16 @@ iso8601_tasks.py: Various tasks based on an ISO-8601 input datetime
 
 USAGE
 python3 iso8601_tasks.py add.day.1 10
+python3 iso8601_tasks.py subtract.hour.5 10
+python3 iso8601_tasks.py add.business_day.10 10
+
+# tasks: <add|subtract>.<second|minute|hour|day|week|month|year|business_day>.<amount>, see arithmetic_task.py
 
 # only observations where the month has changed
 python3 iso8601_tasks.py add.day.1 10 --same_month -1
+
+# bulk: with --output_file, inputs and targets are generated and formatted as NumPy arrays (see generate_columns)
+python3 iso8601_tasks.py add.day.1 100000000 --seed 42 --output_file benchmark.jsonl
 """
 
 # -------
@@ -18,13 +25,61 @@ from collections import namedtuple
 from datetime import date, datetime, time, timedelta
 from typing import Any, List, Set, Dict, Tuple, Optional, Union, Iterable, Iterator
 
+# 3rd party
+import numpy as np
+
 
 # locals
-from random_datetime import random_utc_datetime
+from arithmetic_task import ArithmeticTask, parse_task
+from random_datetime import DaySampler, shift_condition, same_month_mask, iter_random_utc_datetimes, random_utc_datetimes
+from random_state import Seed, make_rng, numpy_rng
 from training_pair import TrainingPair
 
 
 
+# positions of the separators in an ISO 8601 datetime, e.g 7648-09-12T02:24:13
+ISO8601_SEPARATORS = { 4 : "-", 7 : "-", 10 : "T", 13 : ":", 16 : ":" }
+ISO8601_WIDTH = 19
+
+
+def iso8601_bytes(values : np.ndarray) -> np.ndarray:
+    """
+    iso8601_bytes: format datetime64 values as fixed-width ISO 8601 byte strings, e.g b'7648-09-12T02:24:13'
+    same as datetime.isoformat() without microseconds, or numpy.datetime_as_string(values, unit="s"), but written digit by digit
+    into a byte buffer
+
+    :param values: NumPy array of datetime64; the years must be in [1; 9999]
+
+    :return: NumPy array of bytes (dtype S19)
+    """
+
+    seconds = values.astype("datetime64[s]")
+    days = seconds.astype("datetime64[D]")
+    months = days.astype("datetime64[M]")
+    years = months.astype("datetime64[Y]")
+
+    fields = [ (0, 4, years.astype(np.int64) + 1970)
+             , (5, 2, (months - years.astype("datetime64[M]")).astype(np.int64) + 1)
+             , (8, 2, (days - months.astype("datetime64[D]")).astype(np.int64) + 1)
+             ]
+
+    minutes, second = np.divmod((seconds - days.astype("datetime64[s]")).astype(np.int64), 60)
+    hour, minute = np.divmod(minutes, 60)
+    fields += [ (11, 2, hour), (14, 2, minute), (17, 2, second) ]
+
+    buffer = np.empty((len(values), ISO8601_WIDTH), dtype=np.uint8)
+
+    for position, separator in ISO8601_SEPARATORS.items():
+        buffer[:, position] = ord(separator)
+
+    for position, width, field in fields:
+        for digit in range(width - 1, -1, -1):
+            field, buffer[:, position + digit] = np.divmod(field, 10)
+            buffer[:, position + digit] += ord("0")
+
+    return buffer.view(f"S{ISO8601_WIDTH}").ravel()
+
+
 # -----
 # class
 # -----
@@ -40,6 +95,32 @@ class Generate:
         # the core datalake type being generated (see Config.core_pandas_type_map)
         self.model_name = "ISO-8601-TASKS"
 
+
+    def resolve_task(self, output : str, same_month : int, start_date : datetime) -> Tuple[Optional[ArithmeticTask], Optional[DaySampler]]:
+        """
+        resolve_task: parse the task once, e.g add.day.1 => ArithmeticTask("add", "day", 1)
+
+        same month filters: if the resulting month only depends on the date (e.g add.day.1), the input datetimes are only
+        drawn among the datetimes whose month is kept; otherwise (e.g add.hour.5), the observations whose month is not kept are discarded
+
+        :return: 2-tuple
+            1. ArithmeticTask; None for output "model"
+            2. DaySampler of the input datetimes; None if the input datetimes are drawn uniformly
+        """
+
+        task = parse_task(output)
+
+        if task is None and output != "model":
+            raise NotImplementedError(f"Unhandled output format '{output}'")
+
+        if task is None and same_month != 0:
+            raise ValueError(f"'same_month' {same_month} requires an arithmetic task; got '{output}'")
+
+        sampler = None
+        if same_month != 0 and task.is_date_shift:
+            sampler = DaySampler(shift_condition(task.date_shift(), same_month), start_datetime=start_date, microseconds=False, timezone=False)
+
+        return task, sampler
       
     def generate(self
                 , output : str
@@ -48,6 +129,7 @@ class Generate:
                 , start_date = None # for compatibility with the generic signature of the generate() function
                 , schemas : List[str] = None
                 , locale_schema : str = "en_US"
+                , seed : Seed = None
                 ) -> Iterator[ Tuple[ TrainingPair, Any] ]:
 
         """
@@ -64,8 +146,13 @@ class Generate:
             * -1: only the observations are kept where the output month is different to the input month
                 if the year is different, observation is discarded   
 
+            NOTE: the input datetimes are drawn directly among the datetimes that satisfy the condition (see random_datetime.DaySampler),
+            with the same distribution as drawing all datetimes and discarding the observations
+
         :param start_date: optional; start date(time) of the dates; a default value will be generated if None
 
+        :param seed: optional; seed (or random.Random) for a reproducible run
+
         :return: function is a generator -> an iterator of 2-tuples
             1. TrainingPairs (namedtuple)
             2. the input number
@@ -84,60 +171,39 @@ class Generate:
                 raise RuntimeError(f"start_date {start_date} is not a datetime")
             
         assert isinstance(output, str)
+
+        rng = make_rng(seed)
+
+        task, sampler = self.resolve_task(output, same_month, start_date)
+
+        # NOTE: align with generate16.23 "iso8601" format
+        # no microseconds and no timezone => ISO8601 output is '7648-09-12 02:24:13'
+        if sampler is not None:
+            random_datetimes = sampler.iter_samples(rng=numpy_rng(rng))
+        else:
+            random_datetimes = iter_random_utc_datetimes(start_datetime=start_date, microseconds=False, timezone=False, rng=numpy_rng(rng))
        
         idx = 0
         while idx != num_observations:
 
-            # NOTE: align with generate16.23 "iso8601" format
-            # no microseconds and no timezone => ISO8601 output is '7648-09-12 02:24:13'
-            input_dt = random_utc_datetime(start_datetime=start_date, microseconds=False, timezone=False)
+            input_dt = next(random_datetimes)
             
             # same ISO8601 format as generate16.23, using isoformat()
             input_str = input_dt.isoformat()
             
-            if output == "model":
+            if task is None:
                 output_str = self.model_name
-            
-            elif output == "add.day.1":
-                output_dt = input_dt + timedelta(days=1)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.2":
-                output_dt = input_dt + timedelta(days=2)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.10":
-                output_dt = input_dt + timedelta(days=10)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.20":
-                output_dt = input_dt + timedelta(days=20)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.50":
-                output_dt = input_dt + timedelta(days=50)
-                output_str = output_dt.isoformat()
-
-            elif output == "add.day.100":
-                output_dt = input_dt + timedelta(days=100)
-                output_str = output_dt.isoformat()
-            
-            elif output == "add.day.250":
-                output_dt = input_dt + timedelta(days=250)
-                output_str = output_dt.isoformat()
-
-            elif output == "subtract.day.1":
-                output_dt = input_dt - timedelta(days=1)
-                output_str = output_dt.isoformat()
+            else:
+                # NOTE: the output datetime can be out of range, e.g 9999-12-31 + 1 day => skip
+                try:
+                    output_dt = task.apply(input_dt)
+                except OverflowError:
+                    continue
 
-            elif output == "subtract.day.2":
-                output_dt = input_dt - timedelta(days=2)
                 output_str = output_dt.isoformat()
-
-            else:
-                raise NotImplementedError(f"Unhandled output format '{output}'")
             
             # same month filters
+            # NOTE: with a sampler, all datetimes are accepted
             accepted = False
             if same_month == 0:
                 accepted = True
@@ -160,6 +226,81 @@ class Generate:
             idx += 1
             yield (TrainingPair(input=input_str, output=output_str, locale=None, aux=None), input_dt)
 
+    def generate_columns(self
+                        , output : str
+                        , num_observations : int
+                        , same_month : Optional[int] = None
+                        , start_date = None
+                        , seed : Seed = None
+                        , batch_size : int = 65536
+                        ) -> Iterator[ Tuple[ np.ndarray, np.ndarray] ]:
+        """
+        generate_columns: bulk version of generate(), without datetime objects
+        the inputs are drawn as NumPy datetime64 arrays, the task is applied to the whole array, and both columns are formatted
+        in bulk with iso8601_bytes()
+
+        NOTE: the same observations as generate() for the same seed
+
+        :param batch_size: number of datetimes drawn at a time
+
+        see generate() for the other parameters
+
+        :return: function is a generator -> an iterator of 2-tuples of NumPy arrays of ISO 8601 byte strings, at most batch_size each
+            1. inputs, e.g b'7648-09-12T02:24:13'
+            2. targets
+        """
+
+        if same_month is None:
+            same_month = 0
+
+        if start_date is None:
+            start_date = datetime(1970, 1, 1, 0, 0, 0)
+        elif not isinstance(start_date, datetime):
+            raise RuntimeError(f"start_date {start_date} is not a datetime")
+
+        if batch_size <= 0:
+            raise ValueError(f"batch_size must be positive; got {batch_size}")
+
+        rng = make_rng(seed)
+
+        task, sampler = self.resolve_task(output, same_month, start_date)
+
+        # NOTE: the same random stream as the iterators of generate()
+        np_rng = numpy_rng(rng)
+
+        # range of datetime, see datetime.MINYEAR and datetime.MAXYEAR
+        min_value = np.datetime64(datetime.min, "s")
+        max_value = np.datetime64(datetime.max, "s")
+
+        remaining = num_observations
+        while remaining > 0:
+
+            if sampler is not None:
+                inputs = sampler.sample(batch_size, np_rng).astype("datetime64[s]")
+            else:
+                inputs = random_utc_datetimes(batch_size, start_datetime=start_date, microseconds=False, rng=np_rng).astype("datetime64[s]")
+
+            if task is None:
+                inputs = inputs[:remaining]
+                yield iso8601_bytes(inputs), np.full(len(inputs), self.model_name.encode("ascii"))
+
+                remaining -= len(inputs)
+                continue
+
+            outputs = task.apply_many(inputs).astype("datetime64[s]")
+
+            # same as generate(): skip the outputs outside the range of datetime, and the months that are not kept
+            keep = (outputs >= min_value) & (outputs <= max_value)
+
+            if same_month != 0 and sampler is None:
+                keep &= same_month_mask(inputs, outputs, same_month)
+
+            inputs, outputs = inputs[keep][:remaining], outputs[keep][:remaining]
+
+            yield iso8601_bytes(inputs), iso8601_bytes(outputs)
+
+            remaining -= len(inputs)
+
 
 # -----
 # main
@@ -168,6 +309,7 @@ class Generate:
 if __name__ == "__main__":
 
     from argparse import ArgumentParser
+    from training_pair_sink import open_sink
 
     def main():
 
@@ -186,7 +328,12 @@ if __name__ == "__main__":
         cmd_line_parser.add_argument('--inputs', default=False, dest='inputs', action='store_true', help='show inputs only')
         cmd_line_parser.add_argument('--targets', default=False, dest='targets', action='store_true', help='only show targetsuts in compact form')
         cmd_line_parser.add_argument('--outputs', default=False, dest='outputs', action='store_true', help='show outputs only')
+        cmd_line_parser.add_argument('--output_file', type=str, help='output file: .jsonl, .csv, optionally .gz, e.g benchmark.jsonl.gz', default=None)
+        cmd_line_parser.add_argument('--flush_size', type=int, help='number of rows buffered before writing to the output file', default=10000)
+        cmd_line_parser.add_argument('--batch_size', type=int, help='number of observations generated at a time when writing to an output file', default=65536)
         
+        cmd_line_parser.add_argument('--seed', type=int, help='seed for a reproducible run', default=None)
+
         cmd_line_parser.add_argument('--debug', default=False, dest='debug', action='store_true', help='debugging')
         cmd_line_parser.add_argument('--debug2', default=False, dest='debug2', action='store_true', help='debugging')
         args = cmd_line_parser.parse_args()
@@ -198,9 +345,25 @@ if __name__ == "__main__":
         generator.debug = args.debug
         generator.debug2 = args.debug2
 
+        # write to a file; written to a temporary file and renamed on completion
+        # NOTE: bulk generation, same observations as generate()
+        if args.output_file:
+            columns = generator.generate_columns(args.output
+                                                , num_observations=args.num_observations
+                                                , same_month=args.same_month
+                                                , seed=args.seed
+                                                , batch_size=args.batch_size
+                                                )
+
+            with open_sink(args.output_file, flush_size=args.flush_size) as sink:
+                for inputs, targets in columns:
+                    sink.write_columns(inputs, targets)
+            return
+
         results = generator.generate(args.output
                                     , num_observations=args.num_observations
                                     , same_month=args.same_month
+                                    , seed=args.seed
                                     )
 
         # show output
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+timezone_pool.py: Preloaded pytz timezones, with the range of UTC instants each timezone can represent
+
+Moving a UTC datetime to a timezone with astimezone() raises OverflowError if the local time falls outside
+[datetime.min; datetime.max], e.g 9999-12-31T23:00:00 UTC in Pacific/Kiritimati (+14:00).
+The pool knows the valid range of each timezone, so a timezone can be drawn in one go among the timezones that can
+represent a given instant, instead of drawing again until astimezone() succeeds.
+
+NOTES
+- the distribution is the same as drawing again until astimezone() succeeds: uniform over the valid timezones
+- if all timezones are valid for an instant (i.e nearly always), the draw is rng.choice() over all timezones,
+    in the same order as pytz.all_timezones
+
+USAGE
+    pool = TimezonePool()
+
+    d = pool.astimezone(dt_utc, rng)     # dt_utc moved to a random timezone
+
+    # batches of instants (datetime64, UTC)
+    zone_indices = pool.random_zone_indices(instants, np_rng)
+    offsets = pool.utc_offsets(instants, zone_indices)   # seconds
+
+"""
+
+# system
+from datetime import datetime, timedelta, tzinfo
+from random import Random
+from typing import Iterable, List, Optional, Tuple
+
+# 3rd party
+import numpy as np
+from pytz import timezone, all_timezones
+
+
+class TimezonePool:
+
+    """
+    TimezonePool: preloaded pytz timezones and their valid ranges of UTC instants
+    """
+
+    def __init__(self, names : Iterable[str] = None):
+        """
+        :param names: optional; timezone names; default is pytz.all_timezones
+        """
+
+        self.names = tuple(names) if names is not None else tuple(all_timezones)
+
+        if len(self.names) == 0:
+            raise ValueError("TimezonePool needs at least one timezone")
+
+        self.zones = tuple(timezone(name) for name in self.names)
+
+        # transitions (UTC, datetime64[us]) and UTC offsets (seconds) of each zone
+        self.transition_times = []
+        self.transition_offsets = []
+
+        # valid range of naive UTC datetimes, inclusive, for each zone
+        self.valid_ranges = []
+
+        for zone in self.zones:
+            transition_times, offsets = self.zone_transitions(zone)
+
+            self.transition_times.append(np.array(transition_times, dtype="datetime64[us]"))
+            self.transition_offsets.append(np.array([offset.days * 86400 + offset.seconds for offset in offsets], dtype=np.int64))
+
+            # NOTE: before the first transition, the first offset applies; after the last transition, the last offset applies
+            low = datetime.min - offsets[0] if offsets[0] < timedelta(0) else datetime.min
+            high = datetime.max - offsets[-1] if offsets[-1] > timedelta(0) else datetime.max
+            self.valid_ranges.append((low, high))
+
+        # instants valid for all zones
+        self.all_valid_low = max(low for low, high in self.valid_ranges)
+        self.all_valid_high = min(high for low, high in self.valid_ranges)
+
+    def __len__(self) -> int:
+        return len(self.zones)
+
+    @staticmethod
+    def zone_transitions(zone : tzinfo) -> Tuple[List[datetime], List[timedelta]]:
+        """
+        zone_transitions: transitions of a pytz timezone
+
+        :return: 2-tuple
+            1. UTC transition times (naive datetimes), ascending; the first one is datetime.min
+            2. UTC offset from each transition on
+        """
+
+        # DstTzInfo, e.g Europe/Paris
+        if hasattr(zone, "_utc_transition_times"):
+            transition_times = list(zone._utc_transition_times)
+            offsets = [transition_info[0] for transition_info in zone._transition_info]
+
+            transition_times[0] = datetime.min
+            return transition_times, offsets
+
+        # StaticTzInfo (e.g Etc/GMT+5) and UTC
+        return [datetime.min], [zone.utcoffset(datetime(2000, 1, 1))]
+
+    def is_valid(self, zone_index : int, dt_utc : datetime) -> bool:
+        """
+        is_valid: True if dt_utc can be moved to the zone with astimezone()
+        """
+        low, high = self.valid_ranges[zone_index]
+
+        return low <= dt_utc.replace(tzinfo=None) <= high
+
+    def valid_zone_indices(self, dt_utc : datetime) -> List[int]:
+        """
+        valid_zone_indices: indices of the zones that can represent dt_utc
+        """
+        naive = dt_utc.replace(tzinfo=None)
+
+        return [zone_index for zone_index, (low, high) in enumerate(self.valid_ranges) if low <= naive <= high]
+
+    def random_zone_index(self, dt_utc : datetime, rng : Random) -> int:
+        """
+        random_zone_index: draw a zone uniformly among the zones that can represent dt_utc
+
+        :param dt_utc: datetime in UTC (naive or with UTC timezone)
+
+        :param rng: random stream
+
+        :return: index of the zone in self.zones
+        """
+        naive = dt_utc.replace(tzinfo=None)
+
+        # NOTE: same draw as rng.choice(self.names)
+        if self.all_valid_low <= naive <= self.all_valid_high:
+            return rng.choice(range(len(self.zones)))
+
+        candidates = self.valid_zone_indices(naive)
+        if len(candidates) == 0:
+            raise ValueError(f"No timezone can represent {dt_utc.isoformat()}")
+
+        return rng.choice(candidates)
+
+    def random_zone(self, dt_utc : datetime, rng : Random) -> tzinfo:
+        """
+        random_zone: draw a timezone uniformly among the zones that can represent dt_utc
+        """
+        return self.zones[self.random_zone_index(dt_utc, rng)]
+
+    def astimezone(self, dt_utc : datetime, rng : Random) -> datetime:
+        """
+        astimezone: move a UTC datetime to a random timezone
+
+        :param dt_utc: datetime with UTC timezone
+
+        :param rng: random stream
+
+        :return: datetime in a random timezone
+        """
+        return dt_utc.astimezone(self.random_zone(dt_utc, rng))
+
+    def random_zone_indices(self, instants : np.ndarray, rng : Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        random_zone_indices: draw a zone for each instant of a batch, uniformly among the zones that can represent the instant
+
+        :param instants: NumPy array of datetime64 (UTC)
+
+        :param rng: optional; NumPy random generator; a new one is created if None
+
+        :return: NumPy array of zone indices (int64)
+        """
+
+        if rng is None:
+            rng = np.random.default_rng()
+
+        instants = np.asarray(instants).astype("datetime64[us]")
+
+        zone_indices = rng.integers(0, len(self.zones), size=len(instants), dtype=np.int64)
+
+        # rare: instants that some zones cannot represent
+        edge = (instants < np.datetime64(self.all_valid_low, "us")) | (instants > np.datetime64(self.all_valid_high, "us"))
+        for idx in np.flatnonzero(edge):
+            candidates = self.valid_zone_indices(instants[idx].item())
+            if len(candidates) == 0:
+                raise ValueError(f"No timezone can represent {instants[idx]}")
+
+            zone_indices[idx] = candidates[rng.integers(0, len(candidates))]
+
+        return zone_indices
+
+    def utc_offsets(self, instants : np.ndarray, zone_indices : np.ndarray) -> np.ndarray:
+        """
+        utc_offsets: UTC offset of each instant in its zone, looked up in the transitions of the zones
+
+        :param instants: NumPy array of datetime64 (UTC)
+
+        :param zone_indices: NumPy array of zone indices, same length as instants; or a single zone index
+
+        :return: NumPy array of offsets in seconds (int64); local time = instant + offset
+        """
+
+        instants = np.asarray(instants).astype("datetime64[us]")
+        zone_indices = np.broadcast_to(np.asarray(zone_indices, dtype=np.int64), instants.shape)
+
+        offsets = np.empty(instants.shape, dtype=np.int64)
+
+        for zone_index in np.unique(zone_indices):
+            mask = zone_indices == zone_index
+
+            positions = np.searchsorted(self.transition_times[zone_index], instants[mask], side="right") - 1
+            offsets[mask] = self.transition_offsets[zone_index][np.maximum(positions, 0)]
+
+        return offsets
+
+
+# a pool shared by the generators of a process; see default_timezone_pool()
+_default_timezone_pool = None
+
+def default_timezone_pool() -> TimezonePool:
+    """
+    default_timezone_pool: the pool of all pytz timezones, created on first use and shared within the process
+    """
+    global _default_timezone_pool
+
+    if _default_timezone_pool is None:
+        _default_timezone_pool = TimezonePool()
+
+    return _default_timezone_pool
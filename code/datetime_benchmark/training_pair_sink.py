@@ -0,0 +1,567 @@
+# -*- coding: utf-8 -*-
+"""
+training_pair_sink.py: Stream TrainingPairs to JSONL, gzipped JSONL, CSV, Parquet or Arrow files
+
+- JSONL: one {"input": ..., "target": ...} object per line, the same format as the published benchmark.jsonl files
+    - e.g {"input": "tue 19th#january#6979, 2:08:40", "target": "1"}
+    - targets are written as strings (None as null)
+
+- CSV: "input","target" with all fields quoted and quotes escaped, without a header by default
+
+- compressed with gzip if the filename ends with .gz, e.g benchmark.jsonl.gz
+
+- Parquet (.parquet) and Arrow IPC (.arrow): columns input, target, locale, the datetime, the format spec and one column per
+    visible component (e.g visible_second = "{ss}", or null if the seconds are not shown), written in row groups
+    - e.g only rows with seconds: pyarrow.parquet.read_table(filename, filters=pyarrow.compute.field("visible_second").is_valid())
+    - requires pyarrow (optional dependency, imported on first use)
+
+NOTES
+- rows are formatted into a buffer, which is written to disk every flush_size rows; nothing else is held in memory
+- write_columns() writes whole columns of strings at once (e.g ISO 8601 strings from NumPy); if all the strings of a column
+    have the same length and nothing to escape, the lines are built in one shot as a fixed-width byte buffer
+- the rows are written to a temporary file next to the output file, which is renamed to the output file on close()
+    - an interrupted run never leaves a truncated output file behind
+
+USAGE
+    with open_sink("benchmark.jsonl.gz") as sink:
+        for training_pair, dt in generator.generate("iso8601", 1000000):
+            sink.write(training_pair, dt)
+
+    # columns of strings, e.g from numpy.datetime_as_string()
+    with open_sink("benchmark.jsonl") as sink:
+        sink.write_columns(inputs, targets)
+
+    # columnar; the generator stores the format spec and the visible components in aux
+    with open_sink("benchmark.parquet", components=generator.possible_components) as sink:
+        sink.write_many(generator.generate("iso8601", 1000000, store_format_spec=True, store_visible_components=True))
+
+"""
+
+# system
+import csv
+import gzip
+import json
+import os
+from io import StringIO
+from datetime import date, datetime, time, timezone
+from os.path import abspath, basename, dirname
+from tempfile import mkstemp
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# 3rd party
+import numpy as np
+
+# locals
+from training_pair import TrainingPair
+
+
+class TrainingPairSink:
+
+    """
+    TrainingPairSink: base class; buffered and atomic writes of formatted TrainingPairs
+    """
+
+    def __init__(self, filename : str, flush_size : int = 10000, fields : Sequence[str] = ()):
+        """
+        :param filename: output file; compressed with gzip if the name ends with .gz
+
+        :param flush_size: number of rows formatted in memory before they are written to disk
+
+        :param fields: optional; additional fields of the TrainingPair to write after input and target, e.g ["locale"]
+        """
+
+        if flush_size <= 0:
+            raise ValueError(f"flush_size must be positive; got {flush_size}")
+
+        for field in fields:
+            if field not in TrainingPair._fields or field in ("input", "output"):
+                raise ValueError(f"Unknown field '{field}'; possible values are locale, aux")
+
+        self.filename = filename
+        self.flush_size = flush_size
+        self.fields = tuple(fields)
+        self.compress = filename.endswith(".gz")
+
+        # NOTE: the temporary file is in the same directory, so that the final rename is atomic
+        handle, self.tmp_filename = mkstemp(prefix=f".{basename(filename)}.", suffix=".tmp", dir=dirname(abspath(filename)))
+        self.raw_file = os.fdopen(handle, "wb")
+
+        # NOTE: the original filename is stored in the gzip header, not the name of the temporary file
+        self.file = gzip.GzipFile(filename=basename(filename), mode="wb", fileobj=self.raw_file) if self.compress else self.raw_file
+
+        self.buffer = []
+        self.num_rows = 0
+        self.closed = False
+
+    def __enter__(self) -> "TrainingPairSink":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def format(self, training_pair : TrainingPair) -> str:
+        """
+        format: format a TrainingPair as a line of text, including the new line character
+        """
+        raise NotImplementedError
+
+    def write(self, training_pair : TrainingPair, dt : datetime = None):
+        """
+        write: write a TrainingPair; rows are written to disk every flush_size rows
+
+        :param training_pair: TrainingPair
+
+        :param dt: optional; the underlying datetime (not used by the text formats)
+        """
+        self.buffer.append(self.format(training_pair))
+        self.num_rows += 1
+
+        if len(self.buffer) >= self.flush_size:
+            self.flush()
+
+    def write_many(self, results : Iterable[Tuple[TrainingPair, datetime]]):
+        """
+        write_many: write the output of a generator, i.e 2-tuples (TrainingPair, datetime)
+        """
+        for training_pair, dt in results:
+            self.write(training_pair, dt)
+
+    def write_columns(self, inputs : Sequence[str], targets : Sequence[str]):
+        """
+        write_columns: write rows given as columns, e.g NumPy arrays of strings from numpy.datetime_as_string()
+
+        the additional fields (locale, aux) are None
+
+        :param inputs: input strings
+
+        :param targets: target strings, same length as inputs
+        """
+        if len(inputs) != len(targets):
+            raise ValueError(f"inputs and targets have different lengths: {len(inputs)} and {len(targets)}")
+
+        for input_str, target in zip(inputs, targets):
+            self.write(TrainingPair(input=column_string(input_str), output=column_string(target), locale=None, aux=None))
+
+    def write_bytes(self, data : bytes, num_rows : int):
+        """
+        write_bytes: write rows that are already formatted and encoded, after the buffered rows
+        """
+        self.flush()
+        self.file.write(data)
+        self.num_rows += num_rows
+
+    def flush(self):
+        """
+        flush: write the buffered rows to disk
+        """
+        if len(self.buffer) > 0:
+            self.file.write("".join(self.buffer).encode("utf-8"))
+            self.buffer = []
+
+    def close(self):
+        """
+        close: write the remaining rows and move the temporary file to the output file
+        """
+        if self.closed:
+            return
+
+        self.flush()
+
+        if self.compress:
+            self.file.close()
+        self.raw_file.close()
+
+        # NOTE: mkstemp() creates the file readable by the owner only; use the default permissions instead
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(self.tmp_filename, 0o666 & ~umask)
+
+        os.replace(self.tmp_filename, self.filename)
+        self.closed = True
+
+    def abort(self):
+        """
+        abort: discard the rows written so far; the output file is left untouched
+        """
+        if self.closed:
+            return
+
+        if self.compress:
+            self.file.close()
+        self.raw_file.close()
+
+        os.remove(self.tmp_filename)
+        self.closed = True
+
+    def field_values(self, training_pair : TrainingPair) -> List[Any]:
+        return [getattr(training_pair, field) for field in self.fields]
+
+
+def fixed_width_lines(columns : Sequence[Sequence[str]], delimiters : Sequence[bytes], escaped : bytes) -> Optional[bytes]:
+    """
+    fixed_width_lines: build lines delimiters[0] + columns[0][i] + delimiters[1] + ... + columns[-1][i] + delimiters[-1]
+    in one shot, as a (rows x line width) byte matrix
+
+    :param columns: columns of strings; each column is converted to a NumPy array of bytes
+
+    :param delimiters: len(columns) + 1 byte strings
+
+    :param escaped: characters that would have to be escaped in a value, e.g b'"\\'; control characters always are
+
+    :return: the encoded lines; None if a column is not made of ASCII strings of the same length without characters to escape
+        (the rows then have to be formatted one by one)
+    """
+
+    encoded_columns = []
+    for column in columns:
+        values = np.asarray(column)
+        if values.dtype.kind not in "US" or len(values) == 0:
+            return None
+
+        if values.dtype.kind == "U":
+            # NOTE: the dtype can be wider than the strings, e.g numpy.datetime_as_string() returns <U38 for 19 characters
+            lengths = np.char.str_len(values)
+            width = int(lengths[0])
+            if width == 0 or (lengths != width).any():
+                return None
+
+            try:
+                values = values.astype(f"S{width}")
+            except UnicodeEncodeError:
+                return None
+
+        # NOTE: shorter byte strings are padded with null bytes, which are rejected below as control characters
+        matrix = np.ascontiguousarray(values).view(np.uint8).reshape(len(values), values.itemsize)
+
+        invalid = (matrix < 0x20) | (matrix >= 0x7f)
+        for character in escaped:
+            invalid |= matrix == character
+
+        if invalid.any():
+            return None
+
+        encoded_columns.append(matrix)
+
+    num_rows = len(encoded_columns[0])
+
+    line_width = sum(len(delimiter) for delimiter in delimiters) + sum(matrix.shape[1] for matrix in encoded_columns)
+    lines = np.empty((num_rows, line_width), dtype=np.uint8)
+
+    position = 0
+    for delimiter, matrix in zip(delimiters, encoded_columns + [None]):
+        lines[:, position : position + len(delimiter)] = np.frombuffer(delimiter, dtype=np.uint8)
+        position += len(delimiter)
+
+        if matrix is not None:
+            lines[:, position : position + matrix.shape[1]] = matrix
+            position += matrix.shape[1]
+
+    return lines.tobytes()
+
+
+def column_string(value : Any) -> str:
+    """
+    column_string: a value of a column of strings (str, bytes or NumPy string) as str
+    """
+    return value.decode("utf-8") if isinstance(value, bytes) else str(value)
+
+
+def target_string(target : Any) -> Any:
+    """
+    target_string: targets are written as strings, e.g 7 => "7"; None is kept as is
+    """
+    return target if target is None or isinstance(target, str) else str(target)
+
+
+class JsonlSink(TrainingPairSink):
+
+    """
+    JsonlSink: one JSON object per line, e.g {"input": "tue 19th#january#6979, 2:08:40", "target": "1"}
+    """
+
+    def format(self, training_pair : TrainingPair) -> str:
+
+        row = { "input" : training_pair.input, "target" : target_string(training_pair.output) }
+
+        for field, value in zip(self.fields, self.field_values(training_pair)):
+            row[field] = value
+
+        return json.dumps(row) + "\n"
+
+    def write_columns(self, inputs : Sequence[str], targets : Sequence[str]):
+        """
+        write_columns: see TrainingPairSink.write_columns; same lines as write()
+        """
+        if len(inputs) != len(targets):
+            raise ValueError(f"inputs and targets have different lengths: {len(inputs)} and {len(targets)}")
+
+        data = None
+        if len(self.fields) == 0 and len(inputs) > 0:
+            # NOTE: same separators as json.dumps()
+            data = fixed_width_lines([inputs, targets], [b'{"input": "', b'", "target": "', b'"}\n'], escaped=b'"\\')
+
+        if data is None:
+            return super().write_columns(inputs, targets)
+
+        self.write_bytes(data, len(inputs))
+
+
+class CsvSink(TrainingPairSink):
+
+    """
+    CsvSink: "input","target" with all fields quoted, e.g "tue 19th#january#6979, 2:08:40","1"
+    """
+
+    def __init__(self, filename : str, flush_size : int = 10000, fields : Sequence[str] = (), header : bool = False):
+        """
+        :param header: if True, the first line is the names of the columns
+        """
+        super().__init__(filename, flush_size=flush_size, fields=fields)
+
+        self.text = StringIO()
+        self.csv_writer = csv.writer(self.text, quoting=csv.QUOTE_ALL, lineterminator="\n")
+
+        if header:
+            self.buffer.append(self.format_row(["input", "target", *self.fields]))
+
+    def format_row(self, row : List[Any]) -> str:
+        self.text.seek(0)
+        self.text.truncate(0)
+        self.csv_writer.writerow(row)
+
+        return self.text.getvalue()
+
+    def format(self, training_pair : TrainingPair) -> str:
+        return self.format_row([training_pair.input, target_string(training_pair.output), *self.field_values(training_pair)])
+
+    def write_columns(self, inputs : Sequence[str], targets : Sequence[str]):
+        """
+        write_columns: see TrainingPairSink.write_columns; same lines as write()
+        """
+        if len(inputs) != len(targets):
+            raise ValueError(f"inputs and targets have different lengths: {len(inputs)} and {len(targets)}")
+
+        data = None
+        if len(self.fields) == 0 and len(inputs) > 0:
+            data = fixed_width_lines([inputs, targets], [b'"', b'","', b'"\n'], escaped=b'"')
+
+        if data is None:
+            return super().write_columns(inputs, targets)
+
+        self.write_bytes(data, len(inputs))
+
+
+def import_pyarrow():
+    """
+    import_pyarrow: pyarrow is an optional dependency, only needed for Parquet and Arrow files
+    """
+    try:
+        import pyarrow
+    except ImportError as e:
+        raise ImportError("pyarrow is required to write Parquet and Arrow files: pip3 install pyarrow") from e
+
+    return pyarrow
+
+
+class ArrowSink(TrainingPairSink):
+
+    """
+    ArrowSink: columnar output, written in row groups (Parquet) or record batches (Arrow IPC) of flush_size rows
+
+    COLUMNS
+        input, target, locale : string
+        datetime : timestamp[us, UTC], the underlying datetime
+        utc_offset : int32, offset of the local time in seconds, e.g 3600 for +01:00
+        timezone : string, e.g Europe/Paris
+        format_spec : string, from aux["format_spec"], e.g {dd}-{MMM}-{yyyy} {HH}:{mm}
+        visible_<component> : string, from aux["visible_components"], e.g visible_month = "{MMM}"; null if not visible
+    """
+
+    def __init__(self
+                , filename : str
+                , flush_size : int = 10000
+                , components : Iterable[str] = ()
+                , visible_components : Optional[Callable[[str], Dict[str, str]]] = None
+                ):
+        """
+        :param filename: output file, .parquet or .arrow
+
+        :param flush_size: number of rows per row group (Parquet) or record batch (Arrow)
+
+        :param components: names of the components with a visible_<component> column, e.g Generate.possible_components
+            e.g ["year", "month", "day", "hour", "minute", "second", ...]
+
+        :param visible_components: optional; function to find the visible components of a format spec, e.g Generate.get_visible_components
+            only used for rows that have aux["format_spec"] but not aux["visible_components"]
+        """
+
+        if filename.endswith(".gz"):
+            raise ValueError(f"Parquet and Arrow files are compressed internally; remove .gz from '{filename}'")
+
+        pa = import_pyarrow()
+
+        super().__init__(filename, flush_size=flush_size)
+
+        self.components = tuple(components)
+        self.visible_components = visible_components
+
+        self.schema = pa.schema([ ("input", pa.string())
+                                , ("target", pa.string())
+                                , ("locale", pa.string())
+                                , ("datetime", pa.timestamp("us", tz="UTC"))
+                                , ("utc_offset", pa.int32())
+                                , ("timezone", pa.string())
+                                , ("format_spec", pa.string())
+                                ] + [ (f"visible_{component}", pa.string()) for component in self.components ])
+
+        self.columns = { name : [] for name in self.schema.names }
+
+        if filename.endswith(".parquet"):
+            import pyarrow.parquet
+            self.writer = pyarrow.parquet.ParquetWriter(self.raw_file, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(self.raw_file, self.schema)
+
+    def write(self, training_pair : TrainingPair, dt : datetime = None):
+        """
+        write: write a TrainingPair and its underlying datetime
+
+        :param dt: optional; the underlying datetime; naive datetimes are taken as UTC
+        """
+
+        aux = training_pair.aux if isinstance(training_pair.aux, dict) else {}
+
+        format_spec = aux.get("format_spec")
+
+        visible = aux.get("visible_components")
+        if visible is None and format_spec is not None and self.visible_components is not None:
+            visible = self.visible_components(format_spec)
+        if visible is None:
+            visible = {}
+
+        if dt is not None and not isinstance(dt, datetime):
+            # a date or a time
+            dt = datetime.combine(dt, time()) if isinstance(dt, date) else None
+
+        utc_offset = dt.utcoffset() if dt is not None else None
+
+        columns = self.columns
+        columns["input"].append(training_pair.input)
+        columns["target"].append(target_string(training_pair.output))
+        columns["locale"].append(training_pair.locale)
+        columns["datetime"].append(dt.astimezone(timezone.utc) if utc_offset is not None else dt)
+        columns["utc_offset"].append(utc_offset.days * 86400 + utc_offset.seconds if utc_offset is not None else None)
+        columns["timezone"].append(getattr(dt.tzinfo, "zone", None) if dt is not None else None)
+        columns["format_spec"].append(format_spec)
+
+        for component in self.components:
+            columns[f"visible_{component}"].append(visible.get(component))
+
+        self.num_rows += 1
+
+        if len(columns["input"]) >= self.flush_size:
+            self.flush()
+
+    def write_columns(self, inputs : Sequence[str], targets : Sequence[str]):
+        """
+        write_columns: write the columns as one row group (Parquet) or record batch (Arrow); the other columns are null
+        """
+        if len(inputs) != len(targets):
+            raise ValueError(f"inputs and targets have different lengths: {len(inputs)} and {len(targets)}")
+
+        pa = import_pyarrow()
+
+        self.flush()
+
+        arrays = { "input" : pa.array(np.asarray(inputs, dtype=str), type=pa.string())
+                 , "target" : pa.array(np.asarray(targets, dtype=str), type=pa.string())
+                 }
+        batch = pa.RecordBatch.from_arrays([arrays.get(field.name, pa.nulls(len(inputs), type=field.type)) for field in self.schema], schema=self.schema)
+
+        self.write_batch(batch)
+        self.num_rows += len(inputs)
+
+    def write_batch(self, batch):
+        if hasattr(self.writer, "write_batch"):
+            self.writer.write_batch(batch)
+        else:
+            self.writer.write_table(import_pyarrow().Table.from_batches([batch]))
+
+    def flush(self):
+        """
+        flush: write the buffered rows as a row group (Parquet) or record batch (Arrow)
+        """
+        if len(self.columns["input"]) == 0:
+            return
+
+        pa = import_pyarrow()
+
+        # NOTE: naive datetimes are taken as UTC
+        batch = pa.RecordBatch.from_arrays([pa.array(self.columns[field.name], type=field.type) for field in self.schema], schema=self.schema)
+
+        self.write_batch(batch)
+
+        self.columns = { name : [] for name in self.schema.names }
+
+    def close(self):
+        if self.closed:
+            return
+
+        self.flush()
+        self.writer.close()
+
+        super().close()
+
+    def abort(self):
+        if self.closed:
+            return
+
+        try:
+            self.writer.close()
+        finally:
+            super().abort()
+
+
+# sink of each file extension (without .gz)
+SINKS = { ".jsonl" : JsonlSink
+        , ".csv" : CsvSink
+        , ".parquet" : ArrowSink
+        , ".arrow" : ArrowSink
+        }
+
+# columnar formats; see ArrowSink
+COLUMNAR_EXTENSIONS = (".parquet", ".arrow")
+
+
+def is_columnar(filename : str) -> bool:
+    """
+    is_columnar: True if the file is written by an ArrowSink, i.e it has the format spec and component columns
+    """
+    return filename.endswith(COLUMNAR_EXTENSIONS)
+
+
+def open_sink(filename : str, flush_size : int = 10000, **kwargs) -> TrainingPairSink:
+    """
+    open_sink: open a sink for a file; the format is chosen from the extension
+        - .jsonl, .jsonl.gz : JSONL
+        - .csv, .csv.gz : CSV
+        - .parquet, .arrow : columnar; see ArrowSink
+
+    :param filename: output file
+
+    :param flush_size: see TrainingPairSink
+
+    :param kwargs: optional; other parameters of the sink, e.g header=True for CSV, components for Parquet
+
+    :return: TrainingPairSink, to be closed (or used in a with statement)
+    """
+    name = filename[:-len(".gz")] if filename.endswith(".gz") else filename
+
+    for extension, sink_class in SINKS.items():
+        if name.endswith(extension):
+            return sink_class(filename, flush_size=flush_size, **kwargs)
+
+    raise ValueError(f"Unknown output format for '{filename}'; possible extensions are {', '.join(SINKS)} (optionally followed by .gz)")